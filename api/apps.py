@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        # Register signal receivers that keep in-memory indexes in sync.
+        from . import conditional, geo, menu_snapshot, places, search  # noqa: F401
@@ -0,0 +1,148 @@
+"""
+Conditional GET for catalog and reference endpoints.
+
+Mobile clients re-fetch restaurants, categories, products, countries,
+cities, venue categories, advertisements and languages on every app resume,
+and those rarely change. Each of them has a version counter in the shared
+cache, bumped after commit whenever a model its responses are built from
+is saved or deleted. ConditionalGetMixin derives the ETag of a list or
+retrieve from those counters and the request, so an unchanged resource is
+answered with 304 Not Modified from one cache read, before the list query
+runs (a retrieve still looks its object up, so only existing, visible
+objects get a 304). There is no Last-Modified: whole-second dates miss
+changes made in the same second as the client's fetch, and cannot cover
+the URL and role the way the ETag does.
+
+Changes made with QuerySet.update() or raw SQL send no signals; call
+bump_catalog_versions() after them.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework.response import Response
+
+from accounts.models import User
+
+from .models import (
+    Advertisement, Category, CategoryTranslation, City, Country, EntertainmentVenue, Language, Product,
+    ProductTranslation, Restaurant, VenueCategory,
+)
+
+# Catalog resource -> the models its responses are serialized from.
+CATALOG_DEPENDENCIES = {
+    'restaurants': (Restaurant, Product, Country, City),
+    'categories': (Category, CategoryTranslation, Product, Language),
+    'products': (Product, ProductTranslation, Restaurant, Category, Language),
+    'countries': (Country,),
+    'cities': (City, Country),
+    'venue_categories': (VenueCategory, EntertainmentVenue),
+    'advertisements': (Advertisement,),
+    'languages': (Language,),
+}
+
+
+def _version_key(resource):
+    return f"catalog_version:{resource}"
+
+
+def bump_catalog_versions(*resources):
+    """Mark catalog resources as changed, invalidating clients' copies."""
+    for resource in resources:
+        try:
+            cache.incr(_version_key(resource))
+        except ValueError:
+            # Start from the clock so a counter lost to eviction never comes
+            # back at a value a client already holds.
+            cache.set(_version_key(resource), int(time.time() * 1000), None)
+
+
+def catalog_versions(resources):
+    """The version counters of catalog resources, in `resources` order."""
+    keys = [_version_key(resource) for resource in resources]
+    cached = cache.get_many(keys)
+    missing = [resource for resource in resources if _version_key(resource) not in cached]
+    if missing:
+        bump_catalog_versions(*missing)
+        cached = cache.get_many(keys)
+    return [cached.get(key) for key in keys]
+
+
+class ConditionalGetMixin:
+    """
+    ETag support for list and retrieve of a catalog viewset.
+
+    `conditional_resources` names the CATALOG_DEPENDENCIES entries the
+    responses depend on. The ETag also covers the full URL (filters, paging,
+    ?lang=) and the renderer, so it only matches the exact response the
+    client holds. Viewsets whose responses differ by the user's role (admins
+    also see inactive rows) set `conditional_per_role` to cover the role
+    too; the others are the same for everyone. Other read actions can opt
+    in by returning self.conditional_response(request, handler).
+    """
+    conditional_resources = ()
+    conditional_per_role = False
+
+    def get_conditional_etag(self, request):
+        versions = catalog_versions(self.conditional_resources)
+        parts = [
+            *map(str, versions),
+            request.build_absolute_uri(),
+            request.accepted_renderer.format,
+        ]
+        if self.conditional_per_role:
+            user = request.user
+            role = getattr(user, 'role', None) if user.is_authenticated else None
+            parts.append(role or '')
+        return f'"{hashlib.sha1("|".join(parts).encode()).hexdigest()}"'
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        etag = self.get_conditional_etag(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            # Clients keep their copy but must revalidate before using it.
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Look the object up first: a missing or hidden one is a 404, never a
+        # 304, even for If-None-Match: *.
+        instance = self.get_object()
+
+        def serialize(request, *args, **kwargs):
+            return Response(self.get_serializer(instance).data)
+
+        return self.conditional_response(request, serialize, *args, **kwargs)
+
+
+def _resources_depending_on(model):
+    return [resource for resource, models in CATALOG_DEPENDENCIES.items() if model in models]
+
+
+def _catalog_model_changed(sender, **kwargs):
+    resources = _resources_depending_on(sender)
+    transaction.on_commit(lambda: bump_catalog_versions(*resources))
+
+
+for _model in {model for models in CATALOG_DEPENDENCIES.values() for model in models}:
+    post_save.connect(_catalog_model_changed, sender=_model, dispatch_uid=f'catalog_version_{_model.__name__}')
+    post_delete.connect(_catalog_model_changed, sender=_model, dispatch_uid=f'catalog_version_{_model.__name__}')
+
+
+@receiver(post_save, sender=User)
+def _restaurant_owner_changed(sender, instance, update_fields=None, **kwargs):
+    # Restaurants show their owner's username; logins only save last_login.
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    if Restaurant.objects.filter(user_id=instance.pk).exists():
+        transaction.on_commit(lambda: bump_catalog_versions('restaurants'))
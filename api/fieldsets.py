@@ -0,0 +1,92 @@
+"""
+Sparse fieldsets for read endpoints.
+
+?fields=a,b renders only those fields, ?omit=a,b drops them and ?expand=a,b
+adds fields a serializer leaves out by default (Meta.expandable_fields),
+such as the items of an order on the slim order list. SparseFieldsetMixin
+applies them to the top-level serializer of a GET request.
+
+Viewsets ask rendered_fields() which fields a response will have, so they
+skip the joins, prefetches and annotations nobody asked for, and
+only_rendered_columns() loads just the columns those fields read.
+SerializerMethodFields declare their columns in Meta.field_sources; a
+serializer rendering one that does not is loaded in full.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _field_list(request, param):
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def requested_fieldset(request):
+    """(fields, omit, expand) of a read request; fields is None when not restricted."""
+    if request is None or request.method not in SAFE_METHODS:
+        return None, set(), set()
+    return (
+        _field_list(request, 'fields'),
+        _field_list(request, 'omit') or set(),
+        _field_list(request, 'expand') or set(),
+    )
+
+
+class SparseFieldsetMixin:
+    """
+    ModelSerializer mixin for ?fields= / ?omit= / ?expand=. Serializers
+    nested in another one always render in full.
+    """
+
+    def _is_top_level(self):
+        parent = self.parent
+        return parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+
+    def get_field_names(self, declared_fields, info):
+        names = list(super().get_field_names(declared_fields, info))
+        if not self._is_top_level():
+            return names
+
+        fields, omit, expand = requested_fieldset(self.context.get('request'))
+        wanted = expand | (fields or set())
+        names += [
+            name for name in getattr(self.Meta, 'expandable_fields', ())
+            if name in wanted and name not in names
+        ]
+        if fields is not None:
+            names = [name for name in names if name in fields]
+        return [name for name in names if name not in omit]
+
+
+def rendered_fields(serializer_class, request):
+    """Names of the fields serializer_class renders for this request."""
+    return set(serializer_class(context={'request': request}).fields)
+
+
+def only_rendered_columns(queryset, serializer_class, request):
+    """queryset.only() the columns serializer_class reads for this request."""
+    serializer = serializer_class(context={'request': request})
+    model = queryset.model
+    field_sources = getattr(serializer.Meta, 'field_sources', {})
+
+    select_related = queryset.query.select_related
+    if select_related is True:
+        return queryset
+    columns = {model._meta.pk.name, *(select_related or {})}
+    for name, field in serializer.fields.items():
+        if name in field_sources:
+            columns.update(field_sources[name])
+            continue
+        if field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+            return queryset
+        try:
+            model_field = model._meta.get_field(field.source.split('.')[0])
+        except FieldDoesNotExist:
+            return queryset
+        # Reverse relations are loaded by their own query.
+        if model_field.concrete:
+            columns.add(model_field.name)
+    return queryset.only(*columns)
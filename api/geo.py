@@ -0,0 +1,218 @@
+"""
+Spatial helpers for location-based listings.
+
+Restaurants are bucketed into a fixed-size lat/lng grid kept in memory per
+worker, so a "nearby" lookup only touches the handful of cells that overlap
+the search circle instead of scanning the restaurants table.
+"""
+import logging
+import math
+
+import numpy as np
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .local_index import LocalIndex, indexed_fields_changed, track_indexed_fields
+from .models import Restaurant
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.195
+
+NEARBY_GRID_CELL_DEGREES = float(getattr(settings, 'NEARBY_GRID_CELL_DEGREES', 0.05))
+NEARBY_DEFAULT_RADIUS_KM = float(getattr(settings, 'NEARBY_DEFAULT_RADIUS_KM', 10))
+NEARBY_MAX_RADIUS_KM = float(getattr(settings, 'NEARBY_MAX_RADIUS_KM', 50))
+NEARBY_INDEX_MAX_AGE_SECONDS = int(getattr(settings, 'NEARBY_INDEX_MAX_AGE_SECONDS', 300))
+
+RESTAURANT_INDEX_VERSION_CACHE_KEY = 'geo:restaurant_index_version'
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two float coordinates."""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    dlat = lat2_rad - lat1_rad
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_km_array(lat, lon, lats, lons):
+    """Vectorized great-circle distance in km from one point to arrays of points."""
+    lat_rad = np.radians(lat)
+    lats_rad = np.radians(lats)
+    dlat = lats_rad - lat_rad
+    dlon = np.radians(lons - lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat_rad) * np.cos(lats_rad) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def rank_within_radius(lat, lon, candidates, radius_km):
+    """
+    Exact radius cut over prefiltered candidates.
+
+    candidates is an iterable of (pk, latitude, longitude) rows, typically a
+    bounding-box values_list(). Returns [(pk, distance_km)], nearest first.
+    """
+    rows = list(candidates)
+    if not rows:
+        return []
+
+    pks = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    lats = np.fromiter((float(row[1]) for row in rows), dtype=np.float64, count=len(rows))
+    lons = np.fromiter((float(row[2]) for row in rows), dtype=np.float64, count=len(rows))
+
+    distances = haversine_km_array(lat, lon, lats, lons)
+    inside = distances <= radius_km
+    pks = pks[inside]
+    distances = distances[inside]
+
+    order = np.lexsort((pks, distances))
+    return [(int(pks[i]), float(distances[i])) for i in order]
+
+
+def bounding_box(lat, lon, radius_km):
+    """Return (min_lat, max_lat, min_lon, max_lon) enclosing the search circle."""
+    lat_delta = radius_km / KM_PER_DEGREE_LAT
+    # Clamp cos() so the box stays finite close to the poles.
+    lon_delta = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
+
+
+class GridIndex:
+    """
+    Points bucketed by fixed-size lat/lng cells.
+
+    Cells are keyed by (row, col) = floor(coord / cell_degrees). A radius query
+    visits every cell overlapping the bounding box of the circle, then keeps
+    the points whose exact haversine distance is within the radius.
+    """
+
+    def __init__(self, cell_degrees=NEARBY_GRID_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._cells = {}
+        self._locations = {}
+
+    def __len__(self):
+        return len(self._locations)
+
+    def _cell_for(self, lat, lon):
+        return (
+            int(math.floor(lat / self.cell_degrees)),
+            int(math.floor(lon / self.cell_degrees)),
+        )
+
+    def add(self, pk, lat, lon):
+        self.remove(pk)
+        cell = self._cell_for(lat, lon)
+        self._cells.setdefault(cell, {})[pk] = (lat, lon)
+        self._locations[pk] = cell
+
+    def remove(self, pk):
+        cell = self._locations.pop(pk, None)
+        if cell is None:
+            return
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(pk, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def _candidate_buckets(self, lat, lon, radius_km):
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+        row_min, col_min = self._cell_for(min_lat, min_lon)
+        row_max, col_max = self._cell_for(max_lat, max_lon)
+        cell_span = (row_max - row_min + 1) * (col_max - col_min + 1)
+
+        # Very large radii cover more cells than are populated; walk the
+        # populated cells instead of the empty grid.
+        if cell_span > len(self._cells):
+            for (row, col), bucket in self._cells.items():
+                if row_min <= row <= row_max and col_min <= col <= col_max:
+                    yield bucket
+            return
+
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                bucket = self._cells.get((row, col))
+                if bucket:
+                    yield bucket
+
+    def query(self, lat, lon, radius_km):
+        """Return [(pk, distance_km)] within radius_km, nearest first."""
+        matches = []
+        for bucket in self._candidate_buckets(lat, lon, radius_km):
+            for pk, (point_lat, point_lon) in bucket.items():
+                distance = haversine_km(lat, lon, point_lat, point_lon)
+                if distance <= radius_km:
+                    matches.append((pk, distance))
+        matches.sort(key=lambda item: (item[1], item[0]))
+        return matches
+
+
+class RestaurantNearbyIndex(LocalIndex):
+    """
+    Per-process grid index of open restaurants with coordinates.
+
+    The index is rebuilt lazily when the shared version counter moves (another
+    worker changed a restaurant's location or status) or when it is older
+    than NEARBY_INDEX_MAX_AGE_SECONDS, which bounds staleness when no shared
+    cache is configured.
+    """
+    version_cache_key = RESTAURANT_INDEX_VERSION_CACHE_KEY
+    max_age_seconds = NEARBY_INDEX_MAX_AGE_SECONDS
+
+    def build(self):
+        index = GridIndex()
+        rows = Restaurant.objects.filter(
+            status='open',
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).values_list('restaurant_id', 'latitude', 'longitude')
+        for restaurant_id, latitude, longitude in rows.iterator():
+            index.add(restaurant_id, float(latitude), float(longitude))
+        logger.debug("Built restaurant nearby index with %s entries", len(index))
+        return index
+
+    def query(self, lat, lon, radius_km):
+        index, _ = self.get()
+        return index.query(lat, lon, radius_km)
+
+    def reflect(self, restaurant, deleted=False):
+        """Reflect a single restaurant change in this worker's index."""
+        def update(index):
+            if (
+                deleted
+                or restaurant.status != 'open'
+                or restaurant.latitude is None
+                or restaurant.longitude is None
+            ):
+                index.remove(restaurant.restaurant_id)
+            else:
+                index.add(
+                    restaurant.restaurant_id,
+                    float(restaurant.latitude),
+                    float(restaurant.longitude),
+                )
+
+        self.apply(update)
+
+
+restaurant_nearby_index = RestaurantNearbyIndex()
+
+# The restaurant fields the nearby index reads.
+NEARBY_INDEX_FIELDS = ('status', 'latitude', 'longitude')
+track_indexed_fields(Restaurant, NEARBY_INDEX_FIELDS)
+
+
+@receiver(post_save, sender=Restaurant)
+def update_restaurant_nearby_index_on_save(sender, instance, **kwargs):
+    if indexed_fields_changed(instance, NEARBY_INDEX_FIELDS):
+        restaurant_nearby_index.reflect(instance)
+
+
+@receiver(post_delete, sender=Restaurant)
+def update_restaurant_nearby_index_on_delete(sender, instance, **kwargs):
+    restaurant_nearby_index.reflect(instance, deleted=True)
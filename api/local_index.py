@@ -0,0 +1,159 @@
+"""
+Shared plumbing for the per-worker in-memory indexes.
+
+Each index has a version counter in the shared cache. A change bumps it with
+bump_index_version(); LocalIndex keeps a worker's copy and rebuilds it
+lazily when the counter has moved or the copy is older than its max age,
+while the worker that made the change patches its own copy in place.
+
+Restaurants and venues are saved much more often than the fields the
+indexes read change (every review recalculates a restaurant's rating), so
+track_indexed_fields() remembers those fields as an instance is loaded and
+saved, and receivers ask indexed_fields_changed() before bumping anything.
+No query is made for it: a save either names its update_fields or is
+compared with the values the instance was loaded with, so a save writing
+back values another process changed since the load goes unnoticed until
+the indexes reach their max age.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models.signals import post_init, post_save, pre_save
+
+
+def index_version(cache_key):
+    return cache.get(cache_key, 0)
+
+
+def bump_index_version(cache_key):
+    """Move a shared index version counter. Returns the new version."""
+    try:
+        return cache.incr(cache_key)
+    except ValueError:
+        cache.set(cache_key, 1, None)
+        return 1
+
+
+class LocalIndex:
+    """
+    Per-process index rebuilt from the database when stale.
+
+    Subclasses set version_cache_key and max_age_seconds and implement
+    build(), which returns the index data. get() returns (data, version),
+    the version being the one the data was built for.
+    """
+    version_cache_key = None
+    max_age_seconds = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (data, version, built_at), replaced as a whole.
+        self._state = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def is_stale(self, version, built_version, age):
+        return version != built_version or age > self.max_age_seconds
+
+    def _needs_build(self, version):
+        state = self._state
+        return state is None or self.is_stale(version, state[1], time.monotonic() - state[2])
+
+    def get(self, version=None):
+        if version is None:
+            version = index_version(self.version_cache_key)
+        if self._needs_build(version):
+            with self._lock:
+                if self._needs_build(version):
+                    self._state = (self.build(), version, time.monotonic())
+        data, built_version, _ = self._state
+        return data, built_version
+
+    def apply(self, update):
+        """
+        Bump the shared version for a change made by this worker and apply
+        it to the local copy with update(data), if there is one.
+        """
+        version = bump_index_version(self.version_cache_key)
+        with self._lock:
+            if self._state is None:
+                return
+            data, built_version, built_at = self._state
+            update(data)
+            # Only skip ahead if no other worker's change came in between.
+            if version == built_version + 1:
+                self._state = (data, version, built_at)
+
+
+_tracked_fields = {}
+
+
+def _stored_values(instance, fields):
+    # Deferred fields are left out rather than loaded.
+    loaded = instance.__dict__
+    return {field: loaded[field] for field in fields if field in loaded}
+
+
+def _remember_loaded_fields(sender, instance, **kwargs):
+    instance._indexed_stored = _stored_values(instance, _tracked_fields[sender])
+
+
+def _remember_indexed_fields(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._indexed_previous = None
+    instance._indexed_update_fields = None
+    if not raw and not instance._state.adding:
+        instance._indexed_previous = dict(getattr(instance, '_indexed_stored', {}))
+        if update_fields is not None:
+            instance._indexed_update_fields = frozenset(update_fields)
+
+
+def _remember_saved_fields(sender, instance, update_fields=None, **kwargs):
+    fields = _tracked_fields[sender]
+    if update_fields is not None:
+        fields = {field for field in fields if _field_names(sender, field) & update_fields}
+    stored = getattr(instance, '_indexed_stored', {})
+    stored.update(_stored_values(instance, fields))
+    instance._indexed_stored = stored
+
+
+def _field_names(model, field):
+    # update_fields may name a foreign key by its name or its attname.
+    model_field = model._meta.get_field(field)
+    return {model_field.name, model_field.attname}
+
+
+def track_indexed_fields(model, fields):
+    """Remember `fields` (attnames) of model instances as they are loaded and saved."""
+    _tracked_fields.setdefault(model, set()).update(fields)
+    uid = f'indexed_fields_{model.__name__}'
+    post_init.connect(_remember_loaded_fields, sender=model, dispatch_uid=uid)
+    pre_save.connect(_remember_indexed_fields, sender=model, dispatch_uid=uid)
+    post_save.connect(_remember_saved_fields, sender=model, dispatch_uid=uid)
+
+
+def indexed_previous_value(instance, field, default=None):
+    """The value `field` had before the save that just happened, if known."""
+    previous = getattr(instance, '_indexed_previous', None) or {}
+    return previous.get(field, default)
+
+
+def indexed_fields_changed(instance, fields):
+    """
+    Whether the save that just happened changed any of `fields`. True for
+    creates and whenever a field's previous value is not known (it was
+    deferred, or the instance was not loaded from the database).
+    """
+    previous = getattr(instance, '_indexed_previous', None)
+    if previous is None:
+        return True
+    update_fields = instance._indexed_update_fields
+    model = type(instance)
+    for field in fields:
+        if update_fields is not None and not _field_names(model, field) & update_fields:
+            continue
+        if field not in previous or previous[field] != getattr(instance, field):
+            return True
+    return False
+
@@ -0,0 +1,418 @@
+import json
+import math
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+
+STUB_DETOUR_FACTOR = 1.3
+BENCHMARK_CENTER = (17.9667, 102.6)
+
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    lat1_rad, lat2_rad = math.radians(lat1), math.radians(lat2)
+    dlat = lat2_rad - lat1_rad
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+    return 2 * 6371000 * math.asin(min(1.0, math.sqrt(a)))
+
+
+class StubProviderServer:
+    """
+    Local stand-in for OSRM (/route, /table) and Nominatim (/reverse,
+    /search) with configurable latency and a fraction of 429 responses.
+    Road distance is haversine x STUB_DETOUR_FACTOR.
+    """
+
+    def __init__(self, osrm_latency_ms=50, nominatim_latency_ms=150, rate_limit_ratio=0.0, seed=1):
+        self.osrm_latency_ms = osrm_latency_ms
+        self.nominatim_latency_ms = nominatim_latency_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {}
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = {}
+
+    def _count(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def _rate_limited(self):
+        with self._lock:
+            return self._random.random() < self.rate_limit_ratio
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Buffer each response into one write so Nagle/delayed-ACK does
+            # not add ~40 ms to every keep-alive response.
+            wbufsize = -1
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status_code, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                # urlsplit, not urlparse: OSRM paths use ';' between coordinates.
+                url = urlsplit(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                parts = url.path.strip('/').split('/')
+
+                if parts[0] in ('route', 'table'):
+                    stub._count(parts[0])
+                    time.sleep(stub.osrm_latency_ms / 1000.0)
+                    points = [
+                        tuple(float(value) for value in pair.split(','))
+                        for pair in parts[-1].split(';')
+                    ]
+                    if parts[0] == 'route':
+                        (lon1, lat1), (lon2, lat2) = points[0], points[-1]
+                        meters = _haversine_m(lat1, lon1, lat2, lon2) * STUB_DETOUR_FACTOR
+                        return self._send(200, {'code': 'Ok', 'routes': [{'distance': meters}]})
+                    sources = [int(i) for i in params.get('sources', '').split(';') if i]
+                    destinations = [int(i) for i in params.get('destinations', '').split(';') if i]
+                    rows = [
+                        [
+                            _haversine_m(points[s][1], points[s][0], points[d][1], points[d][0]) * STUB_DETOUR_FACTOR
+                            for d in destinations
+                        ]
+                        for s in sources
+                    ]
+                    return self._send(200, {'code': 'Ok', 'distances': rows})
+
+                if parts[0] in ('reverse', 'search'):
+                    stub._count(parts[0])
+                    time.sleep(stub.nominatim_latency_ms / 1000.0)
+                    if stub._rate_limited():
+                        return self._send(429, {'error': 'rate limited'}, {'Retry-After': '1'})
+                    if parts[0] == 'reverse':
+                        return self._send(200, {
+                            'display_name': f"Stub street, {params.get('lat')}, {params.get('lon')}",
+                            'lat': params.get('lat'),
+                            'lon': params.get('lon'),
+                            'address': {'road': 'Stub street', 'city': 'Vientiane', 'country': 'Laos'},
+                        })
+                    limit = int(params.get('limit', 5))
+                    return self._send(200, [
+                        {
+                            'display_name': f"{params.get('q')} {i}, Vientiane, Laos",
+                            'lat': f"{BENCHMARK_CENTER[0] + i * 0.001:.7f}",
+                            'lon': f"{BENCHMARK_CENTER[1]:.7f}",
+                            'address': {'city': 'Vientiane', 'country': 'Laos'},
+                        }
+                        for i in range(limit)
+                    ])
+
+                stub._count('unknown')
+                return self._send(404, {'code': 'NotFound'})
+
+        return Handler
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(math.ceil(percent / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark geo/routing code paths (distance, geocoding, fee endpoints, venue nearby) '
+        'against a local OSRM/Nominatim stub, on a throwaway test database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='Concurrent client threads')
+        parser.add_argument('--restaurants', type=int, default=200, help='Seeded restaurants')
+        parser.add_argument('--venues', type=int, default=100, help='Seeded entertainment venues')
+        parser.add_argument('--addresses', type=int, default=50, help='Distinct customer addresses to draw from')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for fixtures and workload')
+        parser.add_argument('--osrm-latency-ms', type=float, default=50, help='Stub OSRM response latency')
+        parser.add_argument('--nominatim-latency-ms', type=float, default=150, help='Stub Nominatim response latency')
+        parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='Fraction of Nominatim calls answered 429')
+        parser.add_argument(
+            '--nominatim-interval',
+            type=float,
+            default=None,
+            help='Override NOMINATIM_MIN_INTERVAL_SECONDS for the run (e.g. 0 to disable pacing)',
+        )
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            dest='scenarios',
+            help='Run only this scenario (repeatable)',
+        )
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        from api import outbound, views
+
+        stub = StubProviderServer(
+            osrm_latency_ms=options['osrm_latency_ms'],
+            nominatim_latency_ms=options['nominatim_latency_ms'],
+            rate_limit_ratio=options['rate_limit_ratio'],
+            seed=options['seed'],
+        ).start()
+
+        saved = {
+            'osrm': outbound.osrm_client.base_url,
+            'nominatim': outbound.nominatim_client.base_url,
+            'interval': views.nominatim_rate_limiter.interval_seconds,
+        }
+        outbound.osrm_client.base_url = stub.base_url
+        outbound.nominatim_client.base_url = stub.base_url
+        if options['nominatim_interval'] is not None:
+            views.nominatim_rate_limiter.interval_seconds = options['nominatim_interval']
+
+        setup_test_environment()
+        old_database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # Keep benchmark keys out of the real shared cache.
+            with override_settings(CACHES={
+                'default': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                    'LOCATION': 'geo-benchmark',
+                },
+            }):
+                results = self._run(stub, options)
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            teardown_test_environment()
+            outbound.osrm_client.base_url = saved['osrm']
+            outbound.nominatim_client.base_url = saved['nominatim']
+            views.nominatim_rate_limiter.interval_seconds = saved['interval']
+            stub.stop()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self._print_table(results)
+
+    def _seed(self, options, rng):
+        from accounts.models import User
+        from api.models import AppSettings, EntertainmentVenue, Restaurant
+
+        def scatter():
+            return (
+                BENCHMARK_CENTER[0] + rng.uniform(-0.08, 0.08),
+                BENCHMARK_CENTER[1] + rng.uniform(-0.08, 0.08),
+            )
+
+        users = User.objects.bulk_create([
+            User(username=f'bench_owner_{i}', email=f'bench_owner_{i}@example.com')
+            for i in range(options['restaurants'])
+        ])
+        restaurants = []
+        for i, user in enumerate(users):
+            lat, lon = scatter()
+            restaurants.append(Restaurant(
+                user=user,
+                restaurant_name=f'Bench Restaurant {i}',
+                address=f'{i} Bench Road',
+                latitude=lat,
+                longitude=lon,
+                status='open',
+            ))
+        Restaurant.objects.bulk_create(restaurants)
+
+        venues = []
+        for i in range(options['venues']):
+            lat, lon = scatter()
+            venues.append(EntertainmentVenue(
+                venue_name=f'Bench Venue {i}',
+                address=f'{i} Venue Road',
+                latitude=lat,
+                longitude=lon,
+                status='open',
+            ))
+        EntertainmentVenue.objects.bulk_create(venues)
+
+        app_settings = AppSettings.get_settings()
+        app_settings.max_delivery_distance = 20
+        app_settings.free_delivery_minimum = 300
+        app_settings.save()
+
+        return (
+            list(Restaurant.objects.values_list('restaurant_id', 'latitude', 'longitude')),
+            [scatter() for _ in range(options['addresses'])],
+        )
+
+    def _scenarios(self, restaurants, addresses):
+        from rest_framework.test import APIClient
+
+        from api.utils import calculate_distance_km
+
+        def distance(rng):
+            restaurant_id, lat, lon = rng.choice(restaurants)
+            address = rng.choice(addresses)
+            calculate_distance_km(lat, lon, address[0], address[1])
+            return 200
+
+        def reverse(rng):
+            lat, lon = rng.choice(addresses)
+            return APIClient().get('/api/geocode/reverse/', {'lat': lat, 'lon': lon}).status_code
+
+        def search(rng):
+            query = rng.choice(['ban', 'bench', 'that luang', 'patuxai', 'market', 'wat'])
+            return APIClient().get('/api/geocode/search/', {'q': query, 'limit': 5}).status_code
+
+        def delivery_fee(rng):
+            restaurant_id, _, _ = rng.choice(restaurants)
+            lat, lon = rng.choice(addresses)
+            return APIClient().post('/api/calculate-delivery-fee/', {
+                'restaurant_id': restaurant_id,
+                'delivery_latitude': lat,
+                'delivery_longitude': lon,
+                'order_subtotal': rng.choice([50, 150, 400]),
+            }, format='json').status_code
+
+        def multi_delivery_fee(rng):
+            picked = rng.sample(restaurants, min(3, len(restaurants)))
+            lat, lon = rng.choice(addresses)
+            return APIClient().post('/api/calculate-multi-restaurant-delivery-fee/', {
+                'restaurant_ids': [restaurant_id for restaurant_id, _, _ in picked],
+                'delivery_latitude': lat,
+                'delivery_longitude': lon,
+            }, format='json').status_code
+
+        def venue_nearby(rng):
+            lat, lon = rng.choice(addresses)
+            return APIClient().get('/api/entertainment-venues/nearby/', {
+                'latitude': lat,
+                'longitude': lon,
+                'radius': 5,
+            }).status_code
+
+        return [
+            ('distance', distance),
+            ('geocode_reverse', reverse),
+            ('geocode_search', search),
+            ('delivery_fee', delivery_fee),
+            ('multi_delivery_fee', multi_delivery_fee),
+            ('venue_nearby', venue_nearby),
+        ]
+
+    def _reset_state(self, stub):
+        from django.core.cache import cache
+
+        from api.outbound import OUTBOUND_CLIENTS
+        from api.route_cache import route_distance_cache
+
+        cache.clear()
+        route_distance_cache.clear_local()
+        route_distance_cache.reset_stats()
+        for client in OUTBOUND_CLIENTS:
+            client.reset_stats()
+            client.breaker.record_success()
+        stub.reset_calls()
+
+    def _run(self, stub, options):
+        from api.models import RouteDistance
+
+        rng = random.Random(options['seed'])
+        restaurants, addresses = self._seed(options, rng)
+        selected = set(options['scenarios'] or [])
+
+        results = []
+        for name, scenario in self._scenarios(restaurants, addresses):
+            if selected and name not in selected:
+                continue
+            RouteDistance.objects.all().delete()
+            self._reset_state(stub)
+
+            # One RNG per request keeps the workload identical across runs
+            # regardless of thread scheduling.
+            seeds = [rng.random() for _ in range(options['requests'])]
+            lock = threading.Lock()
+            timings = []
+            errors = [0]
+
+            def run_one(request_seed):
+                started = time.perf_counter()
+                try:
+                    status_code = scenario(random.Random(request_seed))
+                except Exception:
+                    status_code = 599
+                finally:
+                    close_old_connections()
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                with lock:
+                    timings.append(elapsed_ms)
+                    if status_code >= 400:
+                        errors[0] += 1
+
+            wall_started = time.perf_counter()
+            if options['concurrency'] > 1:
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                    list(executor.map(run_one, seeds))
+            else:
+                for request_seed in seeds:
+                    run_one(request_seed)
+            wall_seconds = time.perf_counter() - wall_started
+
+            timings.sort()
+            results.append({
+                'scenario': name,
+                'requests': len(timings),
+                'errors': errors[0],
+                'p50_ms': round(_percentile(timings, 50), 2),
+                'p95_ms': round(_percentile(timings, 95), 2),
+                'p99_ms': round(_percentile(timings, 99), 2),
+                'mean_ms': round(statistics.fmean(timings), 2),
+                'throughput_rps': round(len(timings) / wall_seconds, 1) if wall_seconds else None,
+                'upstream_calls': dict(sorted(stub.calls.items())),
+            })
+        return results
+
+    def _print_table(self, results):
+        header = f"{'scenario':<20}{'reqs':>6}{'errs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>9}  upstream"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in results:
+            upstream = ', '.join(f'{key}={value}' for key, value in row['upstream_calls'].items()) or '-'
+            self.stdout.write(
+                f"{row['scenario']:<20}{row['requests']:>6}{row['errors']:>6}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+                f"{row['throughput_rps'] or 0:>9}  {upstream}"
+            )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.search import invalidate_memory_search_indexes, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the catalog search index from restaurants, products, categories and their translations'
+
+    def handle(self, *args, **options):
+        written = rebuild_search_index()
+        invalidate_memory_search_indexes()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt: {written} entries'))
@@ -0,0 +1,254 @@
+"""
+Precomputed menu snapshots.
+
+A restaurant's (or category's) menu is every available product with its
+translations. Serializing it on every menu open was the most expensive read
+in the app, so each (scope, id, language) menu is rendered once to JSON,
+both as the flat product list and grouped by category, and stored in the
+shared cache with a strong ETag over its bytes.
+
+Every scope has a version counter in the cache. Product, ProductTranslation,
+Category and Restaurant changes bump the versions of the menus they appear
+in after commit and queue a background rebuild of those menus; a snapshot
+is only served while its version matches the counter, so a menu open costs
+one get_many of the snapshot and its version. Misses are built inline,
+coalesced with a SingleFlight.
+"""
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.renderers import JSONRenderer
+
+from .local_index import indexed_fields_changed, indexed_previous_value, track_indexed_fields
+from .models import Category, Language, Product, ProductTranslation, Restaurant
+from .serializers import ProductSerializer
+from .singleflight import SingleFlight
+from .translations import prefetch_language_translations
+
+logger = logging.getLogger(__name__)
+
+MENU_SNAPSHOT_CACHE_SECONDS = int(getattr(settings, 'MENU_SNAPSHOT_CACHE_SECONDS', 86400))
+MENU_SNAPSHOT_WORKERS = int(getattr(settings, 'MENU_SNAPSHOT_WORKERS', 2))
+
+ACTIVE_LANGUAGES_CACHE_KEY = 'menu:active_languages'
+
+SCOPE_RESTAURANT = 'restaurant'
+SCOPE_CATEGORY = 'category'
+
+# ?group= values and the snapshot entry each one serves.
+MENU_SHAPES = {'': 'products', 'category': 'categories'}
+
+menu_snapshot_flight = SingleFlight('menu_snapshot')
+
+_rebuild_executor = ThreadPoolExecutor(
+    max_workers=MENU_SNAPSHOT_WORKERS,
+    thread_name_prefix='menu-snapshot',
+)
+_pending_lock = threading.Lock()
+_pending_rebuilds = set()
+
+
+def _version_key(scope, scope_id):
+    return f"menu_version:{scope}:{scope_id}"
+
+
+def _snapshot_key(scope, scope_id, language):
+    return f"menu:{scope}:{scope_id}:{language}"
+
+
+def _fresh_version():
+    # Counters start from the clock so a counter lost to eviction never
+    # comes back at a value an old snapshot was built for.
+    return int(time.time() * 1000)
+
+
+def menu_version(scope, scope_id):
+    version = cache.get(_version_key(scope, scope_id))
+    if version is None:
+        cache.add(_version_key(scope, scope_id), _fresh_version(), None)
+        version = cache.get(_version_key(scope, scope_id))
+    return version
+
+
+def _bump_version(scope, scope_id):
+    try:
+        cache.incr(_version_key(scope, scope_id))
+    except ValueError:
+        cache.set(_version_key(scope, scope_id), _fresh_version(), None)
+
+
+def active_language_codes():
+    """Codes of the active languages, the only ones menus are built for."""
+    codes = cache.get(ACTIVE_LANGUAGES_CACHE_KEY)
+    if codes is None:
+        codes = frozenset(Language.objects.filter(is_active=True).values_list('code', flat=True))
+        cache.set(ACTIVE_LANGUAGES_CACHE_KEY, codes, MENU_SNAPSHOT_CACHE_SECONDS)
+    return codes
+
+
+def _render(data):
+    content = JSONRenderer().render(data)
+    return {'etag': f'"{hashlib.sha1(content).hexdigest()}"', 'content': content}
+
+
+def build_menu_snapshot(scope, scope_id, language=''):
+    """
+    Render and cache the menu of one restaurant or category in `language`
+    ('' for all translations). Returns the snapshot, or None when the
+    restaurant or category does not exist.
+    """
+    version = menu_version(scope, scope_id)
+    if scope == SCOPE_RESTAURANT:
+        owner = Restaurant.objects.filter(restaurant_id=scope_id)
+        products = Product.objects.filter(restaurant_id=scope_id)
+    else:
+        owner = Category.objects.filter(category_id=scope_id)
+        products = Product.objects.filter(category_id=scope_id)
+    if not owner.exists():
+        return None
+
+    products = prefetch_language_translations(
+        products.filter(is_available=True).select_related('restaurant', 'category').order_by('product_id'),
+        language,
+    )
+    # No request: image URLs are made absolute with BASE_URL.
+    items = ProductSerializer(products, many=True, context={'lang': language}).data
+
+    groups = {}
+    order = {}
+    for product, item in zip(products, items):
+        category = product.category
+        if category.category_id not in groups:
+            order[category.category_id] = (category.sort_order, category.category_name)
+            groups[category.category_id] = {
+                'category_id': category.category_id,
+                'category_name': category.category_name,
+                'products': [],
+            }
+        groups[category.category_id]['products'].append(item)
+    grouped = [groups[category_id] for category_id in sorted(groups, key=order.get)]
+
+    snapshot = {
+        'version': version,
+        'products': _render(items),
+        'categories': _render(grouped),
+    }
+    cache.set(_snapshot_key(scope, scope_id, language), snapshot, MENU_SNAPSHOT_CACHE_SECONDS)
+    return snapshot
+
+
+def get_menu_snapshot(scope, scope_id, language=''):
+    """
+    The current snapshot of a menu, built on a miss. None when the
+    restaurant or category does not exist. A language that is not active
+    gets the menu with all translations, so arbitrary ?lang= values cannot
+    fill the cache with snapshots.
+    """
+    if language not in active_language_codes():
+        language = ''
+    version_key = _version_key(scope, scope_id)
+    snapshot_key = _snapshot_key(scope, scope_id, language)
+
+    def lookup():
+        cached = cache.get_many([version_key, snapshot_key])
+        snapshot = cached.get(snapshot_key)
+        if snapshot is not None and snapshot['version'] == cached.get(version_key):
+            return snapshot
+        return None
+
+    snapshot = lookup()
+    if snapshot is None:
+        snapshot = menu_snapshot_flight.do(
+            snapshot_key, lambda: build_menu_snapshot(scope, scope_id, language), lookup,
+        )
+    return snapshot
+
+
+def _rebuild(scope, scope_id):
+    with _pending_lock:
+        _pending_rebuilds.discard((scope, scope_id))
+    try:
+        languages = [''] + sorted(active_language_codes())
+        for language in languages:
+            build_menu_snapshot(scope, scope_id, language)
+    except Exception:
+        logger.exception("Menu snapshot rebuild failed for %s %s", scope, scope_id)
+    finally:
+        close_old_connections()
+
+
+def invalidate_menus(restaurant_ids=(), category_ids=()):
+    """Bump the given menus' versions and rebuild them in the background."""
+    scopes = [(SCOPE_RESTAURANT, pk) for pk in set(restaurant_ids) if pk is not None]
+    scopes += [(SCOPE_CATEGORY, pk) for pk in set(category_ids) if pk is not None]
+    for scope, scope_id in scopes:
+        _bump_version(scope, scope_id)
+        with _pending_lock:
+            if (scope, scope_id) in _pending_rebuilds:
+                continue
+            _pending_rebuilds.add((scope, scope_id))
+        _rebuild_executor.submit(_rebuild, scope, scope_id)
+
+
+def _invalidate_on_commit(restaurant_ids=(), category_ids=()):
+    restaurant_ids, category_ids = set(restaurant_ids), set(category_ids)
+    transaction.on_commit(lambda: invalidate_menus(restaurant_ids, category_ids))
+
+
+# A product moved to another restaurant or category leaves its old menus too.
+track_indexed_fields(Product, ('restaurant_id', 'category_id'))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def _product_menus_changed(sender, instance, signal, **kwargs):
+    restaurant_ids = {instance.restaurant_id}
+    category_ids = {instance.category_id}
+    if signal is post_save:
+        restaurant_ids.add(indexed_previous_value(instance, 'restaurant_id'))
+        category_ids.add(indexed_previous_value(instance, 'category_id'))
+    _invalidate_on_commit(restaurant_ids, category_ids)
+
+
+@receiver(post_save, sender=ProductTranslation)
+@receiver(post_delete, sender=ProductTranslation)
+def _product_translation_menus_changed(sender, instance, **kwargs):
+    owners = Product.objects.filter(pk=instance.product_id).values_list('restaurant_id', 'category_id').first()
+    if owners:
+        _invalidate_on_commit([owners[0]], [owners[1]])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def _category_menus_changed(sender, instance, **kwargs):
+    restaurant_ids = Product.objects.filter(category_id=instance.pk).values_list('restaurant_id', flat=True).distinct()
+    _invalidate_on_commit(restaurant_ids, [instance.pk])
+
+
+# The restaurant fields ProductSerializer embeds.
+MENU_RESTAURANT_FIELDS = ('restaurant_name', 'status')
+track_indexed_fields(Restaurant, MENU_RESTAURANT_FIELDS)
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def _restaurant_menus_changed(sender, instance, signal, **kwargs):
+    # Ratings and other restaurant edits do not show in menus.
+    if signal is post_save and not indexed_fields_changed(instance, MENU_RESTAURANT_FIELDS):
+        return
+    category_ids = Product.objects.filter(restaurant_id=instance.pk).values_list('category_id', flat=True).distinct()
+    _invalidate_on_commit([instance.pk], category_ids)
+
+
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def _active_languages_changed(sender, **kwargs):
+    transaction.on_commit(lambda: cache.delete(ACTIVE_LANGUAGES_CACHE_KEY))
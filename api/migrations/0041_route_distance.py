@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0040_rename_countries_active_sort_idx_countries_is_acti_1974d8_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteDistance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pair_key', models.CharField(max_length=100, unique=True)),
+                ('origin_latitude', models.FloatField()),
+                ('origin_longitude', models.FloatField()),
+                ('destination_latitude', models.FloatField()),
+                ('destination_longitude', models.FloatField()),
+                ('distance_km', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'route_distances',
+                'indexes': [models.Index(fields=['updated_at'], name='route_dista_updated_8735ce_idx')],
+            },
+        ),
+    ]
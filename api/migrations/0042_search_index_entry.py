@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0041_route_distance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('entity_type', models.CharField(choices=[('restaurant', 'Restaurant'), ('product', 'Product'), ('category', 'Category')], max_length=20)),
+                ('entity_id', models.IntegerField()),
+                ('field', models.CharField(max_length=30)),
+                ('language_code', models.CharField(blank=True, default='', max_length=10)),
+                ('weight', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'db_table': 'search_index_entries',
+                'indexes': [models.Index(fields=['entity_type', 'term'], name='search_inde_entity__05b705_idx'), models.Index(fields=['entity_type', 'entity_id'], name='search_inde_entity__8e9473_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0042_search_index_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTrendBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('search_query', models.CharField(max_length=255)),
+                ('bucket_start', models.DateTimeField()),
+                ('search_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'search_trend_buckets',
+                'indexes': [models.Index(fields=['bucket_start'], name='search_tren_bucket__10b18e_idx')],
+                'unique_together': {('search_query', 'bucket_start')},
+            },
+        ),
+    ]
@@ -618,7 +618,9 @@ class SearchHistory(models.Model):
     search_query = models.CharField(max_length=255)
     search_type = models.CharField(max_length=20, choices=SEARCH_TYPE_CHOICES)
     results_count = models.IntegerField(default=0)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: the search log writes rows after the fact with the
+    # time of the search.
+    created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         db_table = 'search_history'
@@ -1485,3 +1487,74 @@ class DineInProductTranslation(models.Model):
 
     def __str__(self):
         return f"{self.dine_in_product.product_name} - {self.language.code}: {self.translated_name}"
+
+
+class RouteDistance(models.Model):
+    """
+    Driving distance between two snapped coordinates, as returned by the
+    routing provider. Backs the in-process and shared route caches so that
+    restarts and cold workers do not go back to OSRM for known pairs.
+    """
+    pair_key = models.CharField(max_length=100, unique=True)
+    origin_latitude = models.FloatField()
+    origin_longitude = models.FloatField()
+    destination_latitude = models.FloatField()
+    destination_longitude = models.FloatField()
+    distance_km = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'route_distances'
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.pair_key}: {self.distance_km:.3f} km"
+
+
+class SearchIndexEntry(models.Model):
+    """
+    One term of the catalog search index: the term occurs in `field` of the
+    restaurant, product or category `entity_id`. Maintained by api.search.
+    """
+    ENTITY_TYPE_CHOICES = [
+        ('restaurant', 'Restaurant'),
+        ('product', 'Product'),
+        ('category', 'Category'),
+    ]
+
+    term = models.CharField(max_length=64)
+    entity_type = models.CharField(max_length=20, choices=ENTITY_TYPE_CHOICES)
+    entity_id = models.IntegerField()
+    field = models.CharField(max_length=30)
+    language_code = models.CharField(max_length=10, blank=True, default='')
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        db_table = 'search_index_entries'
+        indexes = [
+            models.Index(fields=['entity_type', 'term']),
+            models.Index(fields=['entity_type', 'entity_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.entity_type} {self.entity_id} ({self.field})"
+
+
+class SearchTrendBucket(models.Model):
+    """Number of searches for a query within one hour; rolled up for trending."""
+    search_query = models.CharField(max_length=255)
+    bucket_start = models.DateTimeField()
+    search_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'search_trend_buckets'
+        unique_together = ['search_query', 'bucket_start']
+        indexes = [
+            models.Index(fields=['bucket_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.search_query} @ {self.bucket_start:%Y-%m-%d %H:00}: {self.search_count}"
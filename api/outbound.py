@@ -0,0 +1,267 @@
+"""
+Shared outbound HTTP layer for third-party providers (OSRM, Nominatim).
+
+Each provider gets one pooled keep-alive connection pool, its own
+connect/read timeouts and a circuit breaker. After
+OUTBOUND_BREAKER_FAILURE_THRESHOLD consecutive failures the breaker opens
+and calls fail immediately with CircuitOpenError for
+OUTBOUND_BREAKER_RESET_SECONDS; then a single trial request decides whether
+it closes again.
+
+CircuitOpenError subclasses requests.RequestException, so existing
+`except requests.RequestException` handling covers it.
+
+SharedRateLimiter spaces requests to a provider across all worker
+processes using the shared cache.
+"""
+import logging
+import math
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_CONNECT_TIMEOUT_SECONDS = float(getattr(settings, 'OUTBOUND_CONNECT_TIMEOUT_SECONDS', 3))
+OUTBOUND_POOL_MAXSIZE = int(getattr(settings, 'OUTBOUND_POOL_MAXSIZE', 10))
+OUTBOUND_BREAKER_FAILURE_THRESHOLD = int(getattr(settings, 'OUTBOUND_BREAKER_FAILURE_THRESHOLD', 5))
+OUTBOUND_BREAKER_RESET_SECONDS = float(getattr(settings, 'OUTBOUND_BREAKER_RESET_SECONDS', 30))
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with closed, open and half-open states."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                # Let exactly one trial request through.
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+
+class SharedRateLimiter:
+    """
+    Cluster-wide limiter allowing one request per interval, coordinated through
+    the shared cache so every worker process draws from the same budget.
+
+    Time is divided into interval-long slots and a request owns a slot by
+    winning cache.add() on its key (atomic in Redis and LocMem). A request may
+    start immediately only if it also owns the following slot; otherwise it
+    reserves the next free slot and starts at its boundary. Either way two
+    requests are never closer than one interval. Reservation never blocks;
+    callers sleep (outside any lock) for the returned delay.
+    """
+
+    def __init__(self, name, interval_seconds, max_wait_seconds):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._key_ttl = max(1, int(math.ceil(max_wait_seconds + 3 * interval_seconds)))
+
+    def _claim(self, slot):
+        return cache.add(f"ratelimit:{self.name}:{slot}", 1, self._key_ttl)
+
+    def reserve(self):
+        """
+        Return seconds to wait before sending, or None when no slot is free
+        within max_wait_seconds.
+        """
+        if self.interval_seconds <= 0:
+            return 0.0
+
+        now = time.time()
+        current = int(now // self.interval_seconds)
+        first_free = current + 1
+        if self._claim(current):
+            if self._claim(current + 1):
+                return 0.0
+            first_free = current + 2
+
+        last_slot = int((now + self.max_wait_seconds) // self.interval_seconds)
+        for slot in range(first_free, last_slot + 1):
+            if self._claim(slot):
+                return max(0.0, slot * self.interval_seconds - now)
+        return None
+
+
+class OutboundClient:
+    """
+    GET-only client for one provider.
+
+    Sessions are per thread (requests.Session is not thread-safe) but mount a
+    single shared HTTPAdapter, so all threads draw keep-alive connections from
+    one pool per provider.
+    """
+
+    def __init__(self, name, base_url, read_timeout, headers=None,
+                 connect_timeout=OUTBOUND_CONNECT_TIMEOUT_SECONDS,
+                 pool_maxsize=OUTBOUND_POOL_MAXSIZE,
+                 failure_threshold=OUTBOUND_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds=OUTBOUND_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.headers = dict(headers or {})
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {
+                'requests': 0,
+                'errors': 0,
+                'rate_limited': 0,
+                'short_circuited': 0,
+                'seconds': 0.0,
+                'max_seconds': 0.0,
+            }
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+            self._local.session = session
+        return session
+
+    def _record(self, seconds, error=False, rate_limited=False):
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            self._stats['seconds'] += seconds
+            self._stats['max_seconds'] = max(self._stats['max_seconds'], seconds)
+            if error:
+                self._stats['errors'] += 1
+            if rate_limited:
+                self._stats['rate_limited'] += 1
+
+    def get(self, path, params=None, headers=None, timeout=None):
+        """
+        GET base_url + path. Transport errors and 5xx responses count as
+        breaker failures; 429 is returned to the caller and only counted.
+        """
+        if not self.breaker.allow_request():
+            with self._stats_lock:
+                self._stats['short_circuited'] += 1
+            raise CircuitOpenError(f"{self.name} circuit breaker is open")
+
+        started = time.perf_counter()
+        try:
+            response = self._session().get(
+                f"{self.base_url}{path}",
+                params=params,
+                headers=headers,
+                timeout=timeout or self.timeout,
+            )
+        except requests.RequestException:
+            self._record(time.perf_counter() - started, error=True)
+            self._failure()
+            raise
+
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 500:
+            self._record(elapsed, error=True)
+            self._failure()
+        else:
+            self._record(elapsed, rate_limited=response.status_code == 429)
+            self.breaker.record_success()
+        return response
+
+    def _failure(self):
+        if self.breaker.record_failure():
+            logger.warning(
+                "%s circuit breaker opened for %ss",
+                self.name, self.breaker.reset_seconds,
+            )
+
+    def stats(self):
+        with self._stats_lock:
+            counters = dict(self._stats)
+        requests_count = counters['requests']
+        return {
+            'requests': requests_count,
+            'errors': counters['errors'],
+            'rate_limited': counters['rate_limited'],
+            'short_circuited': counters['short_circuited'],
+            'avg_latency_ms': round(counters['seconds'] * 1000 / requests_count, 3) if requests_count else None,
+            'max_latency_ms': round(counters['max_seconds'] * 1000, 3),
+            'breaker_state': self.breaker.state,
+        }
+
+
+osrm_client = OutboundClient(
+    'osrm',
+    getattr(settings, 'ROUTING_OSRM_BASE_URL', 'https://router.project-osrm.org'),
+    read_timeout=int(getattr(settings, 'ROUTING_OSRM_TIMEOUT_SECONDS', 8)),
+    headers={'User-Agent': 'FoodDeliveryAseanMall/1.0 (routing-distance)'},
+)
+
+nominatim_client = OutboundClient(
+    'nominatim',
+    getattr(settings, 'NOMINATIM_BASE_URL', 'https://nominatim.openstreetmap.org'),
+    read_timeout=int(getattr(settings, 'NOMINATIM_TIMEOUT_SECONDS', 8)),
+    headers={
+        'User-Agent': getattr(
+            settings,
+            'NOMINATIM_USER_AGENT',
+            'FoodDeliveryAseanMall/1.0 (local geocoding proxy)',
+        ),
+        'Accept': 'application/json',
+    },
+)
+
+OUTBOUND_CLIENTS = (osrm_client, nominatim_client)
+
+
+def outbound_stats():
+    """Latency, error and breaker state per provider for this process."""
+    return {client.name: client.stats() for client in OUTBOUND_CLIENTS}
@@ -0,0 +1,438 @@
+"""
+Local geocoding from places we already store.
+
+Restaurants and entertainment venues with coordinates are kept in a per-worker
+GridIndex. A reverse lookup within LOCAL_GEOCODE_SNAP_RADIUS_METERS of one of
+them is answered from the index in the same shape as a Nominatim jsonv2
+reverse result, so the proxy only goes upstream for unknown locations.
+
+Forward search uses PlaceNameIndex, a sorted array of normalized names
+(restaurants, venues and their translations, cities, countries) searched by
+prefix with bisect, so typeahead hits are answered without the provider.
+It holds only names; a restaurant or venue hit takes its coordinates and
+address from the place index, so moving a place or editing its address does
+not rebuild the name index.
+"""
+import bisect
+import logging
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .geo import GridIndex
+from .local_index import (
+    LocalIndex, bump_index_version, indexed_fields_changed, indexed_previous_value, track_indexed_fields,
+)
+from .models import City, Country, EntertainmentVenue, Restaurant, VenueTranslation
+
+logger = logging.getLogger(__name__)
+
+LOCAL_GEOCODE_ENABLED = bool(getattr(settings, 'LOCAL_GEOCODE_ENABLED', True))
+LOCAL_GEOCODE_SNAP_RADIUS_METERS = float(getattr(settings, 'LOCAL_GEOCODE_SNAP_RADIUS_METERS', 50))
+LOCAL_GEOCODE_INDEX_MAX_AGE_SECONDS = int(getattr(settings, 'LOCAL_GEOCODE_INDEX_MAX_AGE_SECONDS', 600))
+LOCAL_GEOCODE_SEARCH_MIN_CHARS = int(getattr(settings, 'LOCAL_GEOCODE_SEARCH_MIN_CHARS', 2))
+# Cells a little larger than the snap radius keep lookups to a few cells.
+LOCAL_GEOCODE_CELL_DEGREES = 0.005
+
+PLACE_INDEX_VERSION_CACHE_KEY = 'places:index_version'
+PLACE_NAME_INDEX_VERSION_CACHE_KEY = 'places:name_index_version'
+
+PLACE_SOURCES = (
+    ('restaurant', Restaurant, 'restaurant_id', 'restaurant_name'),
+    ('venue', EntertainmentVenue, 'venue_id', 'venue_name'),
+)
+
+
+def _place_payload(place_type, place_id, name, lat, lon, address, city_name, country_name):
+    return {
+        'type': place_type,
+        'id': place_id,
+        'name': name,
+        'lat': lat,
+        'lon': lon,
+        'address': address or '',
+        'city': city_name,
+        'country': country_name,
+    }
+
+
+class PlaceIndex(LocalIndex):
+    """
+    Per-process grid index of named places, keyed by (type, id).
+
+    Saves and deletes of restaurants and venues are applied to the local index
+    directly. Every change also bumps a shared version counter, and other
+    workers rebuild lazily when it moves or when their index is older than
+    LOCAL_GEOCODE_INDEX_MAX_AGE_SECONDS.
+    """
+    version_cache_key = PLACE_INDEX_VERSION_CACHE_KEY
+    max_age_seconds = LOCAL_GEOCODE_INDEX_MAX_AGE_SECONDS
+
+    def build(self):
+        index = GridIndex(cell_degrees=LOCAL_GEOCODE_CELL_DEGREES)
+        places = {}
+        for place_type, model, pk_field, name_field in PLACE_SOURCES:
+            rows = model.objects.filter(
+                latitude__isnull=False,
+                longitude__isnull=False,
+            ).values_list(
+                pk_field, name_field, 'address', 'latitude', 'longitude',
+                'city__name', 'country__name',
+            )
+            for pk, name, address, latitude, longitude, city_name, country_name in rows.iterator():
+                key = (place_type, pk)
+                lat, lon = float(latitude), float(longitude)
+                index.add(key, lat, lon)
+                places[key] = _place_payload(place_type, pk, name, lat, lon, address, city_name, country_name)
+        logger.debug("Built local place index with %s entries", len(index))
+        return index, places
+
+    def nearest(self, lat, lon, radius_km):
+        """Return (place, distance_km) for the closest place within radius_km, or None."""
+        (index, places), _ = self.get()
+        matches = index.query(lat, lon, radius_km)
+        if not matches:
+            return None
+        key, distance_km = matches[0]
+        place = places.get(key)
+        if place is None:
+            return None
+        return place, distance_km
+
+    def reflect(self, place_type, instance, pk_field, name_field, deleted=False):
+        """Reflect a single restaurant/venue change in this worker's index."""
+        def update(data):
+            index, places = data
+            key = (place_type, getattr(instance, pk_field))
+            if deleted or instance.latitude is None or instance.longitude is None:
+                index.remove(key)
+                places.pop(key, None)
+            else:
+                lat, lon = float(instance.latitude), float(instance.longitude)
+                index.add(key, lat, lon)
+                places[key] = _place_payload(
+                    place_type,
+                    key[1],
+                    getattr(instance, name_field),
+                    lat,
+                    lon,
+                    instance.address,
+                    instance.city.name if instance.city_id else None,
+                    instance.country.name if instance.country_id else None,
+                )
+
+        self.apply(update)
+
+
+local_place_index = PlaceIndex()
+
+
+def local_reverse_geocode(lat, lon):
+    """
+    Nominatim-shaped reverse result for a stored place within the snap
+    radius, or None when the caller should ask the provider.
+    """
+    if not LOCAL_GEOCODE_ENABLED or LOCAL_GEOCODE_SNAP_RADIUS_METERS <= 0:
+        return None
+
+    match = local_place_index.nearest(lat, lon, LOCAL_GEOCODE_SNAP_RADIUS_METERS / 1000.0)
+    if match is None:
+        return None
+
+    place, distance_km = match
+    address = {}
+    if place['city']:
+        address['city'] = place['city']
+    if place['country']:
+        address['country'] = place['country']
+    display_parts = [place['name'], place['address'], place['city'], place['country']]
+
+    return {
+        'display_name': ', '.join(part for part in display_parts if part),
+        'name': place['name'],
+        'lat': f"{lat:.7f}",
+        'lon': f"{lon:.7f}",
+        'address': address,
+        'source': 'local_index',
+        'place': {
+            'type': place['type'],
+            'id': place['id'],
+            'distance_m': round(distance_km * 1000, 1),
+        },
+    }
+
+
+def normalize_place_name(value):
+    return " ".join((value or "").casefold().split())
+
+
+# Result ordering between kinds when match quality and length tie.
+PLACE_KIND_ORDER = {'city': 0, 'country': 1, 'venue': 2, 'restaurant': 3}
+
+
+class PlaceNameIndex(LocalIndex):
+    """
+    Prefix index over place names as parallel sorted arrays.
+
+    Every name is indexed in full and from each later word, so "palace"
+    finds "Pizza Palace". A search bisects to the first term >= the query and
+    walks forward while terms still start with it. Cities and countries have
+    no coordinates of their own and are placed at the centroid of our stored
+    places in them; ones with no such places are skipped.
+
+    Restaurant and venue entries hold only their names; search() looks the
+    rest up in local_place_index and drops places it no longer has. The
+    arrays are rebuilt lazily when their own version moves (a place is
+    added, removed, renamed or moved to another city or country, or a
+    translation, city or country changes) or when older than
+    LOCAL_GEOCODE_INDEX_MAX_AGE_SECONDS, so city and country centroids may
+    lag a moved place until then.
+    """
+
+    MAX_CANDIDATES = 200
+    version_cache_key = PLACE_NAME_INDEX_VERSION_CACHE_KEY
+    max_age_seconds = LOCAL_GEOCODE_INDEX_MAX_AGE_SECONDS
+
+    def build(self):
+        entries = []
+        names = []
+        city_points = {}
+        country_points = {}
+
+        venue_names = {}
+        for venue_id, translated_name in VenueTranslation.objects.exclude(
+            translated_name='',
+        ).values_list('venue_id', 'translated_name').iterator():
+            venue_names.setdefault(venue_id, []).append(translated_name)
+
+        for place_type, model, pk_field, name_field in PLACE_SOURCES:
+            rows = model.objects.filter(
+                latitude__isnull=False,
+                longitude__isnull=False,
+            ).values_list(pk_field, name_field, 'latitude', 'longitude', 'city_id', 'country_id')
+            for pk, name, latitude, longitude, city_id, country_id in rows.iterator():
+                lat, lon = float(latitude), float(longitude)
+                if city_id:
+                    city_points.setdefault(city_id, []).append((lat, lon))
+                if country_id:
+                    country_points.setdefault(country_id, []).append((lat, lon))
+                entry = len(entries)
+                entries.append({'type': place_type, 'id': pk, 'name': name})
+                names.append((name, entry))
+                if place_type == 'venue':
+                    for translated_name in venue_names.get(pk, ()):
+                        names.append((translated_name, entry))
+
+        for city_id, city_name, country_name in City.objects.values_list(
+            'city_id', 'name', 'country__name',
+        ).iterator():
+            points = city_points.get(city_id)
+            if not points:
+                continue
+            entry = len(entries)
+            entries.append(_centroid_entry('city', city_id, city_name, points, {
+                'city': city_name,
+                'country': country_name,
+            }, [city_name, country_name]))
+            names.append((city_name, entry))
+
+        for country_id, country_name in Country.objects.filter(is_active=True).values_list(
+            'country_id', 'name',
+        ).iterator():
+            points = country_points.get(country_id)
+            if not points:
+                continue
+            entry = len(entries)
+            entries.append(_centroid_entry('country', country_id, country_name, points, {
+                'country': country_name,
+            }, [country_name]))
+            names.append((country_name, entry))
+
+        terms = []
+        for name, entry in names:
+            normalized = normalize_place_name(name)
+            if not normalized:
+                continue
+            terms.append((normalized, 0, entry))
+            words = normalized.split(" ")
+            for position in range(1, len(words)):
+                terms.append((" ".join(words[position:]), 1, entry))
+        terms.sort()
+
+        logger.debug("Built place name index with %s terms", len(terms))
+        return (
+            [term for term, _, _ in terms],
+            [(word_match, entry) for _, word_match, entry in terms],
+            entries,
+        )
+
+    def search(self, query, limit):
+        prefix = normalize_place_name(query)
+        if len(prefix) < LOCAL_GEOCODE_SEARCH_MIN_CHARS:
+            return []
+
+        (terms, refs, entries), _ = self.get()
+
+        best = {}
+        position = bisect.bisect_left(terms, prefix)
+        while position < len(terms) and len(best) < self.MAX_CANDIDATES:
+            if not terms[position].startswith(prefix):
+                break
+            word_match, entry = refs[position]
+            if entry not in best or word_match < best[entry]:
+                best[entry] = word_match
+            position += 1
+
+        ranked = sorted(
+            best.items(),
+            key=lambda item: (
+                item[1],
+                PLACE_KIND_ORDER[entries[item[0]]['type']],
+                len(entries[item[0]]['name']),
+                entries[item[0]]['id'],
+            ),
+        )
+
+        results = []
+        places = None
+        for entry, _ in ranked:
+            if len(results) >= limit:
+                break
+            found = entries[entry]
+            if found['type'] in PLACE_KINDS:
+                if places is None:
+                    (_, places), _ = local_place_index.get()
+                place = places.get((found['type'], found['id']))
+                if place is None:
+                    continue
+                found = _place_entry(place)
+            results.append(found)
+        return results
+
+
+PLACE_KINDS = {place_type for place_type, _, _, _ in PLACE_SOURCES}
+
+
+def _place_entry(place):
+    return {
+        'type': place['type'],
+        'id': place['id'],
+        'name': place['name'],
+        'lat': place['lat'],
+        'lon': place['lon'],
+        'display_parts': [place['name'], place['address'], place['city'], place['country']],
+        'address': {'city': place['city'], 'country': place['country']},
+    }
+
+
+def _centroid_entry(place_type, pk, name, points, address, display_parts):
+    return {
+        'type': place_type,
+        'id': pk,
+        'name': name,
+        'lat': sum(lat for lat, _ in points) / len(points),
+        'lon': sum(lon for _, lon in points) / len(points),
+        'display_parts': display_parts,
+        'address': address,
+    }
+
+
+place_name_index = PlaceNameIndex()
+
+
+def local_geocode_search(query, limit):
+    """Nominatim-shaped search results for stored places whose name starts with query."""
+    if not LOCAL_GEOCODE_ENABLED:
+        return []
+
+    results = []
+    for entry in place_name_index.search(query, limit):
+        results.append({
+            'place_id': f"local:{entry['type']}:{entry['id']}",
+            'display_name': ', '.join(part for part in entry['display_parts'] if part),
+            'name': entry['name'],
+            'type': entry['type'],
+            'lat': f"{entry['lat']:.7f}",
+            'lon': f"{entry['lon']:.7f}",
+            'address': {key: value for key, value in entry['address'].items() if value},
+            'source': 'local_index',
+        })
+    return results
+
+
+# The fields of each place source the place indexes read.
+PLACE_INDEX_FIELDS = ('latitude', 'longitude', 'address', 'city_id', 'country_id')
+RESTAURANT_PLACE_FIELDS = ('restaurant_name', *PLACE_INDEX_FIELDS)
+VENUE_PLACE_FIELDS = ('venue_name', *PLACE_INDEX_FIELDS)
+track_indexed_fields(Restaurant, RESTAURANT_PLACE_FIELDS)
+track_indexed_fields(EntertainmentVenue, VENUE_PLACE_FIELDS)
+
+
+def _is_located(latitude, longitude):
+    return latitude is not None and longitude is not None
+
+
+def _place_names_changed(instance, name_field):
+    """Whether a saved place needs the name index rebuilt, not just the place index."""
+    if indexed_fields_changed(instance, (name_field, 'city_id', 'country_id')):
+        return True
+    # Only places with coordinates are indexed; moving one does not matter.
+    if not indexed_fields_changed(instance, ('latitude', 'longitude')):
+        return False
+    was_located = _is_located(
+        indexed_previous_value(instance, 'latitude'),
+        indexed_previous_value(instance, 'longitude'),
+    )
+    return was_located != _is_located(instance.latitude, instance.longitude)
+
+
+def _reflect_place_save(place_type, instance, pk_field, name_field, fields):
+    if not indexed_fields_changed(instance, fields):
+        return
+    local_place_index.reflect(place_type, instance, pk_field, name_field)
+    if _place_names_changed(instance, name_field):
+        bump_index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY)
+
+
+def _reflect_place_delete(place_type, instance, pk_field, name_field):
+    local_place_index.reflect(place_type, instance, pk_field, name_field, deleted=True)
+    bump_index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY)
+
+
+@receiver(post_save, sender=Restaurant)
+def update_place_index_on_restaurant_save(sender, instance, **kwargs):
+    _reflect_place_save('restaurant', instance, 'restaurant_id', 'restaurant_name', RESTAURANT_PLACE_FIELDS)
+
+
+@receiver(post_delete, sender=Restaurant)
+def update_place_index_on_restaurant_delete(sender, instance, **kwargs):
+    _reflect_place_delete('restaurant', instance, 'restaurant_id', 'restaurant_name')
+
+
+@receiver(post_save, sender=EntertainmentVenue)
+def update_place_index_on_venue_save(sender, instance, **kwargs):
+    _reflect_place_save('venue', instance, 'venue_id', 'venue_name', VENUE_PLACE_FIELDS)
+
+
+@receiver(post_delete, sender=EntertainmentVenue)
+def update_place_index_on_venue_delete(sender, instance, **kwargs):
+    _reflect_place_delete('venue', instance, 'venue_id', 'venue_name')
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def invalidate_place_indexes_on_location_change(sender, **kwargs):
+    # City/country names are copied into every entry of both indexes;
+    # rebuild lazily.
+    bump_index_version(PLACE_INDEX_VERSION_CACHE_KEY)
+    bump_index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY)
+
+
+@receiver(post_save, sender=VenueTranslation)
+@receiver(post_delete, sender=VenueTranslation)
+def invalidate_place_name_index_on_translation_change(sender, **kwargs):
+    # Translations only feed the name index.
+    bump_index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY)
@@ -0,0 +1,216 @@
+"""
+Tiered cache for routing-provider distances.
+
+Lookups go through three tiers, fastest first:
+
+1. a per-process LRU (no I/O),
+2. the shared Django cache (Redis in production, shared by all workers),
+3. the route_distances table, which survives restarts and cache flushes.
+
+A hit in a lower tier is copied into the tiers above it. Each tier keeps
+hit/miss counters and cumulative lookup latency so the hit rate can be
+checked with route_distance_cache.stats().
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .models import RouteDistance
+
+logger = logging.getLogger(__name__)
+
+ROUTING_DISTANCE_CACHE_TTL_SECONDS = int(getattr(settings, 'ROUTING_DISTANCE_CACHE_TTL_SECONDS', 604800))
+ROUTING_DISTANCE_LRU_SIZE = int(getattr(settings, 'ROUTING_DISTANCE_LRU_SIZE', 10000))
+ROUTING_DISTANCE_DB_TTL_DAYS = int(getattr(settings, 'ROUTING_DISTANCE_DB_TTL_DAYS', 180))
+
+TIERS = ('local', 'shared', 'database')
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU with per-entry expiry."""
+
+    def __init__(self, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, expires_at = entry
+                if expires_at < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, mapping):
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for key, value in mapping.items():
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RouteDistanceCache:
+    """Read-through/write-through cache of {pair_key: distance_km}."""
+
+    def __init__(self):
+        self._local = LRUCache(ROUTING_DISTANCE_LRU_SIZE, ROUTING_DISTANCE_CACHE_TTL_SECONDS)
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {
+                tier: {'hits': 0, 'misses': 0, 'lookups': 0, 'seconds': 0.0}
+                for tier in TIERS
+            }
+
+    def _record(self, tier, hits, misses, seconds):
+        with self._stats_lock:
+            counters = self._stats[tier]
+            counters['hits'] += hits
+            counters['misses'] += misses
+            counters['lookups'] += 1
+            counters['seconds'] += seconds
+
+    def stats(self):
+        """Per-tier hit/miss counts, hit rate and average lookup latency."""
+        with self._stats_lock:
+            snapshot = {}
+            for tier, counters in self._stats.items():
+                total = counters['hits'] + counters['misses']
+                lookups = counters['lookups']
+                snapshot[tier] = {
+                    'hits': counters['hits'],
+                    'misses': counters['misses'],
+                    'hit_rate': round(counters['hits'] / total, 4) if total else None,
+                    'avg_latency_ms': round(counters['seconds'] * 1000 / lookups, 3) if lookups else None,
+                }
+        snapshot['local']['size'] = len(self._local)
+        return snapshot
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        keys = [key for key in dict.fromkeys(keys) if key]
+        if not keys:
+            return {}
+
+        started = time.perf_counter()
+        found = self._local.get_many(keys)
+        self._record('local', len(found), len(keys) - len(found), time.perf_counter() - started)
+        missing = [key for key in keys if key not in found]
+        if not missing:
+            return found
+
+        started = time.perf_counter()
+        shared = cache.get_many(missing)
+        self._record('shared', len(shared), len(missing) - len(shared), time.perf_counter() - started)
+        if shared:
+            self._local.set_many(shared)
+            found.update(shared)
+            missing = [key for key in missing if key not in shared]
+        if not missing:
+            return found
+
+        started = time.perf_counter()
+        stored = self._get_many_from_db(missing)
+        self._record('database', len(stored), len(missing) - len(stored), time.perf_counter() - started)
+        if stored:
+            cache.set_many(stored, ROUTING_DISTANCE_CACHE_TTL_SECONDS)
+            self._local.set_many(stored)
+            found.update(stored)
+        return found
+
+    def set(self, key, distance_km):
+        self.set_many({key: distance_km})
+
+    def set_many(self, distances):
+        if not distances:
+            return
+        self._local.set_many(distances)
+        cache.set_many(distances, ROUTING_DISTANCE_CACHE_TTL_SECONDS)
+        self._save_many_to_db(distances)
+
+    def _db_cutoff(self):
+        return timezone.now() - timedelta(days=ROUTING_DISTANCE_DB_TTL_DAYS)
+
+    def _get_many_from_db(self, keys):
+        try:
+            rows = RouteDistance.objects.filter(
+                pair_key__in=keys,
+                updated_at__gte=self._db_cutoff(),
+            ).values_list('pair_key', 'distance_km')
+            return dict(rows)
+        except DatabaseError as exc:
+            logger.warning("Route distance table lookup failed: %s", exc)
+            return {}
+
+    def _save_many_to_db(self, distances):
+        rows = []
+        for key, distance_km in distances.items():
+            pair = _pair_from_key(key)
+            if pair is None:
+                continue
+            (origin_lat, origin_lon), (dest_lat, dest_lon) = pair
+            rows.append(RouteDistance(
+                pair_key=key,
+                origin_latitude=origin_lat,
+                origin_longitude=origin_lon,
+                destination_latitude=dest_lat,
+                destination_longitude=dest_lon,
+                distance_km=distance_km,
+            ))
+        if not rows:
+            return
+        try:
+            # Expired rows are replaced rather than updated in place so the
+            # write stays a plain insert on every database backend.
+            RouteDistance.objects.filter(pair_key__in=[row.pair_key for row in rows]).delete()
+            RouteDistance.objects.bulk_create(rows, ignore_conflicts=True)
+        except DatabaseError as exc:
+            logger.warning("Route distance table write failed: %s", exc)
+
+    def clear_local(self):
+        self._local.clear()
+
+
+def _pair_from_key(key):
+    """Parse a "route_km:lat:lon:lat:lon" key back into two (lat, lon) points."""
+    try:
+        _, lat1, lon1, lat2, lon2 = key.split(':')
+        return (float(lat1), float(lon1)), (float(lat2), float(lon2))
+    except ValueError:
+        return None
+
+
+route_distance_cache = RouteDistanceCache()
@@ -0,0 +1,166 @@
+"""
+Offline road-distance estimator.
+
+Straight-line distance underestimates what a rider actually drives. The
+estimator learns how much longer roads are than the straight line (the
+detour factor) from routing-provider results already stored in the
+route_distances table, per grid cell of the trip midpoint, and scales the
+haversine distance by it. It is used when the provider fails or does not
+answer within the routing race budget.
+
+The table is built on a background thread, never in the request that finds
+it missing or stale; until the first build finishes every estimate uses
+ROUTING_DEFAULT_DETOUR_FACTOR.
+"""
+import logging
+import math
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+
+from .geo import haversine_km, haversine_km_array
+from .models import RouteDistance
+
+logger = logging.getLogger(__name__)
+
+ROUTING_ESTIMATE_CELL_DEGREES = float(getattr(settings, 'ROUTING_ESTIMATE_CELL_DEGREES', 0.1))
+ROUTING_ESTIMATE_MIN_SAMPLES = int(getattr(settings, 'ROUTING_ESTIMATE_MIN_SAMPLES', 5))
+ROUTING_ESTIMATE_SAMPLE_LIMIT = int(getattr(settings, 'ROUTING_ESTIMATE_SAMPLE_LIMIT', 50000))
+ROUTING_ESTIMATE_MAX_AGE_SECONDS = int(getattr(settings, 'ROUTING_ESTIMATE_MAX_AGE_SECONDS', 3600))
+ROUTING_DEFAULT_DETOUR_FACTOR = float(getattr(settings, 'ROUTING_DEFAULT_DETOUR_FACTOR', 1.3))
+
+# Very short trips and implausible ratios (provider snapping to another
+# road, ferries) would skew the medians.
+MIN_SAMPLE_STRAIGHT_KM = 0.3
+MIN_DETOUR_FACTOR = 1.0
+MAX_DETOUR_FACTOR = 3.0
+
+_rebuild_executor = None
+_rebuild_executor_lock = threading.Lock()
+
+
+def _estimate_executor():
+    # Created on first use, so processes that never estimate get no pool.
+    global _rebuild_executor
+    if _rebuild_executor is None:
+        with _rebuild_executor_lock:
+            if _rebuild_executor is None:
+                _rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='route-estimate')
+    return _rebuild_executor
+
+
+class RoadDistanceEstimator:
+    """
+    Per-process table of detour factors keyed by grid cell.
+
+    Factors are the median road/straight-line ratio of the cached routes whose
+    midpoint falls in the cell; cells with fewer than
+    ROUTING_ESTIMATE_MIN_SAMPLES routes use the overall median. The table is
+    rebuilt in the background once older than ROUTING_ESTIMATE_MAX_AGE_SECONDS.
+    """
+
+    def __init__(self, cell_degrees=ROUTING_ESTIMATE_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        # (factors by cell, default factor), replaced as a whole.
+        self._table = None
+        self._built_at = 0.0
+
+    def _cell_for(self, lat, lon):
+        return (
+            int(math.floor(lat / self.cell_degrees)),
+            int(math.floor(lon / self.cell_degrees)),
+        )
+
+    def _is_stale(self):
+        if self._table is None:
+            return True
+        return time.monotonic() - self._built_at > ROUTING_ESTIMATE_MAX_AGE_SECONDS
+
+    def _load_samples(self):
+        rows = RouteDistance.objects.order_by('-updated_at').values_list(
+            'origin_latitude',
+            'origin_longitude',
+            'destination_latitude',
+            'destination_longitude',
+            'distance_km',
+        )[:ROUTING_ESTIMATE_SAMPLE_LIMIT]
+        return np.array(list(rows), dtype=np.float64).reshape(-1, 5)
+
+    def rebuild(self):
+        try:
+            samples = self._load_samples()
+        except DatabaseError as exc:
+            logger.warning("Could not load route samples for distance estimator: %s", exc)
+            samples = np.empty((0, 5))
+
+        lat1, lon1, lat2, lon2, road_km = samples.T
+        straight_km = haversine_km_array(lat1, lon1, lat2, lon2)
+        usable = straight_km >= MIN_SAMPLE_STRAIGHT_KM
+        ratios = road_km[usable] / straight_km[usable]
+        plausible = (ratios >= MIN_DETOUR_FACTOR) & (ratios <= MAX_DETOUR_FACTOR)
+        ratios = ratios[plausible]
+        mid_lats = ((lat1 + lat2) / 2)[usable][plausible]
+        mid_lons = ((lon1 + lon2) / 2)[usable][plausible]
+
+        by_cell = {}
+        for lat, lon, ratio in zip(mid_lats.tolist(), mid_lons.tolist(), ratios.tolist()):
+            by_cell.setdefault(self._cell_for(lat, lon), []).append(ratio)
+
+        factors = {
+            cell: statistics.median(cell_ratios)
+            for cell, cell_ratios in by_cell.items()
+            if len(cell_ratios) >= ROUTING_ESTIMATE_MIN_SAMPLES
+        }
+        default_factor = (
+            float(np.median(ratios)) if len(ratios) >= ROUTING_ESTIMATE_MIN_SAMPLES
+            else ROUTING_DEFAULT_DETOUR_FACTOR
+        )
+
+        self._table = (factors, default_factor)
+        self._built_at = time.monotonic()
+        logger.debug(
+            "Built road distance estimator from %s routes: %s cells, default factor %.3f",
+            len(ratios), len(factors), default_factor,
+        )
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("Road distance estimator rebuild failed")
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._rebuilding = False
+
+    def warm(self):
+        """Start a background rebuild if the table is missing or stale."""
+        if not self._is_stale():
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        _estimate_executor().submit(self._rebuild_in_background)
+
+    def detour_factor(self, lat1, lon1, lat2, lon2):
+        self.warm()
+        table = self._table
+        if table is None:
+            return ROUTING_DEFAULT_DETOUR_FACTOR
+        factors, default_factor = table
+        return factors.get(self._cell_for((lat1 + lat2) / 2, (lon1 + lon2) / 2), default_factor)
+
+    def estimate_km(self, lat1, lon1, lat2, lon2):
+        """Calibrated road distance (km) between two float coordinates."""
+        return haversine_km(lat1, lon1, lat2, lon2) * self.detour_factor(lat1, lon1, lat2, lon2)
+
+
+road_distance_estimator = RoadDistanceEstimator()
@@ -0,0 +1,668 @@
+"""
+Indexed catalog search.
+
+Restaurant, product and category text is tokenized into the
+search_index_entries table, one row per (term, entity, field, language).
+Words in space-separated scripts are indexed whole and matched by prefix.
+Thai, Lao, Khmer, Myanmar and Korean are written without spaces between
+words, so runs of those scripts are indexed as overlapping character
+bigrams and a query matches when all of its bigrams do.
+
+Entries are rebuilt for one entity whenever it or one of its translations
+is saved or deleted. `python manage.py rebuild_search_index` rebuilds
+everything; run it once after the migration that creates the table.
+
+With SEARCH_BACKEND = 'memory' queries are answered instead by
+MemorySearchIndex, a compact per-worker copy of the same index that never
+touches the database on the hot path. Every reindexed entity is appended to
+a change log in the shared cache, so other workers replay the few entities
+that changed rather than rebuilding.
+"""
+import base64
+import binascii
+import bisect
+import json
+import logging
+import math
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .local_index import bump_index_version, index_version, indexed_fields_changed, track_indexed_fields
+from .models import (
+    Category, CategoryTranslation, Product, ProductTranslation, Restaurant,
+    SearchIndexEntry,
+)
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND = getattr(settings, 'SEARCH_BACKEND', 'database')
+SEARCH_MEMORY_INDEX_MAX_AGE_SECONDS = int(getattr(settings, 'SEARCH_MEMORY_INDEX_MAX_AGE_SECONDS', 3600))
+# A worker further behind than this many changes rebuilds instead of replaying.
+SEARCH_CHANGE_REPLAY_LIMIT = 50
+SEARCH_CHANGE_LOG_TTL_SECONDS = 3600
+
+SEARCH_INDEX_VERSION_CACHE_KEY = 'search:index_version'
+
+SEARCH_TERM_MAX_LENGTH = 64
+# Word tokens shorter than this are matched exactly instead of by prefix,
+# so a one-letter query does not pull in every posting.
+SEARCH_PREFIX_MIN_CHARS = 2
+SEARCH_FETCH_CHUNK_SIZE = 100
+# Matches considered per entity type and request; deeper results are not ranked.
+SEARCH_MAX_CANDIDATES = int(getattr(settings, 'SEARCH_MAX_CANDIDATES', 500))
+SEARCH_RATING_BOOST = 0.3
+SEARCH_POPULARITY_BOOST = 0.3
+# Review count at which the popularity boost is at its maximum.
+SEARCH_POPULARITY_SATURATION = 1000
+SEARCH_REBUILD_BATCH_SIZE = 1000
+
+# A term's score for an entity is the weight of the best field it matched in;
+# an entity's score is the sum over the query terms.
+FIELD_WEIGHTS = {
+    'name': 8,
+    'description': 4,
+    'translated_name': 2,
+    'translated_description': 1,
+}
+
+# Scripts written without spaces between words; indexed as bigrams.
+BIGRAM_SCRIPT_RANGES = (
+    (0x0E00, 0x0E7F),  # Thai
+    (0x0E80, 0x0EFF),  # Lao
+    (0x1000, 0x109F),  # Myanmar
+    (0x1100, 0x11FF),  # Hangul Jamo
+    (0x1780, 0x17FF),  # Khmer
+    (0x3130, 0x318F),  # Hangul compatibility Jamo
+    (0xAC00, 0xD7AF),  # Hangul syllables
+)
+
+_WORD, _BIGRAM = 'word', 'bigram'
+
+SearchPage = namedtuple('SearchPage', ['objects', 'count', 'count_capped', 'next_cursor'])
+
+
+def _char_kind(char):
+    code = ord(char)
+    for start, end in BIGRAM_SCRIPT_RANGES:
+        if start <= code <= end:
+            return _BIGRAM
+    if char.isalnum() or unicodedata.category(char).startswith('M'):
+        return _WORD
+    return None
+
+
+def normalize_search_query(query):
+    """Casefolded, NFKC-normalized query with collapsed whitespace."""
+    return " ".join(unicodedata.normalize('NFKC', query or '').casefold().split())
+
+
+def _runs(text):
+    """Split normalized text into (kind, run) pairs of word or bigram-script characters."""
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    runs = []
+    kind, start = None, 0
+    for position, char in enumerate(text):
+        char_kind = _char_kind(char)
+        if char_kind != kind:
+            if kind is not None:
+                runs.append((kind, text[start:position]))
+            kind, start = char_kind, position
+    if kind is not None:
+        runs.append((kind, text[start:]))
+    return runs
+
+
+def _bigrams(run):
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def index_terms(text):
+    """Distinct terms to index for a piece of text."""
+    terms = []
+    for kind, run in _runs(text):
+        if kind == _BIGRAM:
+            terms.extend(_bigrams(run))
+        else:
+            terms.append(run[:SEARCH_TERM_MAX_LENGTH])
+    return list(dict.fromkeys(terms))
+
+
+def query_terms(query):
+    """
+    (term, is_prefix) pairs for a search query. Words match by prefix so
+    partially typed queries work; a lone character of a bigram script
+    matches every bigram starting with it.
+    """
+    terms = []
+    for kind, run in _runs(query):
+        if kind == _BIGRAM:
+            if len(run) == 1:
+                terms.append((run, True))
+            else:
+                terms.extend((bigram, False) for bigram in _bigrams(run))
+        else:
+            run = run[:SEARCH_TERM_MAX_LENGTH]
+            terms.append((run, len(run) >= SEARCH_PREFIX_MIN_CHARS))
+    return list(dict.fromkeys(terms))
+
+
+def _intersect_scores(scores, term_scores):
+    """Keep entities matched by every term so far, adding this term's weight."""
+    if scores is None:
+        return term_scores
+    return {
+        entity_id: scores[entity_id] + weight
+        for entity_id, weight in term_scores.items()
+        if entity_id in scores
+    }
+
+
+def _ranked(scores):
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def _database_ranked_entity_ids(entity_type, terms, language):
+    scores = None
+    for term, is_prefix in terms:
+        # Terms are casefolded already; istartswith is a plain LIKE 'x%' on
+        # MySQL (startswith is LIKE BINARY) and range-scans the term index.
+        lookup = Q(term__istartswith=term) if is_prefix else Q(term=term)
+        if language:
+            lookup &= Q(language_code='') | Q(language_code=language)
+        rows = (
+            SearchIndexEntry.objects
+            .filter(lookup, entity_type=entity_type)
+            .values('entity_id')
+            .annotate(weight=Max('weight'))
+        )
+        scores = _intersect_scores(scores, {row['entity_id']: row['weight'] for row in rows})
+        if not scores:
+            return []
+    return _ranked(scores)
+
+
+def ranked_entity_ids(entity_type, query, language=None):
+    """
+    [(entity_id, score)] of entities matching every term of the query,
+    best first. With a language, only untranslated fields and translations
+    into that language are matched.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    if SEARCH_BACKEND == 'memory':
+        return memory_search_index.ranked_entity_ids(entity_type, terms, language)
+    return _database_ranked_entity_ids(entity_type, terms, language)
+
+
+def encode_cursor(score, entity_id):
+    raw = json.dumps([score, entity_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(score, entity_id) from a cursor; ValueError if it was not made by encode_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        score, entity_id = json.loads(raw)
+        return float(score), int(entity_id)
+    except (TypeError, ValueError, binascii.Error) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def _boost(rating, popularity):
+    rating_part = min(1.0, float(rating or 0) / 5.0)
+    popularity_part = min(1.0, math.log1p(popularity or 0) / math.log1p(SEARCH_POPULARITY_SATURATION))
+    return 1.0 + SEARCH_RATING_BOOST * rating_part + SEARCH_POPULARITY_BOOST * popularity_part
+
+
+# Per entity type: a queryset-to-rows function giving (pk, rating, popularity).
+# Products carry their restaurant's rating and count their own reviews.
+BOOST_SIGNALS = {
+    'restaurant': lambda queryset: queryset.values_list('pk', 'average_rating', 'total_reviews'),
+    'product': lambda queryset: queryset.annotate(
+        review_count=Count('reviews'),
+    ).values_list('pk', 'restaurant__average_rating', 'review_count'),
+    'category': lambda queryset: ((pk, 0, 0) for pk in queryset.values_list('pk', flat=True)),
+}
+
+
+def search_page(entity_type, query, queryset, page_size, cursor=None, language=None):
+    """
+    One page of objects from queryset matching query, best first.
+
+    Text scores are multiplied by a rating/popularity boost of at most
+    1 + SEARCH_RATING_BOOST + SEARCH_POPULARITY_BOOST, which stays below the
+    2x step between field weights, so a better field match is never outranked
+    by a better-rated entity. Only the SEARCH_MAX_CANDIDATES best text
+    matches are filtered through queryset and boosted, which bounds the
+    count; count_capped tells the caller there were more. Pages follow a
+    keyset cursor on (score, id).
+    """
+    ranked = ranked_entity_ids(entity_type, query, language)
+    candidates = dict(ranked[:SEARCH_MAX_CANDIDATES])
+
+    scored = []
+    ids = list(candidates)
+    for start in range(0, len(ids), SEARCH_FETCH_CHUNK_SIZE):
+        rows = BOOST_SIGNALS[entity_type](queryset.filter(pk__in=ids[start:start + SEARCH_FETCH_CHUNK_SIZE]))
+        for entity_id, rating, popularity in rows:
+            score = round(candidates[entity_id] * _boost(rating, popularity), 4)
+            scored.append((-score, entity_id))
+    scored.sort()
+
+    position = 0
+    if cursor:
+        after_score, after_id = decode_cursor(cursor)
+        position = bisect.bisect_right(scored, (-after_score, after_id))
+    page = scored[position:position + page_size]
+
+    objects = queryset.in_bulk([entity_id for _, entity_id in page])
+    next_cursor = None
+    if position + page_size < len(scored) and page:
+        negative_score, entity_id = page[-1]
+        next_cursor = encode_cursor(-negative_score, entity_id)
+    return SearchPage(
+        objects=[objects[entity_id] for _, entity_id in page if entity_id in objects],
+        count=len(scored),
+        count_capped=len(ranked) > SEARCH_MAX_CANDIDATES,
+        next_cursor=next_cursor,
+    )
+
+
+def _entries(entity_type, entity_id, fields):
+    """Index rows for one entity from (field, language_code, text) triples."""
+    entries = {}
+    for field, language_code, text in fields:
+        for term in index_terms(text):
+            entries.setdefault((term, field, language_code), SearchIndexEntry(
+                term=term,
+                entity_type=entity_type,
+                entity_id=entity_id,
+                field=field,
+                language_code=language_code,
+                weight=FIELD_WEIGHTS[field],
+            ))
+    return list(entries.values())
+
+
+def _restaurant_fields(restaurant):
+    return [
+        ('name', '', restaurant.restaurant_name),
+        ('description', '', restaurant.description),
+    ]
+
+
+def _product_fields(product, translations):
+    fields = [
+        ('name', '', product.product_name),
+        ('description', '', product.description),
+    ]
+    for language_code, name, description in translations:
+        fields.append(('translated_name', language_code, name))
+        fields.append(('translated_description', language_code, description))
+    return fields
+
+
+def _category_fields(category, translations):
+    fields = [('name', '', category.category_name)]
+    for language_code, name, _ in translations:
+        fields.append(('translated_name', language_code, name))
+    return fields
+
+
+def _translations_by_parent(translation_model, parent_field, **filters):
+    by_parent = {}
+    rows = translation_model.objects.filter(**filters).values_list(
+        parent_field, 'language__code', 'translated_name', 'translated_description',
+    )
+    for parent_id, language_code, name, description in rows:
+        by_parent.setdefault(parent_id, []).append((language_code, name, description))
+    return by_parent
+
+
+def _entity_fields(entity_type, entity_id):
+    """(field, language_code, text) triples for one entity, or None if it no longer exists."""
+    if entity_type == 'restaurant':
+        restaurant = Restaurant.objects.filter(pk=entity_id).first()
+        if restaurant is None:
+            return None
+        return _restaurant_fields(restaurant)
+    if entity_type == 'product':
+        product = Product.objects.filter(pk=entity_id).first()
+        if product is None:
+            return None
+        translations = _translations_by_parent(ProductTranslation, 'product_id', product_id=entity_id)
+        return _product_fields(product, translations.get(entity_id, []))
+    category = Category.objects.filter(pk=entity_id).first()
+    if category is None:
+        return None
+    translations = _translations_by_parent(CategoryTranslation, 'category_id', category_id=entity_id)
+    return _category_fields(category, translations.get(entity_id, []))
+
+
+def _iter_documents():
+    """(entity_type, entity_id, fields) for every indexed entity."""
+    product_translations = _translations_by_parent(ProductTranslation, 'product_id')
+    category_translations = _translations_by_parent(CategoryTranslation, 'category_id')
+
+    for restaurant in Restaurant.objects.iterator():
+        yield 'restaurant', restaurant.pk, _restaurant_fields(restaurant)
+    for product in Product.objects.iterator():
+        yield 'product', product.pk, _product_fields(
+            product, product_translations.get(product.pk, []),
+        )
+    for category in Category.objects.iterator():
+        yield 'category', category.pk, _category_fields(
+            category, category_translations.get(category.pk, []),
+        )
+
+
+class _MemoryIndexData:
+    """
+    One generation of MemorySearchIndex.
+
+    Terms are interned and kept in a sorted list for prefix lookups. For each
+    entity type, term and language code ('' for untranslated fields) the
+    postings are two parallel arrays sorted by id: entity ids as array('I')
+    and the best field weight as array('B'). A forward map from entity to
+    its posting keys lets one entity be replaced in place.
+    """
+
+    def __init__(self, version):
+        self.postings = {}
+        self.terms = []
+        self.documents = {}
+        self.version = version
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls, version):
+        data = cls(version)
+        term_set = set()
+        for entity_type, entity_id, fields in _iter_documents():
+            data._add(entity_type, entity_id, fields, term_set)
+        data.terms = sorted(term_set)
+        logger.debug(
+            "Built memory search index: %s documents, %s terms",
+            len(data.documents), len(data.terms),
+        )
+        return data
+
+    def _add(self, entity_type, entity_id, fields, new_terms):
+        best = {}
+        for field, language_code, text in fields:
+            weight = FIELD_WEIGHTS[field]
+            for term in index_terms(text):
+                key = (term, language_code)
+                if weight > best.get(key, 0):
+                    best[key] = weight
+
+        by_term = self.postings.setdefault(entity_type, {})
+        keys = []
+        for (term, language_code), weight in best.items():
+            term = sys.intern(term)
+            by_language = by_term.get(term)
+            if by_language is None:
+                by_language = by_term[term] = {}
+                new_terms.add(term)
+            ids, weights = by_language.setdefault(language_code, (array('I'), array('B')))
+            position = bisect.bisect_left(ids, entity_id)
+            ids.insert(position, entity_id)
+            weights.insert(position, weight)
+            keys.append((term, language_code))
+        if keys:
+            self.documents[(entity_type, entity_id)] = tuple(keys)
+
+    def _remove(self, entity_type, entity_id):
+        by_term = self.postings.get(entity_type, {})
+        for term, language_code in self.documents.pop((entity_type, entity_id), ()):
+            by_language = by_term[term]
+            ids, weights = by_language[language_code]
+            position = bisect.bisect_left(ids, entity_id)
+            if position < len(ids) and ids[position] == entity_id:
+                del ids[position]
+                del weights[position]
+            if not ids:
+                del by_language[language_code]
+                if not by_language:
+                    # Left in the sorted term list until the next rebuild.
+                    del by_term[term]
+
+    def replace(self, entity_type, entity_id, fields):
+        self._remove(entity_type, entity_id)
+        if fields:
+            new_terms = set()
+            self._add(entity_type, entity_id, fields, new_terms)
+            for term in new_terms:
+                position = bisect.bisect_left(self.terms, term)
+                if position == len(self.terms) or self.terms[position] != term:
+                    self.terms.insert(position, term)
+
+    def ranked_entity_ids(self, entity_type, terms, language=None):
+        by_term = self.postings.get(entity_type, {})
+        scores = None
+        for term, is_prefix in terms:
+            if is_prefix:
+                start = bisect.bisect_left(self.terms, term)
+                end = bisect.bisect_left(self.terms, term + '\U0010ffff', start)
+                matched = self.terms[start:end]
+            else:
+                matched = (term,)
+
+            term_scores = {}
+            for matched_term in matched:
+                for language_code, (ids, weights) in by_term.get(matched_term, {}).items():
+                    if language and language_code not in ('', language):
+                        continue
+                    for entity_id, weight in zip(ids, weights):
+                        if weight > term_scores.get(entity_id, 0):
+                            term_scores[entity_id] = weight
+            scores = _intersect_scores(scores, term_scores)
+            if not scores:
+                return []
+        return _ranked(scores)
+
+
+class MemorySearchIndex:
+    """
+    Per-process inverted index with the same terms and weights as
+    search_index_entries.
+
+    The index is built on first use and brought up to date on every query:
+    changes recorded in the shared change log since its version are replayed,
+    and it is rebuilt when it has fallen too far behind or is older than
+    SEARCH_MEMORY_INDEX_MAX_AGE_SECONDS.
+
+    `_lock` only covers in-memory work: reading and patching the current
+    generation and swapping in a new one. Rebuilds and the database reads of
+    a replay run outside it, so queries keep being answered from the current
+    generation meanwhile; one thread rebuilds at a time and the others only
+    wait for it when there is no index yet.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._data = None
+
+    def _needs_rebuild(self, data, version):
+        return (
+            data is None
+            or time.monotonic() - data.built_at > SEARCH_MEMORY_INDEX_MAX_AGE_SECONDS
+            or version < data.version
+            or version - data.version > SEARCH_CHANGE_REPLAY_LIMIT
+        )
+
+    def _rebuild(self, version, wait):
+        if not self._build_lock.acquire(blocking=wait):
+            return
+        try:
+            if not self._needs_rebuild(self._data, version):
+                return
+            data = _MemoryIndexData.build(version)
+            with self._lock:
+                self._data = data
+        finally:
+            self._build_lock.release()
+
+    def apply(self, entity_type, entity_id, fields, version):
+        """Reflect one reindexed entity that this worker just recorded as `version`."""
+        with self._lock:
+            data = self._data
+            if data is None:
+                return
+            data.replace(entity_type, entity_id, fields)
+            # Only skip ahead if no other worker's change came in between.
+            if version == data.version + 1:
+                data.version = version
+
+    def _refresh(self):
+        version = cache.get(SEARCH_INDEX_VERSION_CACHE_KEY, 0)
+        data = self._data
+        if self._needs_rebuild(data, version):
+            self._rebuild(version, wait=data is None)
+            return
+        start = data.version
+        if version == start:
+            return
+
+        keys = [_change_log_key(number) for number in range(start + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            self._rebuild(version, wait=False)
+            return
+        replayed = [
+            (entity_type, entity_id, _entity_fields(entity_type, entity_id))
+            for entity_type, entity_id in dict.fromkeys(changes[key] for key in keys)
+        ]
+        with self._lock:
+            # Another thread replayed or rebuilt meanwhile.
+            if self._data is not data or data.version != start:
+                return
+            for entity_type, entity_id, fields in replayed:
+                data.replace(entity_type, entity_id, fields)
+            data.version = version
+
+    def ranked_entity_ids(self, entity_type, terms, language=None):
+        self._refresh()
+        with self._lock:
+            return self._data.ranked_entity_ids(entity_type, terms, language)
+
+
+memory_search_index = MemorySearchIndex()
+
+
+def _change_log_key(version):
+    return f"search:index_change:{version}"
+
+
+def _record_change(entity_type, entity_id):
+    """Bump the shared index version and log which entity it covers."""
+    version = bump_index_version(SEARCH_INDEX_VERSION_CACHE_KEY)
+    cache.set(_change_log_key(version), (entity_type, entity_id), SEARCH_CHANGE_LOG_TTL_SECONDS)
+    return version
+
+
+def catalog_version():
+    """
+    Shared counter that moves whenever a product, category or one of their
+    translations changes, or a restaurant's name or description does (after
+    commit); use it in cache keys of anything derived from the catalog.
+    Restaurant rating updates leave it alone.
+    """
+    return index_version(SEARCH_INDEX_VERSION_CACHE_KEY)
+
+
+def invalidate_memory_search_indexes():
+    """Make every worker rebuild its memory index on its next query."""
+    try:
+        cache.incr(SEARCH_INDEX_VERSION_CACHE_KEY, SEARCH_CHANGE_REPLAY_LIMIT + 1)
+    except ValueError:
+        cache.set(SEARCH_INDEX_VERSION_CACHE_KEY, SEARCH_CHANGE_REPLAY_LIMIT + 1, None)
+
+
+def reindex_entity(entity_type, entity_id):
+    """Replace the index rows of one entity with its current text (none if deleted)."""
+    fields = _entity_fields(entity_type, entity_id)
+    with transaction.atomic():
+        SearchIndexEntry.objects.filter(entity_type=entity_type, entity_id=entity_id).delete()
+        if fields:
+            SearchIndexEntry.objects.bulk_create(_entries(entity_type, entity_id, fields))
+    version = _record_change(entity_type, entity_id)
+    memory_search_index.apply(entity_type, entity_id, fields, version)
+
+
+def rebuild_search_index():
+    """Rebuild the whole index. Returns the number of rows written."""
+    written = 0
+    with transaction.atomic():
+        SearchIndexEntry.objects.all().delete()
+        batch = []
+        for entity_type, entity_id, fields in _iter_documents():
+            batch.extend(_entries(entity_type, entity_id, fields))
+            if len(batch) >= SEARCH_REBUILD_BATCH_SIZE:
+                SearchIndexEntry.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        SearchIndexEntry.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def _schedule_reindex(entity_type, entity_id):
+    # Index what was committed; a rolled-back save leaves the index alone.
+    transaction.on_commit(lambda: reindex_entity(entity_type, entity_id))
+
+
+# The restaurant fields _restaurant_fields() indexes.
+SEARCH_RESTAURANT_FIELDS = ('restaurant_name', 'description')
+track_indexed_fields(Restaurant, SEARCH_RESTAURANT_FIELDS)
+
+
+@receiver(post_save, sender=Restaurant)
+def update_search_index_on_restaurant_save(sender, instance, **kwargs):
+    if indexed_fields_changed(instance, SEARCH_RESTAURANT_FIELDS):
+        _schedule_reindex('restaurant', instance.pk)
+
+
+@receiver(post_delete, sender=Restaurant)
+def update_search_index_on_restaurant_delete(sender, instance, **kwargs):
+    _schedule_reindex('restaurant', instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_search_index_on_product_change(sender, instance, **kwargs):
+    _schedule_reindex('product', instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def update_search_index_on_category_change(sender, instance, **kwargs):
+    _schedule_reindex('category', instance.pk)
+
+
+@receiver(post_save, sender=ProductTranslation)
+@receiver(post_delete, sender=ProductTranslation)
+def update_search_index_on_product_translation_change(sender, instance, **kwargs):
+    _schedule_reindex('product', instance.product_id)
+
+
+@receiver(post_save, sender=CategoryTranslation)
+@receiver(post_delete, sender=CategoryTranslation)
+def update_search_index_on_category_translation_change(sender, instance, **kwargs):
+    _schedule_reindex('category', instance.category_id)
@@ -0,0 +1,187 @@
+"""
+Write-behind logging of searches.
+
+The search endpoint used to write a SearchHistory row and read-modify-write
+a PopularSearch row on every request, and concurrent searches for the same
+term lost increments. Searches are now recorded in a per-process buffer and
+written by a background thread every SEARCH_LOG_FLUSH_SECONDS, or sooner
+once SEARCH_LOG_FLUSH_SIZE events are waiting: history rows with one
+bulk_create, popularity (the lifetime PopularSearch row and the current
+hour's SearchTrendBucket used for trending) with atomic
+`search_count = search_count + n` updates. Popularity is counted per
+normalized query (see normalize_search_query), so "Pizza" and "pizza " add to
+the same row; history keeps what the user typed. A flush also refreshes
+the trending list when it is due (see search_trending). Events still
+buffered when a worker is killed are lost; the buffer is flushed at normal
+interpreter exit.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import PopularSearch, SearchHistory, SearchTrendBucket
+from .search import normalize_search_query
+from .search_trending import refresh_trending_if_due
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LOG_WRITE_BEHIND = bool(getattr(settings, 'SEARCH_LOG_WRITE_BEHIND', True))
+SEARCH_LOG_FLUSH_SECONDS = float(getattr(settings, 'SEARCH_LOG_FLUSH_SECONDS', 5))
+SEARCH_LOG_FLUSH_SIZE = int(getattr(settings, 'SEARCH_LOG_FLUSH_SIZE', 500))
+# Upper bound on events kept while the database is unavailable.
+SEARCH_LOG_MAX_BUFFERED = int(getattr(settings, 'SEARCH_LOG_MAX_BUFFERED', 10000))
+
+SEARCH_QUERY_MAX_LENGTH = 255
+
+
+class SearchEventBuffer:
+    """Thread-safe buffer of searches flushed to the database in batches."""
+
+    def __init__(self, flush_seconds=SEARCH_LOG_FLUSH_SECONDS, flush_size=SEARCH_LOG_FLUSH_SIZE,
+                 max_buffered=SEARCH_LOG_MAX_BUFFERED):
+        self.flush_seconds = flush_seconds
+        self.flush_size = flush_size
+        self.max_buffered = max_buffered
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._history = []
+        self._query_counts = Counter()
+        self._pending = 0
+        self._dropped = 0
+        self._thread = None
+
+    def record(self, query, user_id=None, search_type='restaurant', results_count=0):
+        """Queue one search. Never touches the database."""
+        query = query[:SEARCH_QUERY_MAX_LENGTH]
+        count_key = normalize_search_query(query)[:SEARCH_QUERY_MAX_LENGTH]
+        with self._lock:
+            if self._pending >= self.max_buffered:
+                self._dropped += 1
+                return
+            if user_id is not None:
+                # Rows are written later; keep the time of the search itself.
+                self._history.append((user_id, query, search_type, results_count, timezone.now()))
+            if count_key:
+                self._query_counts[count_key] += 1
+            self._pending += 1
+            full = self._pending >= self.flush_size
+            if SEARCH_LOG_WRITE_BEHIND:
+                self._ensure_worker()
+        if full:
+            self._wake.set()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='search-log-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Search log flush failed")
+            finally:
+                close_old_connections()
+
+    def _take(self):
+        with self._lock:
+            history, query_counts = self._history, self._query_counts
+            self._history, self._query_counts = [], Counter()
+            self._pending = 0
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            logger.warning("Dropped %s search log events while the buffer was full", dropped)
+        return history, query_counts
+
+    def _restore(self, history, query_counts):
+        with self._lock:
+            self._history[:0] = history
+            self._query_counts.update(query_counts)
+            self._pending = min(self.max_buffered, self._pending + sum(query_counts.values()))
+
+    def flush(self):
+        """Write all buffered events. Returns the number of searches written."""
+        with self._flush_lock:
+            history, query_counts = self._take()
+            if not query_counts:
+                return 0
+            try:
+                _write(history, query_counts)
+            except DatabaseError:
+                logger.warning("Could not write search log, keeping %s events buffered",
+                               sum(query_counts.values()), exc_info=True)
+                self._restore(history, query_counts)
+                return 0
+            try:
+                refresh_trending_if_due()
+            except DatabaseError:
+                logger.warning("Could not refresh trending searches", exc_info=True)
+            return sum(query_counts.values())
+
+
+def _increment_counts(model, query_counts, key_fields, updates):
+    """
+    Add query_counts to model rows identified by search_query plus
+    key_fields. Missing rows are created at zero first so every count is an
+    atomic increment, whichever worker created the row.
+
+    Each query gets its own UPDATE: under MySQL's case- and accent-insensitive
+    collations distinct normalized queries ("cafe", "café") can still match
+    the same row, and a shared `search_query__in` update would then add only
+    one of their counts to it.
+    """
+    model.objects.bulk_create(
+        [model(search_query=query, search_count=0, **key_fields) for query in query_counts],
+        ignore_conflicts=True,
+    )
+    for query, count in query_counts.items():
+        model.objects.filter(search_query=query, **key_fields).update(
+            search_count=F('search_count') + count,
+            **updates,
+        )
+
+
+def _write(history, query_counts):
+    now = timezone.now()
+    bucket_start = now.replace(minute=0, second=0, microsecond=0)
+    with transaction.atomic():
+        SearchHistory.objects.bulk_create([
+            SearchHistory(
+                user_id=user_id,
+                search_query=query,
+                search_type=search_type,
+                results_count=results_count,
+                created_at=created_at,
+            )
+            for user_id, query, search_type, results_count, created_at in history
+        ])
+
+        _increment_counts(
+            PopularSearch, query_counts, {}, {'last_searched': now, 'updated_at': now},
+        )
+        _increment_counts(SearchTrendBucket, query_counts, {'bucket_start': bucket_start}, {})
+
+
+search_event_buffer = SearchEventBuffer()
+atexit.register(search_event_buffer.flush)
+
+
+def record_search(user, query, search_type, results_count):
+    """
+    Log a search for popularity and, for signed-in users, their history.
+    Written in the background unless SEARCH_LOG_WRITE_BEHIND is off.
+    """
+    user_id = user.pk if user.is_authenticated else None
+    search_event_buffer.record(query, user_id, search_type, results_count)
+    if not SEARCH_LOG_WRITE_BEHIND:
+        search_event_buffer.flush()
@@ -0,0 +1,170 @@
+"""
+Search typeahead.
+
+SuggestionIndex keeps restaurant, available product and category names, their
+translations and the most popular past queries as sorted arrays of
+normalized phrases per language, searched by prefix with bisect (the same
+layout as places.PlaceNameIndex). Completions are ranked by how often they
+have been searched. Answers are also cached in the shared cache per
+language, prefix and limit, keyed by the catalog search index version so
+catalog edits invalidate them.
+"""
+import bisect
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .local_index import LocalIndex
+from .models import Category, CategoryTranslation, PopularSearch, Product, ProductTranslation, Restaurant
+from .search import SEARCH_INDEX_VERSION_CACHE_KEY, catalog_version, normalize_search_query
+
+logger = logging.getLogger(__name__)
+
+SEARCH_SUGGEST_INDEX_MAX_AGE_SECONDS = int(getattr(settings, 'SEARCH_SUGGEST_INDEX_MAX_AGE_SECONDS', 300))
+SEARCH_SUGGEST_CACHE_SECONDS = int(getattr(settings, 'SEARCH_SUGGEST_CACHE_SECONDS', 60))
+SEARCH_SUGGEST_POPULAR_LIMIT = int(getattr(settings, 'SEARCH_SUGGEST_POPULAR_LIMIT', 5000))
+# Catalog edits move the index version often; rebuild for them at most this often.
+SEARCH_SUGGEST_MIN_REBUILD_SECONDS = 30
+SEARCH_SUGGEST_MAX_PREFIX_LENGTH = 64
+
+# Catalog names rank above past queries that nobody has searched more often.
+NAME_BASE_SCORE = 1
+
+
+class SuggestionIndex(LocalIndex):
+    """
+    Prefix index of suggestion phrases, one set of parallel sorted arrays per
+    language code ('' for untranslated names and past queries).
+
+    Each phrase is indexed in full and from each later word, so "marg" also
+    completes "Pizza Margherita". A lookup walks the terms starting with the
+    prefix in the '' bucket and the requested language's bucket.
+    """
+    version_cache_key = SEARCH_INDEX_VERSION_CACHE_KEY
+    max_age_seconds = SEARCH_SUGGEST_INDEX_MAX_AGE_SECONDS
+
+    def is_stale(self, version, built_version, age):
+        if version != built_version:
+            return age > SEARCH_SUGGEST_MIN_REBUILD_SECONDS
+        return age > self.max_age_seconds
+
+    def build(self):
+        popularity = {}
+        popular_rows = list(PopularSearch.objects.order_by('-search_count').values_list(
+            'search_query', 'search_count',
+        )[:SEARCH_SUGGEST_POPULAR_LIMIT])
+        for query, count in popular_rows:
+            normalized = normalize_search_query(query)
+            if normalized:
+                popularity[normalized] = popularity.get(normalized, 0) + count
+
+        entries_by_language = {}
+
+        def add(language_code, text, entry_type, entry_id):
+            normalized = normalize_search_query(text)
+            if not normalized:
+                return
+            entries = entries_by_language.setdefault(language_code, {})
+            if normalized not in entries:
+                entries[normalized] = {
+                    'key': normalized,
+                    'text': text.strip(),
+                    'type': entry_type,
+                    'id': entry_id,
+                    'score': NAME_BASE_SCORE + popularity.get(normalized, 0),
+                }
+
+        for pk, name in Restaurant.objects.values_list('restaurant_id', 'restaurant_name').iterator():
+            add('', name, 'restaurant', pk)
+        for pk, name in Category.objects.values_list('category_id', 'category_name').iterator():
+            add('', name, 'category', pk)
+        for pk, name in Product.objects.filter(is_available=True).values_list(
+            'product_id', 'product_name',
+        ).iterator():
+            add('', name, 'product', pk)
+        for pk, language_code, name in CategoryTranslation.objects.values_list(
+            'category_id', 'language__code', 'translated_name',
+        ).iterator():
+            add(language_code, name, 'category', pk)
+        for pk, language_code, name in ProductTranslation.objects.filter(
+            product__is_available=True,
+        ).values_list('product_id', 'language__code', 'translated_name').iterator():
+            add(language_code, name, 'product', pk)
+        for query, _ in popular_rows:
+            add('', query, 'query', None)
+
+        buckets = {}
+        for language_code, entries in entries_by_language.items():
+            terms = []
+            for normalized, entry in entries.items():
+                terms.append((normalized, 0, entry))
+                words = normalized.split(" ")
+                for position in range(1, len(words)):
+                    terms.append((" ".join(words[position:]), 1, entry))
+            terms.sort(key=lambda term: term[:2])
+            buckets[language_code] = (
+                [term for term, _, _ in terms],
+                [(word_match, entry) for _, word_match, entry in terms],
+            )
+
+        logger.debug(
+            "Built search suggestion index: %s",
+            {code or 'base': len(entries) for code, entries in entries_by_language.items()},
+        )
+        return buckets
+
+    def suggest(self, prefix, language, limit, version=None):
+        """(suggestions, version of the catalog the index was built from)."""
+        buckets, built_version = self.get(version)
+        best = {}
+        for language_code in dict.fromkeys(('', language or '')):
+            bucket = buckets.get(language_code)
+            if bucket is None:
+                continue
+            terms, refs = bucket
+            position = bisect.bisect_left(terms, prefix)
+            while position < len(terms) and terms[position].startswith(prefix):
+                word_match, entry = refs[position]
+                rank = (word_match, -entry['score'])
+                if entry['key'] not in best or rank < best[entry['key']][0]:
+                    best[entry['key']] = (rank, entry)
+                position += 1
+
+        ranked = sorted(
+            best.values(),
+            key=lambda item: (item[0], len(item[1]['text']), item[1]['text']),
+        )
+        suggestions = [
+            {'text': entry['text'], 'type': entry['type'], 'id': entry['id']}
+            for _, entry in ranked[:limit]
+        ]
+        return suggestions, built_version
+
+
+suggestion_index = SuggestionIndex()
+
+
+def search_suggestions(query, language=None, limit=8):
+    """Ranked completions for a partially typed search query."""
+    prefix = normalize_search_query(query)[:SEARCH_SUGGEST_MAX_PREFIX_LENGTH]
+    if not prefix:
+        return []
+
+    language = (language or '')[:10]
+    version = catalog_version()
+    prefix_hash = hashlib.md5(prefix.encode()).hexdigest()
+
+    def cache_key(version):
+        return f"search_suggest:{version}:{language}:{limit}:{prefix_hash}"
+
+    suggestions = cache.get(cache_key(version))
+    if suggestions is None:
+        suggestions, built_version = suggestion_index.suggest(prefix, language, limit, version)
+        # An index kept past a catalog change (SEARCH_SUGGEST_MIN_REBUILD_SECONDS)
+        # answers for the version it was built from; caching that under the
+        # current version would outlive the next rebuild.
+        if built_version == version:
+            cache.set(cache_key(version), suggestions, SEARCH_SUGGEST_CACHE_SECONDS)
+    return suggestions
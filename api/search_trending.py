@@ -0,0 +1,96 @@
+"""
+Trending searches.
+
+Searches are rolled up per query and hour in search_trend_buckets by the
+search log flush. Trending is the SEARCH_TRENDING_SIZE queries with the
+highest decayed count over the last SEARCH_TRENDING_WINDOW_HOURS, where a
+search loses half its weight every SEARCH_TRENDING_HALF_LIFE_HOURS. The
+list is computed with a heap and stored in the shared cache by the search
+log flush, at most once every SEARCH_TRENDING_REFRESH_SECONDS across all
+workers, which also deletes buckets that have left the window. Endpoints
+only read the stored list and fall back to lifetime counts while there is
+none.
+"""
+import heapq
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import PopularSearch, SearchTrendBucket
+from .serializers import PopularSearchSerializer
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TRENDING_HALF_LIFE_HOURS = float(getattr(settings, 'SEARCH_TRENDING_HALF_LIFE_HOURS', 24))
+SEARCH_TRENDING_WINDOW_HOURS = int(getattr(settings, 'SEARCH_TRENDING_WINDOW_HOURS', 72))
+SEARCH_TRENDING_REFRESH_SECONDS = int(getattr(settings, 'SEARCH_TRENDING_REFRESH_SECONDS', 300))
+SEARCH_TRENDING_SIZE = 50
+
+TRENDING_CACHE_KEY = 'search:trending'
+TRENDING_REFRESH_LOCK_KEY = 'search:trending:refreshing'
+# Kept until every bucket in it has left the window, in case flushes stop.
+TRENDING_CACHE_SECONDS = SEARCH_TRENDING_WINDOW_HOURS * 3600
+
+
+def compute_trending(now=None):
+    """
+    Serialized PopularSearch rows of the top trending queries, best first,
+    with their decayed `trend_score` and `recent_count` within the window.
+    Buckets older than the window are deleted on the way.
+    """
+    now = now or timezone.now()
+    cutoff = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=SEARCH_TRENDING_WINDOW_HOURS)
+    SearchTrendBucket.objects.filter(bucket_start__lt=cutoff).delete()
+
+    scores = defaultdict(float)
+    recent_counts = defaultdict(int)
+    rows = SearchTrendBucket.objects.filter(bucket_start__gte=cutoff).values_list(
+        'search_query', 'bucket_start', 'search_count',
+    )
+    for query, bucket_start, count in rows.iterator():
+        # Age from the middle of the bucket.
+        age_hours = max(0.0, (now - bucket_start).total_seconds() / 3600 - 0.5)
+        scores[query] += count * 0.5 ** (age_hours / SEARCH_TRENDING_HALF_LIFE_HOURS)
+        recent_counts[query] += count
+
+    top = heapq.nlargest(SEARCH_TRENDING_SIZE, scores.items(), key=lambda item: (item[1], item[0]))
+    # Casefolded so rows that a case-insensitive collation merged still match.
+    popular_by_query = {
+        popular_search.search_query.casefold(): popular_search
+        for popular_search in PopularSearch.objects.filter(search_query__in=[query for query, _ in top])
+    }
+
+    trending = []
+    for query, score in top:
+        popular_search = popular_by_query.get(query.casefold())
+        if popular_search is None:
+            continue
+        item = dict(PopularSearchSerializer(popular_search).data)
+        item['trend_score'] = round(score, 3)
+        item['recent_count'] = recent_counts[query]
+        trending.append(item)
+    return trending
+
+
+def refresh_trending_if_due():
+    """
+    Recompute and store the trending list unless some worker did within
+    SEARCH_TRENDING_REFRESH_SECONDS. Returns the new list, or None when
+    it was not due. Called from the search log flush, never from requests.
+    """
+    if not cache.add(TRENDING_REFRESH_LOCK_KEY, 1, SEARCH_TRENDING_REFRESH_SECONDS):
+        return None
+    trending = compute_trending()
+    cache.set(TRENDING_CACHE_KEY, trending, TRENDING_CACHE_SECONDS)
+    logger.debug("Recomputed trending searches: %s queries", len(trending))
+    return trending
+
+
+def trending_searches(limit=10):
+    """Top trending searches from the precomputed list; empty until the first refresh."""
+    trending = cache.get(TRENDING_CACHE_KEY) or []
+    return trending[:limit]
@@ -11,6 +11,8 @@ from .models import (
     DineInOrderDetail, DineInStatusLog, DineInProduct, DineInProductTranslation,
     EntertainmentVenue, VenueImage, VenueCategory, VenueReview, VenueTranslation
 )
+from .fieldsets import SparseFieldsetMixin
+from .translations import context_language, translations_for_language
 
 
 def get_absolute_image_url(image_url, request=None):
@@ -29,6 +31,57 @@ def get_absolute_image_url(image_url, request=None):
     return image_url
 
 
+def quote_missing_delivery_fee(attrs):
+    """
+    validate() step of the order create serializers: quote delivery_fee on
+    the server when the payload omits it and both ends have coordinates
+    (one distance lookup, one settings read). Without coordinates the fee
+    stays None, i.e. unknown.
+    """
+    from decimal import Decimal
+    from .utils import quote_delivery
+
+    if attrs.get('delivery_fee') is not None:
+        return attrs
+    restaurant = attrs.get('restaurant')
+    delivery_lat = attrs.get('delivery_latitude')
+    delivery_lon = attrs.get('delivery_longitude')
+    if not restaurant or not all([restaurant.latitude, restaurant.longitude, delivery_lat, delivery_lon]):
+        return attrs
+
+    order_items = attrs.get('order_items') or []
+    try:
+        # Clients send ids as numbers or strings; in_bulk() keys are ints.
+        product_ids = [int(item['product_id']) for item in order_items]
+        products = Product.objects.in_bulk(product_ids)
+        items_subtotal = sum(
+            products[product_id].price * item['quantity']
+            for product_id, item in zip(product_ids, order_items)
+        )
+    except (KeyError, TypeError, ValueError):
+        raise serializers.ValidationError({
+            'order_items': 'Each item needs an existing product_id and a quantity',
+        })
+
+    # The fee is charged, so wait for the routed distance instead of racing
+    # it against the display-quote budget.
+    quote = quote_delivery(
+        restaurant.latitude, restaurant.longitude,
+        delivery_lat, delivery_lon,
+        order_subtotal=float(items_subtotal),
+        budget_ms=None,
+    )
+    if not quote.within_delivery_range:
+        raise serializers.ValidationError({
+            'delivery_fee': (
+                f'Delivery location is out of range. '
+                f'Maximum distance is {quote.pricing.max_delivery_distance:.2f} km.'
+            )
+        })
+    attrs['delivery_fee'] = Decimal(str(round(quote.final_fee, 5)))
+    return attrs
+
+
 # User serializer moved to accounts app
 
 
@@ -93,13 +146,11 @@ class CategorySerializer(serializers.ModelSerializer):
         à¸–à¹‰à¸²à¸¡à¸µ ?lang=th à¸ˆà¸°à¸ªà¹ˆà¸‡à¹à¸„à¹ˆ translation à¸ à¸²à¸©à¸²à¹„à¸—à¸¢
         à¸–à¹‰à¸²à¹„à¸¡à¹ˆà¸¡à¸µ à¸ˆà¸°à¸ªà¹ˆà¸‡à¸—à¸¸à¸à¸ à¸²à¸©à¸² (backward compatible)
         """
-        request = self.context.get('request')
-        if request:
-            lang_code = request.query_params.get('lang', None)
-            if lang_code:
-                # à¸ªà¹ˆà¸‡à¹à¸„à¹ˆà¸ à¸²à¸©à¸²à¸—à¸µà¹ˆà¸•à¹‰à¸­à¸‡à¸à¸²à¸£ (optimize performance)
-                filtered_translations = obj.translations.filter(language__code=lang_code)
-                return CategoryTranslationSerializer(filtered_translations, many=True).data
+        lang_code = context_language(self.context)
+        if lang_code:
+            # à¸ªà¹ˆà¸‡à¹à¸„à¹ˆà¸ à¸²à¸©à¸²à¸—à¸µà¹ˆà¸•à¹‰à¸­à¸‡à¸à¸²à¸£ (optimize performance)
+            filtered_translations = translations_for_language(obj, lang_code)
+            return CategoryTranslationSerializer(filtered_translations, many=True).data
         
         # à¸ªà¹ˆà¸‡à¸—à¸¸à¸à¸ à¸²à¸©à¸² (default behavior - backward compatible)
         return CategoryTranslationSerializer(obj.translations.all(), many=True).data
@@ -196,7 +247,7 @@ class ProductTranslationSerializer(serializers.ModelSerializer):
         fields = ['language_code', 'language_name', 'translated_name', 'translated_description']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.category_name', read_only=True)
     restaurant_name = serializers.CharField(source='restaurant.restaurant_name', read_only=True)
     restaurant_id = serializers.IntegerField(source='restaurant.restaurant_id', read_only=True)
@@ -210,6 +261,7 @@ class ProductSerializer(serializers.ModelSerializer):
                  'category_name', 'product_name', 'description', 'price', 
                  'image_url', 'image', 'image_display_url', 'is_available', 'created_at', 'updated_at', 'translations']
         read_only_fields = ['product_id', 'created_at', 'updated_at']
+        field_sources = {'image_display_url': ('image', 'image_url'), 'translations': ()}
     
     def get_image_display_url(self, obj):
         """Get the best available image URL"""
@@ -222,13 +274,11 @@ class ProductSerializer(serializers.ModelSerializer):
         à¸–à¹‰à¸²à¸¡à¸µ ?lang=th à¸ˆà¸°à¸ªà¹ˆà¸‡à¹à¸„à¹ˆ translation à¸ à¸²à¸©à¸²à¹„à¸—à¸¢
         à¸–à¹‰à¸²à¹„à¸¡à¹ˆà¸¡à¸µ à¸ˆà¸°à¸ªà¹ˆà¸‡à¸—à¸¸à¸à¸ à¸²à¸©à¸² (backward compatible)
         """
-        request = self.context.get('request')
-        if request:
-            lang_code = request.query_params.get('lang', None)
-            if lang_code:
-                # à¸ªà¹ˆà¸‡à¹à¸„à¹ˆà¸ à¸²à¸©à¸²à¸—à¸µà¹ˆà¸•à¹‰à¸­à¸‡à¸à¸²à¸£ (optimize performance)
-                filtered_translations = obj.translations.filter(language__code=lang_code)
-                return ProductTranslationSerializer(filtered_translations, many=True).data
+        lang_code = context_language(self.context)
+        if lang_code:
+            # à¸ªà¹ˆà¸‡à¹à¸„à¹ˆà¸ à¸²à¸©à¸²à¸—à¸µà¹ˆà¸•à¹‰à¸­à¸‡à¸à¸²à¸£ (optimize performance)
+            filtered_translations = translations_for_language(obj, lang_code)
+            return ProductTranslationSerializer(filtered_translations, many=True).data
         
         # à¸ªà¹ˆà¸‡à¸—à¸¸à¸à¸ à¸²à¸©à¸² (default behavior - backward compatible)
         return ProductTranslationSerializer(obj.translations.all(), many=True).data
@@ -327,7 +377,19 @@ class ProductSerializer(serializers.ModelSerializer):
         return instance
 
 
-class RestaurantSerializer(serializers.ModelSerializer):
+class ProductListSerializer(ProductSerializer):
+    """
+    Product list rows without descriptions and raw image fields.
+    ?expand= adds any ProductSerializer field.
+    """
+
+    class Meta(ProductSerializer.Meta):
+        fields = ['product_id', 'restaurant', 'restaurant_id', 'restaurant_name', 'restaurant_status', 'category',
+                  'category_name', 'product_name', 'price', 'image_display_url', 'is_available', 'translations']
+        expandable_fields = ['description', 'image_url', 'image', 'created_at', 'updated_at']
+
+
+class RestaurantSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user_username = serializers.CharField(source='user.username', read_only=True)
     products_count = serializers.IntegerField(source='products.count', read_only=True)
     image_display_url = serializers.SerializerMethodField()
@@ -350,6 +412,7 @@ class RestaurantSerializer(serializers.ModelSerializer):
                  'created_at', 'updated_at']
         read_only_fields = ['restaurant_id', 'average_rating', 'total_reviews',
                           'created_at', 'updated_at']
+        field_sources = {'image_display_url': ('image', 'image_url'), 'products_count': ()}
 
     def validate(self, attrs):
         country = attrs['country'] if 'country' in attrs else (self.instance.country if self.instance else None)
@@ -433,6 +496,23 @@ class RestaurantSerializer(serializers.ModelSerializer):
         return instance
 
 
+class RestaurantListSerializer(RestaurantSerializer):
+    """
+    Restaurant list rows: what a restaurant card shows, without bank details,
+    QR codes and descriptions. ?expand= adds any RestaurantSerializer field.
+    """
+    # RestaurantViewSet annotates products_total on the list queryset
+    products_count = serializers.IntegerField(source='products_total', read_only=True)
+
+    class Meta(RestaurantSerializer.Meta):
+        fields = ['restaurant_id', 'restaurant_name', 'address', 'country', 'country_name', 'city', 'city_name',
+                  'latitude', 'longitude', 'is_special', 'opening_hours', 'status', 'image_display_url',
+                  'average_rating', 'total_reviews', 'products_count']
+        expandable_fields = ['user', 'user_username', 'description', 'phone_number', 'image', 'image_url',
+                             'qr_code_image_url', 'bank_account_number', 'bank_name', 'account_name',
+                             'created_at', 'updated_at']
+
+
 class OrderDetailSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.product_name', read_only=True)
     product_image_url = serializers.SerializerMethodField()
@@ -482,7 +562,7 @@ class PaymentSerializer(serializers.ModelSerializer):
         return obj.proof_of_payment_url
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     order_details = OrderDetailSerializer(many=True, read_only=True)
     order_details_by_restaurant = serializers.SerializerMethodField()
     payment = PaymentSerializer(read_only=True)
@@ -501,6 +581,7 @@ class OrderSerializer(serializers.ModelSerializer):
                  'is_reviewed', 'order_details', 'order_details_by_restaurant',
                  'restaurant_count', 'is_multi_restaurant', 'payment']
         read_only_fields = ['order_id', 'order_date']
+        field_sources = {'order_details_by_restaurant': (), 'restaurant_count': (), 'is_multi_restaurant': ()}
     
     def get_order_details_by_restaurant(self, obj):
         """à¸ˆà¸±à¸”à¸à¸¥à¸¸à¹ˆà¸¡ OrderDetail à¸•à¸²à¸¡à¸£à¹‰à¸²à¸™"""
@@ -528,6 +609,10 @@ class OrderSerializer(serializers.ModelSerializer):
     
     def get_restaurant_count(self, obj):
         """à¸™à¸±à¸šà¸ˆà¸³à¸™à¸§à¸™à¸£à¹‰à¸²à¸™à¹ƒà¸™à¸„à¸³à¸ªà¸±à¹ˆà¸‡à¸‹à¸·à¹‰à¸­"""
+        # OrderViewSet annotates it for the whole page
+        restaurant_count = getattr(obj, 'restaurants_in_order', None)
+        if restaurant_count is not None:
+            return restaurant_count
         return obj.order_details.values('product__restaurant').distinct().count()
     
     def get_is_multi_restaurant(self, obj):
@@ -535,6 +620,20 @@ class OrderSerializer(serializers.ModelSerializer):
         return self.get_restaurant_count(obj) > 1
 
 
+class OrderListSerializer(OrderSerializer):
+    """
+    Order list rows without the items and delivery coordinates.
+    ?expand=order_details (or another OrderSerializer field) adds them back.
+    """
+
+    class Meta(OrderSerializer.Meta):
+        fields = ['order_id', 'user', 'customer_name', 'restaurant', 'restaurant_name', 'order_date',
+                  'total_amount', 'delivery_address', 'current_status', 'delivery_fee',
+                  'estimated_delivery_time', 'is_reviewed', 'restaurant_count', 'is_multi_restaurant', 'payment']
+        expandable_fields = ['customer_phone', 'delivery_latitude', 'delivery_longitude',
+                             'order_details', 'order_details_by_restaurant']
+
+
 class CreateOrderSerializer(serializers.ModelSerializer):
     order_items = serializers.ListField(write_only=True)
     
@@ -543,16 +642,19 @@ class CreateOrderSerializer(serializers.ModelSerializer):
         fields = ['user', 'restaurant', 'delivery_address', 'delivery_latitude', 
                  'delivery_longitude', 'delivery_fee', 'order_items']
     
+    def validate(self, attrs):
+        return quote_missing_delivery_fee(attrs)
+    
     def create(self, validated_data):
         order_items = validated_data.pop('order_items')
         
         # Calculate total amount
-        total_amount = validated_data.get('delivery_fee', 0)
+        items_subtotal = 0
         for item in order_items:
             product = Product.objects.get(product_id=item['product_id'])
-            total_amount += product.price * item['quantity']
+            items_subtotal += product.price * item['quantity']
         
-        validated_data['total_amount'] = total_amount
+        validated_data['total_amount'] = (validated_data.get('delivery_fee') or 0) + items_subtotal
         order = Order.objects.create(**validated_data)
         
         # Create order details
@@ -1279,18 +1381,21 @@ class CreateGuestOrderSerializer(serializers.ModelSerializer):
                  'payment_method', 'order_items', 'temporary_id']
         read_only_fields = ['temporary_id']
     
+    def validate(self, attrs):
+        return quote_missing_delivery_fee(attrs)
+    
     def create(self, validated_data):
         order_items = validated_data.pop('order_items')
         
         # à¸„à¸³à¸™à¸§à¸“à¸¢à¸­à¸”à¸£à¸§à¸¡
-        total_amount = validated_data.get('delivery_fee', 0)
+        items_subtotal = 0
         restaurant = validated_data.get('restaurant')
         
         for item in order_items:
             product = Product.objects.get(product_id=item['product_id'])
-            total_amount += product.price * item['quantity']
+            items_subtotal += product.price * item['quantity']
         
-        validated_data['total_amount'] = total_amount
+        validated_data['total_amount'] = (validated_data.get('delivery_fee') or 0) + items_subtotal
         guest_order = GuestOrder.objects.create(**validated_data)
         
         # à¸ªà¸£à¹‰à¸²à¸‡à¸£à¸²à¸¢à¸¥à¸°à¹€à¸­à¸µà¸¢à¸”à¸„à¸³à¸ªà¸±à¹ˆà¸‡à¸‹à¸·à¹‰à¸­
@@ -1428,12 +1533,10 @@ class DineInProductSerializer(serializers.ModelSerializer):
         return get_absolute_image_url(image_url, self.context.get('request'))
 
     def get_translations(self, obj):
-        request = self.context.get('request')
-        if request:
-            lang_code = request.query_params.get('lang', None)
-            if lang_code:
-                filtered_translations = obj.translations.filter(language__code=lang_code)
-                return DineInProductTranslationSerializer(filtered_translations, many=True).data
+        lang_code = context_language(self.context)
+        if lang_code:
+            filtered_translations = translations_for_language(obj, lang_code)
+            return DineInProductTranslationSerializer(filtered_translations, many=True).data
         return DineInProductTranslationSerializer(obj.translations.all(), many=True).data
 
     def create(self, validated_data):
@@ -1731,12 +1834,10 @@ class EntertainmentVenueSerializer(serializers.ModelSerializer):
         read_only_fields = ['venue_id', 'average_rating', 'total_reviews', 'created_at', 'updated_at']
 
     def get_translations(self, obj):
-        request = self.context.get('request')
-        if request:
-            lang_code = request.query_params.get('lang', None)
-            if lang_code:
-                filtered = obj.translations.filter(language__code=lang_code)
-                return VenueTranslationSerializer(filtered, many=True).data
+        lang_code = context_language(self.context)
+        if lang_code:
+            filtered = translations_for_language(obj, lang_code)
+            return VenueTranslationSerializer(filtered, many=True).data
         return VenueTranslationSerializer(obj.translations.all(), many=True).data
 
     def create(self, validated_data):
@@ -1884,12 +1985,10 @@ class EntertainmentVenueListSerializer(serializers.ModelSerializer):
         read_only_fields = ['venue_id', 'average_rating', 'total_reviews', 'created_at']
 
     def get_translations(self, obj):
-        request = self.context.get('request')
-        if request:
-            lang_code = request.query_params.get('lang', None)
-            if lang_code:
-                filtered = obj.translations.filter(language__code=lang_code)
-                return VenueTranslationSerializer(filtered, many=True).data
+        lang_code = context_language(self.context)
+        if lang_code:
+            filtered = translations_for_language(obj, lang_code)
+            return VenueTranslationSerializer(filtered, many=True).data
         return VenueTranslationSerializer(obj.translations.all(), many=True).data
     
     def get_image_display_url(self, obj):
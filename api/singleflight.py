@@ -0,0 +1,116 @@
+"""
+Single-flight coalescing of cache misses.
+
+When several requests miss the cache for the same key at once, only one of
+them (the leader) calls the upstream provider; the others wait and reuse its
+result. Within a process followers wait on an Event and get the leader's
+return value or error. Across processes the leader holds a lock in the
+shared cache for as long as its fetch can take, and followers poll the
+result cache until it is filled or the lock is released.
+"""
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_WAIT_SECONDS = float(getattr(settings, 'SINGLEFLIGHT_WAIT_SECONDS', 15))
+SINGLEFLIGHT_POLL_INTERVAL_SECONDS = float(getattr(settings, 'SINGLEFLIGHT_POLL_INTERVAL_SECONDS', 0.05))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent fetches of the same key.
+
+    do(key, fetch, lookup) returns fetch() for the leader. Followers in the
+    same process wait for the leader and return its result or raise its
+    error; they never call fetch() themselves.
+
+    lookup() must read the cache that fetch() fills and return None on a
+    miss; followers in other processes poll it to pick up the leader's
+    result. If such a follower gives up after wait_seconds, or the leader
+    finished without caching anything (an upstream error), it calls fetch()
+    itself. lock_seconds, the TTL of the cross-process lock, must cover the
+    slowest fetch() (timeouts and retries included) so that no second leader
+    starts while the first is still fetching; it defaults to wait_seconds.
+    """
+
+    def __init__(self, name, wait_seconds=SINGLEFLIGHT_WAIT_SECONDS,
+                 poll_interval=SINGLEFLIGHT_POLL_INTERVAL_SECONDS, lock_seconds=None):
+        self.name = name
+        self.wait_seconds = wait_seconds
+        self.lock_seconds = max(wait_seconds, lock_seconds or 0)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {'leaders': 0, 'local_followers': 0, 'remote_followers': 0}
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def do(self, key, fetch, lookup):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self._count('local_followers')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, fetch, lookup)
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _lead(self, key, fetch, lookup):
+        lock_key = f"singleflight:{self.name}:{key}"
+        lock_ttl = max(1, int(math.ceil(self.lock_seconds)))
+        if cache.add(lock_key, 1, lock_ttl):
+            self._count('leaders')
+            try:
+                return fetch()
+            finally:
+                cache.delete(lock_key)
+
+        # Another process is fetching this key; wait for it to fill the cache.
+        self._count('remote_followers')
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            result = lookup()
+            if result is not None:
+                return result
+            if cache.get(lock_key) is None:
+                break
+        result = lookup()
+        if result is not None:
+            return result
+        return fetch()
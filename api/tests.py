@@ -1,3 +1,1533 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+
+from . import views
+from .geo import (
+    RESTAURANT_INDEX_VERSION_CACHE_KEY, GridIndex, bounding_box, haversine_km, rank_within_radius,
+    restaurant_nearby_index,
+)
+from .local_index import index_version
+from .management.commands.geo_benchmark import STUB_DETOUR_FACTOR, StubProviderServer, _percentile
+from .models import (
+    AppSettings, Category, CategoryTranslation, City, Country, EntertainmentVenue, Language, Order, PopularSearch,
+    Product, ProductTranslation, Restaurant, RouteDistance, SearchHistory, SearchTrendBucket, VenueTranslation,
+)
+from .outbound import CircuitBreaker, CircuitOpenError, OutboundClient, SharedRateLimiter
+from .places import (
+    PLACE_INDEX_VERSION_CACHE_KEY, PLACE_NAME_INDEX_VERSION_CACHE_KEY, local_place_index, place_name_index,
+)
+from .route_cache import LRUCache, RouteDistanceCache, route_distance_cache
+from .search import (
+    MemorySearchIndex, _database_ranked_entity_ids, decode_cursor, encode_cursor, query_terms, ranked_entity_ids,
+    rebuild_search_index, reindex_entity, search_page,
+)
+from .search_log import SearchEventBuffer
+from .search_suggest import search_suggestions, suggestion_index
+from .search_trending import compute_trending, refresh_trending_if_due, trending_searches
+from .singleflight import SingleFlight
+from .route_estimate import ROUTING_DEFAULT_DETOUR_FACTOR, RoadDistanceEstimator
+from .translations import (
+    LANGUAGE_TRANSLATIONS_ATTR, prefetch_language_translations, prefetch_translations, translations_for_language,
+)
+from .utils import DeliveryPricing, DeliveryQuote, _race_provider, calculate_route_distances_km
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_restaurant(name, **fields):
+    user = User.objects.create(username=name.lower().replace(' ', '_'), email=f'{name}@example.com')
+    fields.setdefault('address', 'address')
+    return Restaurant.objects.create(user=user, restaurant_name=name, **fields)
+
+
+class GridIndexTests(SimpleTestCase):
+    def test_query_returns_points_within_radius_nearest_first(self):
+        index = GridIndex(cell_degrees=0.01)
+        index.add(1, 17.96, 102.60)
+        index.add(2, 17.97, 102.60)
+        index.add(3, 17.96, 102.61)
+        index.add(4, 18.20, 102.60)
+
+        matches = index.query(17.96, 102.60, 2)
+        self.assertEqual([pk for pk, _ in matches], [1, 3, 2])
+        self.assertAlmostEqual(matches[2][1], 1.112, places=3)
+
+    def test_ties_are_ordered_by_key(self):
+        index = GridIndex()
+        index.add(5, 0.0, 0.01)
+        index.add(2, 0.0, -0.01)
+        self.assertEqual([pk for pk, _ in index.query(0.0, 0.0, 5)], [2, 5])
+
+    def test_add_moves_and_remove_drops_a_point(self):
+        index = GridIndex(cell_degrees=0.01)
+        index.add(1, 17.96, 102.60)
+        index.add(1, 18.50, 102.60)
+        self.assertEqual(index.query(17.96, 102.60, 5), [])
+        self.assertEqual(len(index), 1)
+        index.remove(1)
+        self.assertEqual(index.query(18.50, 102.60, 5), [])
+        self.assertEqual(len(index), 0)
+
+    def test_radius_larger_than_the_populated_grid(self):
+        index = GridIndex(cell_degrees=0.001)
+        index.add(1, 17.96, 102.60)
+        self.assertEqual([pk for pk, _ in index.query(17.96, 102.60, 50)], [1])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RestaurantNearbyTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.near = create_restaurant('Near', latitude=17.961, longitude=102.600)
+        cls.far = create_restaurant('Far', latitude=17.990, longitude=102.600)
+        cls.closed = create_restaurant('Closed', latitude=17.960, longitude=102.600, status='closed')
+        cls.outside = create_restaurant('Outside', latitude=18.500, longitude=102.600)
+
+    def setUp(self):
+        cache.clear()
+        restaurant_nearby_index._state = None
+
+    def nearby(self, **params):
+        return self.client.get('/api/restaurants/nearby/', {'latitude': 17.96, 'longitude': 102.6, **params})
+
+    def test_open_restaurants_within_radius_nearest_first(self):
+        response = self.nearby(radius=10)
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([item['restaurant_id'] for item in results], [self.near.pk, self.far.pk])
+        self.assertEqual([item['distance_km'] for item in results], [0.11, 3.34])
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEqual(self.nearby(radius='x').status_code, 400)
+        self.assertEqual(self.nearby(radius=0).status_code, 400)
+        self.assertEqual(self.nearby(latitude=95).status_code, 400)
+
+    def test_saves_that_do_not_move_a_restaurant_leave_the_index_alone(self):
+        self.nearby()
+        version = index_version(RESTAURANT_INDEX_VERSION_CACHE_KEY)
+        restaurant = Restaurant.objects.get(pk=self.near.pk)
+        restaurant.average_rating = 4
+        with self.assertNumQueries(1):
+            restaurant.save()
+        restaurant.total_reviews = 3
+        restaurant.save(update_fields=['total_reviews'])
+        self.assertEqual(index_version(RESTAURANT_INDEX_VERSION_CACHE_KEY), version)
+
+    def test_moving_or_closing_a_restaurant_updates_the_index(self):
+        self.nearby()
+        restaurant = Restaurant.objects.get(pk=self.outside.pk)
+        restaurant.latitude = 17.962
+        restaurant.save()
+        ids = [item['restaurant_id'] for item in self.nearby().data['results']]
+        self.assertEqual(ids, [self.near.pk, self.outside.pk, self.far.pk])
+
+        restaurant.status = 'closed'
+        restaurant.save(update_fields=['status'])
+        ids = [item['restaurant_id'] for item in self.nearby().data['results']]
+        self.assertEqual(ids, [self.near.pk, self.far.pk])
+
+    def test_deferred_fields_count_as_changed(self):
+        self.nearby()
+        version = index_version(RESTAURANT_INDEX_VERSION_CACHE_KEY)
+        restaurant = Restaurant.objects.only('restaurant_id', 'restaurant_name').get(pk=self.near.pk)
+        restaurant.save(update_fields=['restaurant_name', 'latitude'])
+        self.assertEqual(index_version(RESTAURANT_INDEX_VERSION_CACHE_KEY), version + 1)
+
+
+class RankWithinRadiusTests(SimpleTestCase):
+    def test_cuts_the_bounding_box_corners_and_orders_by_distance(self):
+        min_lat, max_lat, min_lon, max_lon = bounding_box(17.96, 102.6, 1)
+        corner = (3, max_lat, max_lon)
+        rows = [(1, 17.965, 102.6), corner, (2, 17.961, 102.6), (4, 17.96, 102.6)]
+
+        ranked = rank_within_radius(17.96, 102.6, rows, 1)
+
+        self.assertEqual([pk for pk, _ in ranked], [4, 2, 1])
+        self.assertEqual(ranked[0][1], 0.0)
+
+    def test_box_reaches_the_radius_in_every_direction(self):
+        min_lat, max_lat, min_lon, max_lon = bounding_box(60.0, 10.0, 5)
+        edges = [(1, min_lat, 10.0), (2, max_lat, 10.0), (3, 60.0, min_lon), (4, 60.0, max_lon)]
+        ranked = rank_within_radius(60.0, 10.0, edges, 5.001)
+        self.assertEqual(len(ranked), 4)
+
+    def test_no_candidates(self):
+        self.assertEqual(rank_within_radius(17.96, 102.6, [], 5), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VenueNearbyTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        def venue(name, latitude, longitude, **fields):
+            return EntertainmentVenue.objects.create(
+                venue_name=name, address='address', latitude=latitude, longitude=longitude, **fields,
+            )
+
+        cls.far = venue('Far', 17.990, 102.600)
+        cls.near = venue('Near', 17.961, 102.600)
+        cls.closed = venue('Closed', 17.960, 102.600, status='closed')
+        cls.corner = venue('Corner', 18.040, 102.684)
+
+    def test_open_venues_within_radius_nearest_first(self):
+        response = self.client.get(
+            '/api/entertainment-venues/nearby/', {'latitude': 17.96, 'longitude': 102.6, 'radius': 10},
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([item['venue_id'] for item in results], [self.near.pk, self.far.pk])
+        self.assertEqual(results[1]['distance_km'], 3.34)
+
+    def test_requires_coordinates(self):
+        response = self.client.get('/api/entertainment-venues/nearby/', {'latitude': 17.96})
+        self.assertEqual(response.status_code, 400)
+
+
+def osrm_table_response(distances_m):
+    response = mock.Mock(status_code=200)
+    response.json.return_value = {'code': 'Ok', 'distances': [[distance] for distance in distances_m]}
+    return response
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RouteTableTests(TestCase):
+    destination = (17.96, 102.60)
+
+    def setUp(self):
+        cache.clear()
+        route_distance_cache.clear_local()
+        patcher = mock.patch('api.utils.osrm_client')
+        self.osrm = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def table_sources(self, call):
+        path = call.args[0]
+        return path[len('/table/v1/driving/'):].split(';')[:-1]
+
+    def test_uncached_origins_share_one_table_request(self):
+        self.osrm.get.return_value = osrm_table_response([1500.0, 2500.0])
+        origins = [(17.97, 102.61), (17.98, 102.62), (17.97, 102.61), (None, 102.6)]
+
+        distances = calculate_route_distances_km(origins, self.destination)
+
+        self.assertEqual(distances, [1.5, 2.5, 1.5, None])
+        self.osrm.get.assert_called_once()
+        call = self.osrm.get.call_args
+        self.assertEqual(self.table_sources(call), ['102.6100000,17.9700000', '102.6200000,17.9800000'])
+        self.assertEqual(call.kwargs['params']['sources'], '0;1')
+        self.assertEqual(call.kwargs['params']['destinations'], '2')
+
+    def test_cached_pairs_are_not_requested_again(self):
+        self.osrm.get.return_value = osrm_table_response([1500.0])
+        calculate_route_distances_km([(17.97, 102.61)], self.destination)
+        self.osrm.get.return_value = osrm_table_response([2500.0])
+
+        distances = calculate_route_distances_km([(17.97, 102.61), (17.98, 102.62)], self.destination)
+
+        self.assertEqual(distances, [1.5, 2.5])
+        self.assertEqual(len(self.table_sources(self.osrm.get.call_args)), 1)
+
+    def test_sources_are_split_at_the_table_size_limit(self):
+        self.osrm.get.side_effect = [osrm_table_response([1000.0, 2000.0]), osrm_table_response([3000.0])]
+        origins = [(17.97, 102.61), (17.98, 102.62), (17.99, 102.63)]
+
+        with mock.patch('api.utils.ROUTING_OSRM_TABLE_MAX_SOURCES', 2):
+            distances = calculate_route_distances_km(origins, self.destination)
+
+        self.assertEqual(distances, [1.0, 2.0, 3.0])
+        self.assertEqual(self.osrm.get.call_count, 2)
+
+    def test_failed_or_unroutable_pairs_are_none_and_not_cached(self):
+        self.osrm.get.return_value = osrm_table_response([None, 0])
+        origins = [(17.97, 102.61), (17.98, 102.62)]
+        self.assertEqual(calculate_route_distances_km(origins, self.destination), [None, None])
+
+        self.osrm.get.side_effect = requests.ConnectionError()
+        with self.assertLogs('api.utils', 'WARNING'):
+            self.assertEqual(calculate_route_distances_km(origins, self.destination), [None, None])
+        self.assertEqual(self.osrm.get.call_count, 2)
+
+
+def pricing_settings(**fields):
+    values = {
+        'base_delivery_fee': 20, 'per_km_fee': 5, 'max_delivery_distance': 10,
+        'free_delivery_minimum': 500, 'multi_restaurant_additional_fee': None,
+    }
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+class DeliveryQuoteTests(SimpleTestCase):
+    def test_fee_is_the_base_fee_up_to_the_base_distance_then_per_km(self):
+        pricing = DeliveryPricing(pricing_settings())
+        self.assertEqual(DeliveryQuote(1.5, pricing).final_fee, 20.0)
+        self.assertEqual(DeliveryQuote(2, pricing).final_fee, 20.0)
+        self.assertEqual(DeliveryQuote(4.5, pricing).final_fee, 32.5)
+
+    def test_out_of_range_and_free_delivery_cost_nothing(self):
+        pricing = DeliveryPricing(pricing_settings())
+        out_of_range = DeliveryQuote(12, pricing)
+        self.assertFalse(out_of_range.within_delivery_range)
+        self.assertEqual(out_of_range.fee, 70.0)
+        self.assertEqual(out_of_range.final_fee, 0.0)
+
+        self.assertTrue(DeliveryQuote(4.5, pricing, order_subtotal=500).is_free_delivery)
+        self.assertEqual(DeliveryQuote(4.5, pricing, order_subtotal=500).final_fee, 0.0)
+        self.assertEqual(DeliveryQuote(4.5, pricing, order_subtotal=499.99).final_fee, 32.5)
+
+    def test_unset_settings_fall_back_to_defaults(self):
+        pricing = DeliveryPricing(pricing_settings(
+            base_delivery_fee=None, per_km_fee=None, max_delivery_distance=None,
+            free_delivery_minimum=0, multi_restaurant_additional_fee=0,
+        ))
+        quote = DeliveryQuote(100, pricing, order_subtotal=1000)
+        self.assertTrue(quote.within_delivery_range)
+        self.assertFalse(quote.is_free_delivery)
+        self.assertEqual(quote.final_fee, 20.0 + 98 * 5.0)
+        self.assertEqual(pricing.additional_fee_per_restaurant, DeliveryPricing.DEFAULT_ADDITIONAL_FEE_PER_RESTAURANT)
+
+    def test_as_dict(self):
+        quote = DeliveryQuote(4.567, DeliveryPricing(pricing_settings()), order_subtotal=120.456)
+        self.assertEqual(quote.as_dict(), {
+            'delivery_fee': 32.835,
+            'distance_km': 4.57,
+            'max_delivery_distance_km': 10.0,
+            'free_delivery_minimum_amount': 500.0,
+            'order_subtotal': 120.46,
+            'is_free_delivery': False,
+            'within_delivery_range': True,
+        })
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderDeliveryFeeTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username='customer', email='customer@example.com')
+        cls.restaurant = create_restaurant('Kitchen', latitude=17.96, longitude=102.60)
+        category = Category.objects.create(category_name='Mains', sort_order=1)
+        cls.product = Product.objects.create(
+            restaurant=cls.restaurant, category=category, product_name='Larb', price=Decimal('60'),
+        )
+        AppSettings.objects.update_or_create(pk=1, defaults={
+            'base_delivery_fee': 20, 'per_km_fee': 5, 'max_delivery_distance': 10,
+        })
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.customer)
+        patcher = mock.patch('api.utils.calculate_distance_km', return_value=4.0)
+        self.distance = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def order(self, product_id, **fields):
+        payload = {
+            'user': self.customer.pk,
+            'restaurant': self.restaurant.pk,
+            'delivery_address': 'home',
+            'delivery_latitude': '17.99',
+            'delivery_longitude': '102.62',
+            'order_items': [{'product_id': product_id, 'quantity': 2}],
+        }
+        payload.update(fields)
+        return self.client.post('/api/orders/', payload, format='json')
+
+    def test_missing_fee_is_quoted_for_numeric_and_string_product_ids(self):
+        for product_id in (self.product.pk, str(self.product.pk)):
+            response = self.order(product_id)
+            self.assertEqual(response.status_code, 201, response.data)
+            order = Order.objects.latest('order_id')
+            self.assertEqual(order.delivery_fee, Decimal('30'))
+            self.assertEqual(order.total_amount, Decimal('150'))
+
+    def test_fee_sent_by_the_client_is_kept(self):
+        response = self.order(self.product.pk, delivery_fee='12.50')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Order.objects.get().delivery_fee, Decimal('12.5'))
+        self.distance.assert_not_called()
+
+    def test_fee_stays_unknown_without_coordinates(self):
+        response = self.order(self.product.pk, delivery_latitude=None, delivery_longitude=None)
+        self.assertEqual(response.status_code, 201, response.data)
+        order = Order.objects.get()
+        self.assertIsNone(order.delivery_fee)
+        self.assertEqual(order.total_amount, Decimal('120'))
+
+    def test_unknown_products_are_rejected(self):
+        response = self.order(self.product.pk + 100)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Each item needs an existing product_id', response.data['error'])
+        self.assertFalse(Order.objects.exists())
+
+    def test_order_fee_waits_for_the_routed_distance(self):
+        self.order(self.product.pk)
+        self.assertIsNone(self.distance.call_args.kwargs['budget_ms'])
+
+    def test_out_of_range_delivery_without_a_fee_is_rejected(self):
+        self.distance.return_value = 12.0
+        response = self.order(self.product.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Delivery location is out of range', response.data['error'])
+        self.assertFalse(Order.objects.exists())
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_evicts_the_least_recently_used_entry(self):
+        lru = LRUCache(max_size=2, ttl_seconds=60)
+        lru.set_many({'a': 1, 'b': 2})
+        lru.get_many(['a'])
+        lru.set_many({'c': 3})
+        self.assertEqual(lru.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+
+    def test_entries_expire(self):
+        lru = LRUCache(max_size=2, ttl_seconds=60)
+        with mock.patch('api.route_cache.time.monotonic', return_value=1000.0):
+            lru.set_many({'a': 1})
+        with mock.patch('api.route_cache.time.monotonic', return_value=1061.0):
+            self.assertEqual(lru.get_many(['a']), {})
+        self.assertEqual(len(lru), 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RouteDistanceCacheTests(TestCase):
+    key = 'route_km:17.96:102.6:17.99:102.62'
+
+    def setUp(self):
+        cache.clear()
+        self.routes = RouteDistanceCache()
+
+    def test_set_writes_every_tier(self):
+        self.routes.set(self.key, 3.2)
+        self.assertEqual(self.routes.get(self.key), 3.2)
+        self.assertEqual(cache.get(self.key), 3.2)
+        row = RouteDistance.objects.get(pair_key=self.key)
+        self.assertEqual(
+            (row.origin_latitude, row.origin_longitude, row.destination_latitude, row.destination_longitude),
+            (17.96, 102.6, 17.99, 102.62),
+        )
+        self.assertEqual(self.routes.stats()['local']['hits'], 1)
+
+    def test_lower_tier_hits_are_copied_upwards(self):
+        self.routes.set(self.key, 3.2)
+        self.routes.clear_local()
+        cache.clear()
+
+        self.assertEqual(self.routes.get_many([self.key, 'route_km:1:2:3:4']), {self.key: 3.2})
+        self.assertEqual(cache.get(self.key), 3.2)
+        stats = self.routes.stats()
+        self.assertEqual(stats['local']['misses'], 2)
+        self.assertEqual(stats['shared']['misses'], 2)
+        self.assertEqual((stats['database']['hits'], stats['database']['misses']), (1, 1))
+        self.assertEqual(stats['database']['hit_rate'], 0.5)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.routes.get(self.key), 3.2)
+
+    def test_expired_rows_are_ignored_and_replaced(self):
+        self.routes.set(self.key, 3.2)
+        RouteDistance.objects.update(updated_at=timezone.now() - timedelta(days=181))
+        self.routes.clear_local()
+        cache.clear()
+        self.assertIsNone(self.routes.get(self.key))
+
+        self.routes.set(self.key, 3.5)
+        self.assertEqual(RouteDistance.objects.get().distance_km, 3.5)
+
+
+def route_sample(origin, destination, road_km):
+    (lat1, lon1), (lat2, lon2) = origin, destination
+    return RouteDistance(
+        pair_key=f'route_km:{lat1}:{lon1}:{lat2}:{lon2}', distance_km=road_km,
+        origin_latitude=lat1, origin_longitude=lon1, destination_latitude=lat2, destination_longitude=lon2,
+    )
+
+
+class RoadDistanceEstimatorTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('api.route_estimate._estimate_executor')
+        self.executor = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def straight_km(self, origin, destination):
+        return haversine_km(*origin, *destination)
+
+    def test_factors_are_learned_per_cell_from_cached_routes(self):
+        samples = []
+        for step in range(5):
+            origin, destination = (17.90 + step * 0.01, 102.60), (17.92 + step * 0.01, 102.62)
+            samples.append(route_sample(origin, destination, self.straight_km(origin, destination) * 1.5))
+        far_origin, far_destination = (15.00, 105.00), (15.02, 105.02)
+        samples.append(route_sample(far_origin, far_destination, self.straight_km(far_origin, far_destination) * 2))
+        # Too short to measure, and an implausible ratio.
+        samples.append(route_sample((16.0, 100.0), (16.001, 100.0), 5))
+        samples.append(route_sample((16.5, 100.0), (16.6, 100.0), 500))
+        RouteDistance.objects.bulk_create(samples)
+
+        estimator = RoadDistanceEstimator()
+        estimator.rebuild()
+
+        self.assertAlmostEqual(estimator.detour_factor(17.95, 102.65, 17.95, 102.65), 1.5)
+        self.assertAlmostEqual(estimator.detour_factor(10.0, 100.0, 10.1, 100.0), 1.5)
+        straight = haversine_km(17.95, 102.65, 17.96, 102.65)
+        self.assertAlmostEqual(estimator.estimate_km(17.95, 102.65, 17.96, 102.65), straight * 1.5)
+
+    def test_too_few_routes_use_the_default_factor(self):
+        RouteDistance.objects.bulk_create([route_sample((17.9, 102.6), (17.92, 102.62), 5)])
+        estimator = RoadDistanceEstimator()
+        estimator.rebuild()
+        self.assertEqual(estimator.detour_factor(17.9, 102.6, 17.92, 102.62), ROUTING_DEFAULT_DETOUR_FACTOR)
+
+    def test_a_cold_estimator_answers_at_once_and_builds_in_the_background(self):
+        estimator = RoadDistanceEstimator()
+        with self.assertNumQueries(0):
+            self.assertEqual(estimator.detour_factor(17.9, 102.6, 17.92, 102.62), ROUTING_DEFAULT_DETOUR_FACTOR)
+            estimator.detour_factor(17.9, 102.6, 17.92, 102.62)
+        self.executor.return_value.submit.assert_called_once_with(estimator._rebuild_in_background)
+
+
+class RoutingRaceTests(SimpleTestCase):
+    def test_answers_within_the_budget_are_used(self):
+        self.assertEqual(_race_provider(lambda value: value * 2, None, 1000, 21), 42)
+
+    def test_slow_answers_give_the_default_and_still_finish(self):
+        release = threading.Event()
+        finished = threading.Event()
+
+        def slow():
+            release.wait(5)
+            finished.set()
+            return 42
+
+        self.assertEqual(_race_provider(slow, 'estimate', 20), 'estimate')
+        release.set()
+        self.assertTrue(finished.wait(5))
+
+    def test_no_budget_calls_the_provider_directly(self):
+        caller = threading.current_thread()
+        self.assertIs(_race_provider(threading.current_thread, None, None), caller)
+
+    def test_full_queue_skips_the_provider(self):
+        provider = mock.Mock()
+        with mock.patch('api.utils._routing_race_slots', threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            self.assertEqual(_race_provider(provider, 'estimate', 1000), 'estimate')
+        provider.assert_not_called()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('api.outbound.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+
+    def test_opens_after_threshold_consecutive_failures(self):
+        self.assertFalse(self.breaker.record_failure())
+        self.assertFalse(self.breaker.record_failure())
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+        self.assertTrue(self.breaker.record_failure())
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_success_resets_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.record_failure())
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_one_trial_through(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 29
+        self.assertFalse(self.breaker.allow_request())
+
+        self.clock.now += 1
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_trial_success_closes(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 30
+        self.breaker.allow_request()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_trial_failure_reopens_for_another_reset_period(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 30
+        self.breaker.allow_request()
+        self.assertTrue(self.breaker.record_failure())
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.clock.now += 29
+        self.assertFalse(self.breaker.allow_request())
+        self.clock.now += 1
+        self.assertTrue(self.breaker.allow_request())
+
+
+class OutboundClientTests(SimpleTestCase):
+    def setUp(self):
+        self.client = OutboundClient('test', 'http://provider.invalid/', read_timeout=1, failure_threshold=2)
+        self.session = mock.Mock()
+        self.client._session = lambda: self.session
+
+    def response(self, status_code):
+        return mock.Mock(status_code=status_code)
+
+    def test_server_errors_open_the_breaker_and_short_circuit(self):
+        self.session.get.return_value = self.response(503)
+        with self.assertLogs('api.outbound', 'WARNING'):
+            self.client.get('/route')
+            self.client.get('/route')
+
+        with self.assertRaises(CircuitOpenError):
+            self.client.get('/route')
+        self.assertEqual(self.session.get.call_count, 2)
+        stats = self.client.stats()
+        self.assertEqual(stats['errors'], 2)
+        self.assertEqual(stats['short_circuited'], 1)
+        self.assertEqual(stats['breaker_state'], CircuitBreaker.OPEN)
+
+    def test_transport_errors_count_as_failures(self):
+        self.session.get.side_effect = requests.ConnectionError()
+        with self.assertLogs('api.outbound', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(requests.ConnectionError):
+                    self.client.get('/route')
+        with self.assertRaises(CircuitOpenError):
+            self.client.get('/route')
+
+    def test_rate_limited_responses_do_not_trip_the_breaker(self):
+        self.session.get.return_value = self.response(429)
+        for _ in range(3):
+            self.assertEqual(self.client.get('/search').status_code, 429)
+        stats = self.client.stats()
+        self.assertEqual(stats['rate_limited'], 3)
+        self.assertEqual(stats['breaker_state'], CircuitBreaker.CLOSED)
+
+    def test_requests_go_to_base_url_with_client_timeout(self):
+        self.session.get.return_value = self.response(200)
+        self.client.get('/search', params={'q': 'x'})
+        self.session.get.assert_called_once_with(
+            'http://provider.invalid/search', params={'q': 'x'}, headers=None, timeout=self.client.timeout,
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@override_settings(CACHES=LOCMEM_CACHES)
+class SharedRateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        self.clock.now = 100.2
+        patcher = mock.patch('api.outbound.time.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_spaces_consecutive_reservations_one_interval_apart(self):
+        limiter = SharedRateLimiter('test', interval_seconds=1, max_wait_seconds=5)
+
+        waits = [limiter.reserve() for _ in range(3)]
+
+        self.assertEqual(waits[0], 0.0)
+        self.assertAlmostEqual(waits[1], 1.8)
+        self.assertAlmostEqual(waits[2], 2.8)
+
+    def test_returns_none_when_no_slot_is_free_within_max_wait(self):
+        limiter = SharedRateLimiter('test', interval_seconds=1, max_wait_seconds=2)
+
+        self.assertEqual(limiter.reserve(), 0.0)
+        self.assertAlmostEqual(limiter.reserve(), 1.8)
+        self.assertIsNone(limiter.reserve())
+
+        self.clock.now += 2
+        self.assertIsNotNone(limiter.reserve())
+
+    def test_workers_with_the_same_name_share_one_budget(self):
+        first = SharedRateLimiter('shared', interval_seconds=1, max_wait_seconds=5)
+        second = SharedRateLimiter('shared', interval_seconds=1, max_wait_seconds=5)
+        other = SharedRateLimiter('other', interval_seconds=1, max_wait_seconds=5)
+
+        self.assertEqual(first.reserve(), 0.0)
+        self.assertAlmostEqual(second.reserve(), 1.8)
+        self.assertEqual(other.reserve(), 0.0)
+
+    def test_zero_interval_never_waits(self):
+        limiter = SharedRateLimiter('test', interval_seconds=0, max_wait_seconds=0)
+
+        self.assertEqual([limiter.reserve() for _ in range(3)], [0.0, 0.0, 0.0])
+
+    def test_busy_limiter_answers_429_without_calling_nominatim(self):
+        with mock.patch('api.views.nominatim_rate_limiter.reserve', return_value=None), \
+                mock.patch('api.views.nominatim_client.get') as get:
+            data, error_response = views._nominatim_fetch('reverse', {}, 'nominatim:test')
+
+        self.assertIsNone(data)
+        self.assertEqual(error_response.status_code, 429)
+        get.assert_not_called()
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight('test', wait_seconds=2, poll_interval=0.01)
+
+    def run_concurrently(self, key, fetch, followers=4):
+        """Start a leader blocked in fetch(), then followers; return their outcomes."""
+        started = threading.Event()
+        release = threading.Event()
+        outcomes = []
+
+        def blocking_fetch():
+            started.set()
+            release.wait(5)
+            return fetch()
+
+        def call(function):
+            try:
+                outcomes.append(('result', self.flight.do(key, function, lambda: None)))
+            except Exception as exc:
+                outcomes.append(('error', exc))
+
+        leader = threading.Thread(target=call, args=(blocking_fetch,))
+        leader.start()
+        started.wait(5)
+        threads = [
+            threading.Thread(target=call, args=(lambda: self.fail('follower fetched'),))
+            for _ in range(followers)
+        ]
+        for thread in threads:
+            thread.start()
+        while self.flight.stats()['local_followers'] < followers:
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in [leader, *threads]:
+            thread.join(5)
+        return outcomes
+
+    def test_local_followers_share_the_leader_result(self):
+        fetch = mock.Mock(return_value='value')
+        outcomes = self.run_concurrently('key', fetch)
+
+        fetch.assert_called_once_with()
+        self.assertEqual(outcomes, [('result', 'value')] * 5)
+        self.assertEqual(self.flight.stats(), {'leaders': 1, 'local_followers': 4, 'remote_followers': 0})
+        self.assertIsNone(cache.get('singleflight:test:key'))
+
+    def test_local_followers_get_the_leader_error(self):
+        error = requests.Timeout('upstream timed out')
+        outcomes = self.run_concurrently('key', mock.Mock(side_effect=error))
+
+        self.assertEqual(outcomes, [('error', error)] * 5)
+
+    def test_remote_follower_picks_up_the_other_process_result(self):
+        cache.add('singleflight:test:key', 1, 10)
+        lookups = iter([None, None, 'cached'])
+        fetch = mock.Mock()
+
+        result = self.flight.do('key', fetch, lambda: next(lookups))
+
+        self.assertEqual(result, 'cached')
+        fetch.assert_not_called()
+        self.assertEqual(self.flight.stats()['remote_followers'], 1)
+
+    def test_remote_follower_fetches_when_the_lock_is_released_without_a_result(self):
+        cache.add('singleflight:test:key', 1, 10)
+
+        def lookup():
+            cache.delete('singleflight:test:key')
+            return None
+
+        self.assertEqual(self.flight.do('key', lambda: 'fetched', lookup), 'fetched')
+
+    def test_lock_outlives_the_wait_for_slow_fetches(self):
+        flight = SingleFlight('slow', wait_seconds=2, lock_seconds=90.5)
+        with mock.patch('api.singleflight.cache') as shared_cache:
+            shared_cache.add.return_value = True
+            flight.do('key', lambda: 'value', lambda: None)
+        shared_cache.add.assert_called_once_with('singleflight:slow:key', 1, 91)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@override_settings(CACHES=LOCMEM_CACHES)
+class LocalPlaceIndexTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        local_place_index._state = None
+        place_name_index._state = None
+        self.restaurant = create_restaurant(
+            'Pizza Palace', latitude=Decimal('13.756300'), longitude=Decimal('100.501800'),
+        )
+
+    def test_reverse_geocode_snaps_to_a_nearby_place_without_the_provider(self):
+        with mock.patch('api.views.nominatim_client.get') as get:
+            response = self.client.get('/api/geocode/reverse/', {'lat': '13.75631', 'lon': '100.50181'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['source'], 'local_index')
+        self.assertEqual(response.data['place']['id'], self.restaurant.restaurant_id)
+        get.assert_not_called()
+
+    def test_moving_a_place_keeps_the_name_index(self):
+        place_name_index.search('pizza', 5)
+        name_version = index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY)
+
+        self.restaurant.latitude = Decimal('13.800000')
+        self.restaurant.address = 'new address'
+        self.restaurant.save()
+
+        self.assertEqual(index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY), name_version)
+        self.assertGreater(index_version(PLACE_INDEX_VERSION_CACHE_KEY), 0)
+        with mock.patch.object(place_name_index, 'build', wraps=place_name_index.build) as build:
+            [hit] = place_name_index.search('pizza', 5)
+        build.assert_not_called()
+        self.assertEqual(hit['lat'], 13.8)
+        self.assertIn('new address', hit['display_parts'])
+
+    def test_renaming_a_place_rebuilds_the_name_index(self):
+        place_name_index.search('pizza', 5)
+        name_version = index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY)
+
+        self.restaurant.restaurant_name = 'Noodle Bar'
+        self.restaurant.save()
+
+        self.assertGreater(index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY), name_version)
+        self.assertEqual(place_name_index.search('pizza', 5), [])
+        self.assertEqual([hit['name'] for hit in place_name_index.search('noodle', 5)], ['Noodle Bar'])
+
+    def test_clearing_coordinates_rebuilds_the_name_index(self):
+        name_version = index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY)
+
+        self.restaurant.latitude = None
+        self.restaurant.save()
+
+        self.assertGreater(index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY), name_version)
+        self.assertEqual(place_name_index.search('pizza', 5), [])
+
+    def test_saves_not_touching_place_fields_bump_neither_index(self):
+        versions = (index_version(PLACE_INDEX_VERSION_CACHE_KEY), index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY))
+
+        self.restaurant.total_reviews = 4
+        self.restaurant.save()
+
+        self.assertEqual(
+            (index_version(PLACE_INDEX_VERSION_CACHE_KEY), index_version(PLACE_NAME_INDEX_VERSION_CACHE_KEY)),
+            versions,
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PlaceNameSearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.laos = Country.objects.create(name='Laos')
+        cls.vientiane = City.objects.create(country=cls.laos, name='Vientiane')
+        City.objects.create(country=cls.laos, name='Vang Vieng')
+        cls.palace = create_restaurant(
+            'Pizza Palace', latitude=17.96, longitude=102.60, city=cls.vientiane, country=cls.laos,
+        )
+        cls.pad = create_restaurant(
+            'Palace Pad Thai', latitude=17.98, longitude=102.62, city=cls.vientiane, country=cls.laos,
+        )
+        cls.club = EntertainmentVenue.objects.create(
+            venue_name='Sky Club', address='address', latitude=17.97, longitude=102.61,
+        )
+        VenueTranslation.objects.create(
+            venue=cls.club, language=Language.objects.create(code='lo', name='Lao'), translated_name='Ban Fah',
+        )
+
+    def setUp(self):
+        cache.clear()
+        local_place_index._state = None
+        place_name_index._state = None
+
+    def names(self, query, limit=5):
+        return [(hit['type'], hit['name']) for hit in place_name_index.search(query, limit)]
+
+    def test_whole_name_matches_rank_before_later_word_matches(self):
+        self.assertEqual(
+            self.names('palace'),
+            [('restaurant', 'Palace Pad Thai'), ('restaurant', 'Pizza Palace')],
+        )
+
+    def test_matches_venue_translations(self):
+        self.assertEqual(self.names('ban f'), [('venue', 'Sky Club')])
+
+    def test_cities_sit_at_the_centroid_of_their_places(self):
+        [city] = place_name_index.search('vien', 5)
+
+        self.assertEqual(city['type'], 'city')
+        self.assertAlmostEqual(city['lat'], 17.97)
+        self.assertAlmostEqual(city['lon'], 102.61)
+        self.assertEqual(self.names('vang'), [])
+
+    def test_short_queries_are_not_searched(self):
+        self.assertEqual(self.names('p'), [])
+
+    def test_endpoint_skips_the_provider_when_local_hits_fill_the_limit(self):
+        with mock.patch('api.views.nominatim_client.get') as get:
+            response = self.client.get('/api/geocode/search/', {'q': 'Palace', 'limit': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([hit['place_id'] for hit in response.data], [
+            f'local:restaurant:{self.pad.pk}', f'local:restaurant:{self.palace.pk}',
+        ])
+        get.assert_not_called()
+
+    def test_endpoint_tops_up_local_hits_from_the_provider(self):
+        provider = mock.Mock(status_code=200)
+        provider.json.return_value = [{'place_id': 1, 'display_name': 'Sky Tower'}]
+        with mock.patch('api.views.nominatim_client.get', return_value=provider):
+            response = self.client.get('/api/geocode/search/', {'q': 'sky', 'limit': 3})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([hit['place_id'] for hit in response.data], [f'local:venue:{self.club.pk}', 1])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DeliversHereTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.near = create_restaurant('Near', latitude=17.961, longitude=102.600)
+        cls.winding = create_restaurant('Winding', latitude=17.970, longitude=102.600)
+        AppSettings.objects.update_or_create(pk=1, defaults={
+            'base_delivery_fee': 20, 'per_km_fee': 5, 'max_delivery_distance': 10, 'free_delivery_minimum': 500,
+        })
+
+    def setUp(self):
+        cache.clear()
+        restaurant_nearby_index._state = None
+        road_km = {(17.961, 102.6): 4.5, (17.97, 102.6): 12.0}
+        patcher = mock.patch(
+            'api.utils.calculate_distances_km',
+            side_effect=lambda origins, destination: [road_km[(float(lat), float(lon))] for lat, lon in origins],
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **params):
+        return self.client.get('/api/restaurants/delivers_here/', {'latitude': 17.96, 'longitude': 102.6, **params})
+
+    def test_quotes_restaurants_in_road_range_nearest_first(self):
+        response = self.get(order_subtotal='120')
+
+        self.assertEqual(response.status_code, 200)
+        [item] = response.data['results']
+        self.assertEqual(item['restaurant_id'], self.near.pk)
+        self.assertEqual(item['distance_km'], 4.5)
+        self.assertEqual(item['delivery_fee'], 32.5)
+        self.assertFalse(item['is_free_delivery'])
+
+    def test_free_delivery_above_the_minimum(self):
+        [item] = self.get(order_subtotal='500').data['results']
+        self.assertEqual(item['delivery_fee'], 0.0)
+        self.assertTrue(item['is_free_delivery'])
+
+    def test_rejects_non_finite_and_negative_subtotals(self):
+        for value in ('nan', 'inf', '-inf', '-1', 'abc'):
+            with self.subTest(value=value):
+                response = self.get(order_subtotal=value)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('order_subtotal', response.data['error'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkDeliveryQuoteTests(APITestCase):
+    url = '/api/calculate-bulk-delivery-fee/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.near = create_restaurant('Near', latitude=17.961, longitude=102.600)
+        cls.far = create_restaurant('Far', latitude=17.990, longitude=102.600)
+        cls.unplaced = create_restaurant('Unplaced')
+        AppSettings.objects.update_or_create(pk=1, defaults={
+            'base_delivery_fee': 20, 'per_km_fee': 5, 'max_delivery_distance': 10, 'free_delivery_minimum': 500,
+        })
+
+    def post(self, items, **fields):
+        data = {'items': items, 'delivery_latitude': 17.96, 'delivery_longitude': 102.6, **fields}
+        return self.client.post(self.url, data, format='json')
+
+    def test_quotes_each_item_from_one_batched_distance_lookup(self):
+        items = [
+            {'restaurant_id': self.near.pk, 'order_subtotal': 120},
+            {'restaurant_id': str(self.far.pk), 'order_subtotal': 600},
+            {'restaurant_id': 999999},
+            {'restaurant_id': self.unplaced.pk},
+            {'restaurant_id': self.near.pk, 'order_subtotal': 'nan'},
+        ]
+        with mock.patch('api.utils.calculate_distances_km', return_value=[4.5, 12.0]) as distances:
+            response = self.post(items)
+
+        self.assertEqual(response.status_code, 200)
+        distances.assert_called_once()
+        self.assertEqual(len(distances.call_args.args[0]), 2)
+        self.assertEqual(response.data['max_delivery_distance_km'], 10.0)
+        near, far, missing, unplaced, invalid = response.data['quotes']
+        self.assertEqual((near['restaurant_id'], near['delivery_fee']), (self.near.pk, 32.5))
+        self.assertTrue(near['within_delivery_range'])
+        self.assertEqual((far['restaurant_id'], far['error_code']), (self.far.pk, 'out_of_delivery_range'))
+        self.assertEqual(missing['error_code'], 'restaurant_not_found')
+        self.assertEqual(unplaced['error_code'], 'restaurant_location_missing')
+        self.assertEqual(invalid['error_code'], 'invalid_order_subtotal')
+
+    def test_rejects_bad_requests(self):
+        too_many = [{'restaurant_id': self.near.pk}] * 101
+        for case, (items, fields) in enumerate((
+            ([], {}),
+            ({'restaurant_id': self.near.pk}, {}),
+            (too_many, {}),
+            ([{'restaurant_id': self.near.pk}], {'delivery_latitude': 'nan'}),
+            ([{'restaurant_id': self.near.pk}], {'delivery_longitude': 181}),
+        )):
+            with self.subTest(case=case):
+                self.assertEqual(self.post(items, **fields).status_code, 400)
+
+
+class GeoBenchmarkStubTests(SimpleTestCase):
+    def setUp(self):
+        self.stub = StubProviderServer(osrm_latency_ms=0, nominatim_latency_ms=0).start()
+        self.addCleanup(self.stub.stop)
+
+    def test_table_answers_haversine_times_the_detour_factor(self):
+        response = requests.get(
+            f'{self.stub.base_url}/table/v1/driving/102.6,17.96;102.6,17.97',
+            params={'sources': '0', 'destinations': '1'},
+            timeout=5,
+        )
+
+        self.assertEqual(response.status_code, 200)
+        [[meters]] = response.json()['distances']
+        self.assertAlmostEqual(meters / 1000, haversine_km(17.96, 102.6, 17.97, 102.6) * STUB_DETOUR_FACTOR, places=3)
+        self.assertEqual(self.stub.calls, {'table': 1})
+
+    def test_rate_limit_ratio_answers_429_with_retry_after(self):
+        self.stub.rate_limit_ratio = 1.0
+        response = requests.get(f'{self.stub.base_url}/search', params={'q': 'wat'}, timeout=5)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    def test_percentile_uses_nearest_rank(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(_percentile(values, 50), 50.0)
+        self.assertEqual(_percentile(values, 95), 95.0)
+        self.assertIsNone(_percentile([], 95))
+
+
+class SearchTestCase(TestCase):
+    """Two restaurants, five soups and two translations, indexed by rebuild_search_index()."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pizza_place = create_restaurant('Pizza Place')
+        cls.noodle_bar = create_restaurant('Noodle Bar', description='Also serves pizza', average_rating=5)
+        cls.category = Category.objects.create(category_name='Soups', sort_order=1)
+        cls.soups = [
+            Product.objects.create(
+                restaurant=cls.noodle_bar, category=cls.category, product_name=f'Tom Yum Soup {number}', price=50,
+            )
+            for number in range(5)
+        ]
+        thai = Language.objects.create(code='th', name='Thai')
+        lao = Language.objects.create(code='lo', name='Lao')
+        ProductTranslation.objects.create(product=cls.soups[0], language=thai, translated_name='ต้มยำ')
+        ProductTranslation.objects.create(product=cls.soups[1], language=lao, translated_name='ຕົ້ມຍຳ')
+
+    def setUp(self):
+        cache.clear()
+        rebuild_search_index()
+
+
+class SearchIndexTests(SearchTestCase):
+    def test_name_matches_weigh_more_than_description_matches(self):
+        self.assertEqual(
+            ranked_entity_ids('restaurant', 'pizza'),
+            [(self.pizza_place.pk, 8), (self.noodle_bar.pk, 4)],
+        )
+
+    def test_words_match_by_prefix_and_all_terms_must_match(self):
+        self.assertEqual([entity_id for entity_id, _ in ranked_entity_ids('restaurant', 'noo')], [self.noodle_bar.pk])
+        self.assertEqual(ranked_entity_ids('restaurant', 'noodle pizza'), [(self.noodle_bar.pk, 12)])
+        self.assertEqual(ranked_entity_ids('restaurant', 'pizza sushi'), [])
+
+    def test_translations_only_match_in_their_language(self):
+        matches = ranked_entity_ids('product', 'ต้มยำ', language='th')
+        self.assertEqual([entity_id for entity_id, _ in matches], [self.soups[0].pk])
+        self.assertEqual(ranked_entity_ids('product', 'ต้มยำ', language='lo'), [])
+
+
+class MemorySearchIndexTests(SearchTestCase):
+    def test_ranks_like_the_database(self):
+        index = MemorySearchIndex()
+        for entity_type, query, language in [
+            ('restaurant', 'pizza', None),
+            ('restaurant', 'no', None),
+            ('product', 'tom soup', None),
+            ('product', 'ต้ม', 'th'),
+            ('category', 'sou', None),
+        ]:
+            terms = query_terms(query)
+            self.assertEqual(
+                index.ranked_entity_ids(entity_type, terms, language),
+                _database_ranked_entity_ids(entity_type, terms, language),
+                (entity_type, query, language),
+            )
+
+    def test_replays_changes_logged_by_other_workers(self):
+        index = MemorySearchIndex()
+        terms = query_terms('pizza')
+        index.ranked_entity_ids('restaurant', terms)
+
+        Restaurant.objects.filter(pk=self.pizza_place.pk).update(restaurant_name='Sushi Place')
+        reindex_entity('restaurant', self.pizza_place.pk)
+
+        self.assertEqual(index.ranked_entity_ids('restaurant', terms), [(self.noodle_bar.pk, 4)])
+        self.assertEqual(index.ranked_entity_ids('restaurant', query_terms('sushi')), [(self.pizza_place.pk, 8)])
+
+
+class SearchPageTests(SearchTestCase):
+    def test_name_matches_outrank_better_rated_description_matches(self):
+        page = search_page('restaurant', 'pizza', Restaurant.objects.all(), page_size=10)
+        self.assertEqual(page.objects, [self.pizza_place, self.noodle_bar])
+        self.assertEqual(page.count, 2)
+        self.assertIsNone(page.next_cursor)
+
+    def test_rating_breaks_ties_between_equal_text_matches(self):
+        other = create_restaurant('Other', average_rating=1)
+        soup = Product.objects.create(restaurant=other, category=self.category, product_name='Tom Yum Soup', price=50)
+        rebuild_search_index()
+
+        page = search_page('product', 'tom yum soup', Product.objects.all(), page_size=10)
+        self.assertEqual(page.objects[-1], soup)
+
+    def test_queryset_filters_the_matches(self):
+        page = search_page('product', 'soup', Product.objects.exclude(pk=self.soups[0].pk), page_size=10)
+        self.assertEqual(page.objects, self.soups[1:])
+        self.assertEqual(page.count, 4)
+
+    def test_cursor_pages_through_every_match_once(self):
+        queryset = Product.objects.all()
+        seen = []
+        cursor = None
+        while True:
+            page = search_page('product', 'soup', queryset, page_size=2, cursor=cursor)
+            self.assertEqual(page.count, 5)
+            seen.extend(product.pk for product in page.objects)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, [product.pk for product in self.soups])
+
+    def test_invalid_cursor_raises_value_error(self):
+        self.assertEqual(decode_cursor(encode_cursor(12.5, 7)), (12.5, 7))
+        for cursor in ('garbage!', encode_cursor('x', 1), 'W10'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class SearchEventBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='searcher', email='searcher@example.com')
+
+    def setUp(self):
+        patcher = mock.patch('api.search_log.SEARCH_LOG_WRITE_BEHIND', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buffer = SearchEventBuffer()
+
+    def test_counts_queries_differing_only_by_case_and_spacing_together(self):
+        for query in ('Pizza', 'pizza ', ' PIZZA', 'Noodle  Bar'):
+            self.buffer.record(query)
+
+        self.assertEqual(self.buffer.flush(), 4)
+        self.assertEqual(
+            dict(PopularSearch.objects.values_list('search_query', 'search_count')),
+            {'pizza': 3, 'noodle bar': 1},
+        )
+        self.assertEqual(
+            dict(SearchTrendBucket.objects.values_list('search_query', 'search_count')),
+            {'pizza': 3, 'noodle bar': 1},
+        )
+
+    def test_later_flushes_increment_existing_rows(self):
+        self.buffer.record('pizza')
+        self.buffer.flush()
+        self.buffer.record('Pizza')
+        self.buffer.record('pizza')
+        self.buffer.flush()
+
+        self.assertEqual(PopularSearch.objects.get().search_count, 3)
+
+    def test_history_is_kept_for_signed_in_users_as_typed(self):
+        self.buffer.record('Pizza', user_id=self.user.pk, results_count=2)
+        self.buffer.record('pizza')
+        self.buffer.flush()
+
+        history = SearchHistory.objects.get()
+        self.assertEqual((history.user_id, history.search_query, history.results_count), (self.user.pk, 'Pizza', 2))
+
+    def test_failed_flush_keeps_events_for_the_next_one(self):
+        self.buffer.record('pizza', user_id=self.user.pk)
+        with mock.patch('api.search_log._write', side_effect=DatabaseError), self.assertLogs('api.search_log'):
+            self.assertEqual(self.buffer.flush(), 0)
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(PopularSearch.objects.get().search_count, 1)
+        self.assertEqual(SearchHistory.objects.count(), 1)
+
+    def test_nothing_is_written_until_flush(self):
+        self.buffer.record('pizza')
+
+        self.assertFalse(PopularSearch.objects.exists())
+
+
+class SearchSuggestionTests(SearchTestCase):
+    def setUp(self):
+        super().setUp()
+        suggestion_index._state = None
+
+    def texts(self, query, language=None, limit=8):
+        return [suggestion['text'] for suggestion in search_suggestions(query, language, limit)]
+
+    def test_completes_names_from_any_word(self):
+        self.assertEqual(self.texts('tom', limit=2), ['Tom Yum Soup 0', 'Tom Yum Soup 1'])
+        self.assertEqual(self.texts('yum', limit=1), ['Tom Yum Soup 0'])
+        self.assertEqual(self.texts('sou'), ['Soups'] + [f'Tom Yum Soup {number}' for number in range(5)])
+
+    def test_popular_queries_rank_by_search_count(self):
+        PopularSearch.objects.create(search_query='Pizza party', search_count=50)
+
+        self.assertEqual(self.texts('piz'), ['Pizza party', 'Pizza Place'])
+
+    def test_translations_complete_only_in_their_language(self):
+        self.assertEqual(self.texts('ต้ม', language='th'), ['ต้มยำ'])
+        self.assertEqual(self.texts('ต้ม', language='lo'), [])
+
+    def test_unavailable_products_are_not_suggested(self):
+        Product.objects.filter(pk=self.soups[0].pk).update(is_available=False)
+
+        self.assertNotIn('Tom Yum Soup 0', self.texts('tom'))
+
+    def test_endpoint(self):
+        response = self.client.get('/api/search/suggest/', {'q': 'Noo', 'limit': 3})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['suggestions'], [
+            {'text': 'Noodle Bar', 'type': 'restaurant', 'id': self.noodle_bar.pk},
+        ])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchResultCacheTests(SearchTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('api.views.record_search')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, **params):
+        return self.client.get('/api/search/', {'q': 'pizza', 'type': 'restaurant', **params})
+
+    def test_repeated_searches_are_served_from_the_cache(self):
+        with mock.patch('api.views._search_results', wraps=views._search_results) as compute:
+            first = self.search()
+            second = self.search(q='  PIZZA')
+
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(first.data, second.data)
+
+    def test_restaurant_changes_invalidate_cached_results(self):
+        self.search()
+        with mock.patch('api.menu_snapshot.invalidate_menus'), self.captureOnCommitCallbacks(execute=True):
+            self.noodle_bar.status = 'closed'
+            self.noodle_bar.save()
+
+        statuses = {item['restaurant_id']: item['status'] for item in self.search().data['restaurants']}
+        self.assertEqual(statuses[self.noodle_bar.pk], 'closed')
+
+    def test_rejects_unknown_types(self):
+        response = self.search(type='restaurants')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('type', response.data['error'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TrendingSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        self.now = self.hour + timedelta(minutes=30)
+
+    def searched(self, query, count, hours_ago):
+        PopularSearch.objects.get_or_create(search_query=query, defaults={'search_count': count})
+        SearchTrendBucket.objects.create(
+            search_query=query, bucket_start=self.hour - timedelta(hours=hours_ago), search_count=count,
+        )
+
+    def test_counts_halve_every_half_life(self):
+        self.searched('old favourite', 10, hours_ago=24)
+        self.searched('new dish', 6, hours_ago=0)
+
+        trending = compute_trending(self.now)
+
+        self.assertEqual(
+            [(item['search_query'], item['trend_score'], item['recent_count']) for item in trending],
+            [('new dish', 6.0, 6), ('old favourite', 5.0, 10)],
+        )
+
+    def test_buckets_outside_the_window_are_pruned(self):
+        self.searched('last week', 100, hours_ago=7 * 24)
+        self.searched('today', 1, hours_ago=0)
+
+        trending = compute_trending(self.now)
+
+        self.assertEqual([item['search_query'] for item in trending], ['today'])
+        self.assertEqual(list(SearchTrendBucket.objects.values_list('search_query', flat=True)), ['today'])
+
+    def test_requests_only_read_the_stored_list(self):
+        self.searched('today', 1, hours_ago=0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(trending_searches(), [])
+        refresh_trending_if_due()
+        with self.assertNumQueries(0):
+            self.assertEqual([item['search_query'] for item in trending_searches()], ['today'])
+
+    def test_flushes_refresh_at_most_once_per_interval(self):
+        buffer = SearchEventBuffer()
+        with mock.patch('api.search_log.SEARCH_LOG_WRITE_BEHIND', False), \
+                mock.patch('api.search_trending.compute_trending', return_value=[]) as compute:
+            for query in ('pizza', 'noodle'):
+                buffer.record(query)
+                buffer.flush()
+
+        compute.assert_called_once()
+
+
+class TranslationPrefetchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        thai = Language.objects.create(code='th', name='Thai')
+        lao = Language.objects.create(code='lo', name='Lao')
+        cls.categories = [
+            Category.objects.create(category_name=f'Category {number}', sort_order=number) for number in range(3)
+        ]
+        for category in cls.categories:
+            CategoryTranslation.objects.create(category=category, language=thai, translated_name=f'th {category.pk}')
+            CategoryTranslation.objects.create(category=category, language=lao, translated_name=f'lo {category.pk}')
+
+    def test_one_query_loads_a_language_for_every_row(self):
+        queryset = prefetch_language_translations(Category.objects.order_by('sort_order'), 'th')
+
+        with self.assertNumQueries(2):
+            names = [
+                [translation.translated_name for translation in translations_for_language(category, 'th')]
+                for category in queryset
+            ]
+        self.assertEqual(names, [[f'th {category.pk}'] for category in self.categories])
+
+    def test_without_a_language_every_translation_is_prefetched(self):
+        queryset = prefetch_language_translations(Category.objects.order_by('sort_order'), None)
+
+        with self.assertNumQueries(3):
+            codes = [sorted(t.language.code for t in category.translations.all()) for category in queryset]
+        self.assertEqual(codes, [['lo', 'th']] * 3)
+
+    def test_writes_prefetch_every_translation(self):
+        request = SimpleNamespace(method='PATCH', query_params={'lang': 'th'})
+
+        category = prefetch_translations(Category.objects.filter(pk=self.categories[0].pk), request).get()
+
+        self.assertFalse(hasattr(category, LANGUAGE_TRANSLATIONS_ATTR))
+        self.assertEqual(len(category.translations.all()), 2)
+
+    def test_list_endpoint_returns_only_the_requested_language(self):
+        response = self.client.get('/api/categories/', {'lang': 'lo'})
+
+        self.assertEqual(response.status_code, 200)
+        for item in response.data['results']:
+            self.assertEqual([t['translated_name'] for t in item['translations']], [f"lo {item['category_id']}"])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MenuSnapshotTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kitchen = create_restaurant('Kitchen')
+        cls.bakery = create_restaurant('Bakery')
+        cls.mains = Category.objects.create(category_name='Mains', sort_order=1)
+        cls.larb = Product.objects.create(
+            restaurant=cls.kitchen, category=cls.mains, product_name='Larb', price=Decimal('60'),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def invalidated_by(self, save):
+        with mock.patch('api.menu_snapshot.invalidate_menus') as invalidate, \
+                self.captureOnCommitCallbacks(execute=True):
+            save()
+        restaurant_ids, category_ids = set(), set()
+        for call in invalidate.call_args_list:
+            restaurant_ids.update(call.args[0])
+            category_ids.update(call.args[1])
+        return restaurant_ids - {None}, category_ids - {None}
+
+    def test_moving_a_product_invalidates_its_old_and_new_menus(self):
+        product = Product.objects.get(pk=self.larb.pk)
+        product.restaurant = self.bakery
+
+        restaurant_ids, category_ids = self.invalidated_by(product.save)
+
+        self.assertEqual(restaurant_ids, {self.kitchen.pk, self.bakery.pk})
+        self.assertEqual(category_ids, {self.mains.pk})
+
+    def test_saving_a_product_does_not_look_up_its_old_owners(self):
+        product = Product.objects.get(pk=self.larb.pk)
+        product.price = Decimal('65')
+
+        with mock.patch('api.menu_snapshot.invalidate_menus'), self.assertNumQueries(1):
+            product.save(update_fields=['price'])
+
+    def test_menu_is_served_with_an_etag_and_revalidated(self):
+        url = f'/api/restaurants/{self.kitchen.pk}/products/'
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['product_name'] for item in response.json()], ['Larb'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.language = Language.objects.create(code='th', name='Thai')
+        Country.objects.create(name='Laos')
+        Country.objects.create(name='Atlantis', is_active=False)
+        cls.customer = User.objects.create(username='customer', email='customer@example.com')
+        cls.other_customer = User.objects.create(username='other', email='other@example.com')
+        cls.admin = User.objects.create(username='admin', email='admin@example.com', role='admin')
+
+    def setUp(self):
+        cache.clear()
+
+    def etag(self, url, user=None):
+        self.client.force_authenticate(user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.etag('/api/languages/')
+
+        response = self.client.get('/api/languages/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_saving_a_model_changes_the_etag(self):
+        etag = self.etag('/api/languages/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.language.name = 'ภาษาไทย'
+            self.language.save()
+
+        response = self.client.get('/api/languages/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_public_resources_share_one_etag_across_users(self):
+        self.assertEqual(
+            {self.etag('/api/languages/', user) for user in (None, self.customer, self.admin)},
+            {self.etag('/api/languages/')},
+        )
+
+    def test_role_dependent_resources_vary_by_role_only(self):
+        customer = self.etag('/api/countries/', self.customer)
+
+        self.assertEqual(self.etag('/api/countries/', self.other_customer), customer)
+        self.assertNotEqual(self.etag('/api/countries/', self.admin), customer)
+
+    def test_missing_objects_are_never_not_modified(self):
+        response = self.client.get('/api/languages/999999/', HTTP_IF_NONE_MATCH='*')
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SparseFieldsetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurants = [
+            create_restaurant(f'Kitchen {number}', description='Larb and sticky rice') for number in range(3)
+        ]
+        category = Category.objects.create(category_name='Mains', sort_order=1)
+        for restaurant in cls.restaurants:
+            Product.objects.create(restaurant=restaurant, category=category, product_name='Larb', price=Decimal('60'))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_rows_leave_out_expandable_fields_until_expanded(self):
+        [row, *_] = self.client.get('/api/restaurants/').data['results']
+        self.assertNotIn('description', row)
+        self.assertEqual(row['products_count'], 1)
+
+        [row, *_] = self.client.get('/api/restaurants/', {'expand': 'description'}).data['results']
+        self.assertEqual(row['description'], 'Larb and sticky rice')
+
+    def test_fields_and_omit_choose_the_rendered_fields(self):
+        rows = self.client.get('/api/restaurants/', {'fields': 'restaurant_id,restaurant_name'}).data['results']
+        self.assertEqual([set(row) for row in rows], [{'restaurant_id', 'restaurant_name'}] * 3)
+
+        [row, *_] = self.client.get('/api/restaurants/', {'omit': 'products_count,address'}).data['results']
+        self.assertNotIn('products_count', row)
+        self.assertNotIn('address', row)
+        self.assertIn('restaurant_name', row)
+
+    def test_fields_restrict_the_columns_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/restaurants/', {'fields': 'restaurant_id,restaurant_name'})
+
+        [select] = [query['sql'] for query in queries if 'COUNT' not in query['sql']]
+        self.assertNotIn('description', select)
+        self.assertNotIn('products', select)
+
+    def test_omitting_translations_skips_their_prefetch(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/products/', {'omit': 'translations'})
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertNotIn('translations', response.data['results'][0])
@@ -0,0 +1,71 @@
+"""
+Language-aware translation prefetching for catalog serializers.
+
+Serializers with a `translations` field return every translation, or only
+the ?lang= one. Filtering the related manager per object bypasses
+prefetch_related and costs one query per row, so viewsets install the
+prefetch with prefetch_translations() and serializers read it back with
+translations_for_language(): the requested language's translations are
+prefetched into their own attribute in one query for the whole page.
+"""
+from django.db.models import Prefetch
+from rest_framework.permissions import SAFE_METHODS
+
+
+def request_language(request):
+    """The ?lang= code of a request, or None."""
+    if request is None:
+        return None
+    return request.query_params.get('lang') or None
+
+
+def context_language(context):
+    """
+    The language a serializer should render: context['lang'] when the caller
+    set one (snapshots built outside a request), else the request's ?lang=.
+    """
+    if 'lang' in context:
+        return context['lang'] or None
+    return request_language(context.get('request'))
+
+
+# Holds the prefetched translations in the request's language.
+LANGUAGE_TRANSLATIONS_ATTR = 'language_translations'
+
+
+def prefetch_translations(queryset, request, lookup='translations'):
+    """
+    Prefetch the translations serializers will need for this request: only
+    the ?lang= ones (with their language) when given, otherwise all of them.
+    `lookup` may span relations, e.g. 'products__translations'.
+
+    Writes get the plain prefetch, which DRF clears after an update, so the
+    response never shows translations from before the save.
+    """
+    lang_code = request_language(request)
+    if request is not None and request.method not in SAFE_METHODS:
+        lang_code = None
+    return prefetch_language_translations(queryset, lang_code, lookup)
+
+
+def prefetch_language_translations(queryset, lang_code, lookup='translations'):
+    """prefetch_translations() for a language code rather than a request."""
+    if not lang_code:
+        return queryset.prefetch_related(f"{lookup}__language")
+
+    model = queryset.model
+    for part in lookup.split('__'):
+        model = model._meta.get_field(part).related_model
+    return queryset.prefetch_related(Prefetch(
+        lookup,
+        queryset=model.objects.filter(language__code=lang_code).select_related('language'),
+        to_attr=LANGUAGE_TRANSLATIONS_ATTR,
+    ))
+
+
+def translations_for_language(obj, lang_code):
+    """obj's translations in lang_code, from the prefetch when the viewset installed one."""
+    prefetched = getattr(obj, LANGUAGE_TRANSLATIONS_ATTR, None)
+    if prefetched is not None:
+        return prefetched
+    return obj.translations.filter(language__code=lang_code).select_related('language')
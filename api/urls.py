@@ -37,6 +37,7 @@ router.register(r'cities', views.CityViewSet, basename='city')
 urlpatterns = [
     # Health check endpoint for ALB/ELB
     path('health/', views.health_check, name='health-check'),
+    path('health/providers/', views.provider_stats, name='provider-stats'),
     # Explicitly register bulk_create before router to avoid 405 from detail-pk matching
     path('entertainment-venues/bulk_create/',
          views.EntertainmentVenueViewSet.as_view({'post': 'bulk_create'}),
@@ -45,6 +46,7 @@ urlpatterns = [
     path('geocode/search/', views.geocode_search_proxy, name='geocode-search'),
     path('', include(router.urls)),
     path('search/', views.SearchViewSet.as_view({'get': 'search'}), name='search'),
+    path('search/suggest/', views.SearchViewSet.as_view({'get': 'suggest'}), name='search-suggest'),
     path('search/popular/', views.SearchViewSet.as_view({'get': 'popular'}), name='popular-searches'),
     path('search/history/', views.SearchViewSet.as_view({'get': 'history'}), name='search-history'),
     path('analytics/daily/', views.AnalyticsViewSet.as_view({'get': 'daily'}), name='analytics-daily'),
@@ -58,6 +60,7 @@ urlpatterns = [
     # Delivery fee calculation endpoints
     path('calculate-delivery-fee/', views.calculate_delivery_fee_api, name='calculate-delivery-fee'),
     path('calculate-multi-restaurant-delivery-fee/', views.calculate_multi_restaurant_delivery_fee_api, name='calculate-multi-restaurant-delivery-fee'),
+    path('calculate-bulk-delivery-fee/', views.calculate_bulk_delivery_fee_api, name='calculate-bulk-delivery-fee'),
     # Offline sync
     path('sync-status/', views.sync_status, name='sync-status'),
 ] 
@@ -2,13 +2,20 @@ from django.db.models import Count, Sum, Avg, Q
 from django.utils import timezone
 from django.conf import settings
 from django.core.cache import cache
+from django.db import close_old_connections
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
 import logging
+import threading
 import requests
 from .models import (
     Order, Restaurant, Product, AnalyticsDaily, 
     RestaurantAnalytics, ProductAnalytics
 )
+from .outbound import osrm_client
+from .route_cache import route_distance_cache
+from .route_estimate import road_distance_estimator
+from .singleflight import SingleFlight
 
 
 def update_daily_analytics(date=None):
@@ -130,10 +137,25 @@ import math
 
 logger = logging.getLogger(__name__)
 
-ROUTING_OSRM_BASE_URL = getattr(settings, 'ROUTING_OSRM_BASE_URL', 'https://router.project-osrm.org').rstrip('/')
-ROUTING_OSRM_TIMEOUT_SECONDS = int(getattr(settings, 'ROUTING_OSRM_TIMEOUT_SECONDS', 8))
-ROUTING_DISTANCE_CACHE_TTL_SECONDS = int(getattr(settings, 'ROUTING_DISTANCE_CACHE_TTL_SECONDS', 1800))
 ROUTING_COORD_PRECISION = int(getattr(settings, 'ROUTING_COORD_PRECISION', 5))
+# OSRM's default max-table-size is 100 coordinates, destination included.
+ROUTING_OSRM_TABLE_MAX_SOURCES = max(1, int(getattr(settings, 'ROUTING_OSRM_TABLE_MAX_SOURCES', 99)))
+ROUTING_RACE_BUDGET_MS = int(getattr(settings, 'ROUTING_RACE_BUDGET_MS', 500))
+ROUTING_RACE_MAX_WORKERS = int(getattr(settings, 'ROUTING_RACE_MAX_WORKERS', 8))
+ROUTING_RACE_MAX_QUEUED = max(0, int(getattr(settings, 'ROUTING_RACE_MAX_QUEUED', 8)))
+
+# Provider requests raced against ROUTING_RACE_BUDGET_MS run on this pool so
+# the caller can stop waiting; the request still finishes and fills the
+# cache. Created on first use, so processes that never race (management
+# commands, workers that only serve other endpoints) do not get one.
+_routing_race_executor = None
+_routing_race_executor_lock = threading.Lock()
+# Running plus queued race requests. When the provider is slow, callers stop
+# waiting but their requests keep piling up; past this the race is skipped
+# and the caller gets the estimate at once.
+_routing_race_slots = threading.BoundedSemaphore(ROUTING_RACE_MAX_WORKERS + ROUTING_RACE_MAX_QUEUED)
+
+route_flight = SingleFlight('route_km')
 
 
 def _to_float_coord(value):
@@ -173,10 +195,49 @@ def _build_route_cache_key(lat1, lon1, lat2, lon2):
     return f"route_km:{a[0]}:{a[1]}:{b[0]}:{b[1]}"
 
 
-def calculate_route_distance_km(lat1, lon1, lat2, lon2):
+def _race_executor():
+    global _routing_race_executor
+    if _routing_race_executor is None:
+        with _routing_race_executor_lock:
+            if _routing_race_executor is None:
+                _routing_race_executor = ThreadPoolExecutor(
+                    max_workers=ROUTING_RACE_MAX_WORKERS,
+                    thread_name_prefix='routing-race',
+                )
+    return _routing_race_executor
+
+
+def _run_and_release_connection(func, *args):
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+        _routing_race_slots.release()
+
+
+def _race_provider(func, default, budget_ms, *args):
+    """
+    Call func(*args), giving up after budget_ms and returning default.
+    A budget of None or 0 waits for the provider's own timeout.
+    """
+    if not budget_ms:
+        return func(*args)
+    if not _routing_race_slots.acquire(blocking=False):
+        logger.info("Routing race queue is full, using estimate")
+        return default
+    future = _race_executor().submit(_run_and_release_connection, func, *args)
+    try:
+        return future.result(timeout=budget_ms / 1000.0)
+    except FutureTimeoutError:
+        logger.info("Routing provider did not answer within %sms, using estimate", budget_ms)
+        return default
+
+
+def calculate_route_distance_km(lat1, lon1, lat2, lon2, budget_ms=None):
     """
     Calculate driving distance (km) from OSRM.
-    Returns None when provider cannot be used.
+    Returns None when provider cannot be used, or has not answered within
+    budget_ms when a budget is given.
     """
     lat1_f = _to_float_coord(lat1)
     lon1_f = _to_float_coord(lon1)
@@ -187,25 +248,40 @@ def calculate_route_distance_km(lat1, lon1, lat2, lon2):
         return None
 
     cache_key = _build_route_cache_key(lat1_f, lon1_f, lat2_f, lon2_f)
-    cached = cache.get(cache_key)
+    cached = route_distance_cache.get(cache_key)
     if cached is not None:
         return cached
 
-    url = (
-        f"{ROUTING_OSRM_BASE_URL}/route/v1/driving/"
+    return _race_provider(
+        _coalesced_route_km, None, budget_ms,
+        lat1_f, lon1_f, lat2_f, lon2_f, cache_key,
+    )
+
+
+def _coalesced_route_km(lat1_f, lon1_f, lat2_f, lon2_f, cache_key):
+    """_request_route_km, shared by concurrent misses on the same pair."""
+    return route_flight.do(
+        cache_key,
+        lambda: _request_route_km(lat1_f, lon1_f, lat2_f, lon2_f, cache_key),
+        lambda: cache.get(cache_key),
+    )
+
+
+def _request_route_km(lat1_f, lon1_f, lat2_f, lon2_f, cache_key):
+    """Resolve one pair with an OSRM /route call and cache the result."""
+    path = (
+        "/route/v1/driving/"
         f"{lon1_f:.7f},{lat1_f:.7f};{lon2_f:.7f},{lat2_f:.7f}"
     )
 
     try:
-        response = requests.get(
-            url,
+        response = osrm_client.get(
+            path,
             params={
                 'overview': 'false',
                 'alternatives': 'false',
                 'steps': 'false',
             },
-            timeout=ROUTING_OSRM_TIMEOUT_SECONDS,
-            headers={'User-Agent': 'FoodDeliveryAseanMall/1.0 (routing-distance)'},
         )
         response.raise_for_status()
         data = response.json()
@@ -232,40 +308,274 @@ def calculate_route_distance_km(lat1, lon1, lat2, lon2):
     if distance_km <= 0:
         return None
 
-    cache.set(cache_key, distance_km, ROUTING_DISTANCE_CACHE_TTL_SECONDS)
+    route_distance_cache.set(cache_key, distance_km)
     return distance_km
 
-def calculate_distance_km(lat1, lon1, lat2, lon2):
+def calculate_route_distances_km(origins, destination, budget_ms=None):
+    """
+    Calculate driving distances (km) from many origins to one destination.
+    Cached pairs are served from cache; the remaining ones are resolved with
+    a single OSRM table request. Returns a list aligned with origins, with
+    None where the provider cannot be used or has not answered within
+    budget_ms.
+    """
+    dest_lat = _to_float_coord(destination[0])
+    dest_lon = _to_float_coord(destination[1])
+    if None in (dest_lat, dest_lon):
+        return [None] * len(origins)
+
+    points = []
+    for lat, lon in origins:
+        lat_f = _to_float_coord(lat)
+        lon_f = _to_float_coord(lon)
+        points.append(None if None in (lat_f, lon_f) else (lat_f, lon_f))
+
+    keys = [
+        _build_route_cache_key(point[0], point[1], dest_lat, dest_lon) if point else None
+        for point in points
+    ]
+    cached = route_distance_cache.get_many(keys)
+
+    # One table source per distinct uncached key (restaurants may repeat).
+    pending = {}
+    for point, key in zip(points, keys):
+        if key and key not in cached and key not in pending:
+            pending[key] = point
+
+    resolved = dict(cached)
+    if pending:
+        resolved.update(_race_provider(
+            _request_route_table_km, {}, budget_ms,
+            pending, dest_lat, dest_lon,
+        ))
+
+    return [resolved.get(key) if key else None for key in keys]
+
+
+def _request_route_table_km(sources_by_key, dest_lat, dest_lon):
+    """
+    Resolve {cache_key: (lat, lon)} to {cache_key: km} with as few OSRM /table
+    calls as the provider's table size limit allows.
+    """
+    source_keys = list(sources_by_key)
+    distances = {}
+    for start in range(0, len(source_keys), ROUTING_OSRM_TABLE_MAX_SOURCES):
+        chunk = source_keys[start:start + ROUTING_OSRM_TABLE_MAX_SOURCES]
+        distances.update(_request_route_table_chunk_km(
+            {key: sources_by_key[key] for key in chunk}, dest_lat, dest_lon,
+        ))
+    return distances
+
+
+def _request_route_table_chunk_km(sources_by_key, dest_lat, dest_lon):
+    """Resolve {cache_key: (lat, lon)} to {cache_key: km} with one OSRM /table call."""
+    source_keys = list(sources_by_key)
+    coordinates = ";".join(
+        f"{lon:.7f},{lat:.7f}" for lat, lon in (sources_by_key[key] for key in source_keys)
+    )
+    path = (
+        "/table/v1/driving/"
+        f"{coordinates};{dest_lon:.7f},{dest_lat:.7f}"
+    )
+
+    try:
+        response = osrm_client.get(
+            path,
+            params={
+                'sources': ";".join(str(i) for i in range(len(source_keys))),
+                'destinations': str(len(source_keys)),
+                'annotations': 'distance',
+            },
+        )
+        response.raise_for_status()
+        data = response.json()
+    except (requests.RequestException, ValueError) as exc:
+        logger.warning("Routing table request failed: %s", exc)
+        return {}
+
+    if data.get('code') != 'Ok':
+        logger.warning("Routing provider returned non-OK code: %s", data.get('code'))
+        return {}
+
+    rows = data.get('distances') or []
+    distances = {}
+    for key, row in zip(source_keys, rows):
+        try:
+            distance_km = float(row[0]) / 1000.0
+        except (TypeError, ValueError, IndexError):
+            continue
+        if distance_km > 0:
+            distances[key] = distance_km
+
+    route_distance_cache.set_many(distances)
+    return distances
+
+
+def estimate_road_distance_km(lat1, lon1, lat2, lon2):
+    """
+    Road distance estimated offline from the straight-line distance and the
+    detour factor learned from cached routes. Returns 0.0 for invalid input.
+    """
+    lat1_f = _to_float_coord(lat1)
+    lon1_f = _to_float_coord(lon1)
+    lat2_f = _to_float_coord(lat2)
+    lon2_f = _to_float_coord(lon2)
+
+    if None in (lat1_f, lon1_f, lat2_f, lon2_f):
+        return 0.0
+
+    return road_distance_estimator.estimate_km(lat1_f, lon1_f, lat2_f, lon2_f)
+
+
+def calculate_distances_km(origins, destination, budget_ms=ROUTING_RACE_BUDGET_MS):
+    """
+    Batched calculate_distance_km: driving distance for each origin when the
+    provider can route it in time, estimated road distance otherwise.
+    """
+    route_distances = calculate_route_distances_km(
+        origins, destination, budget_ms=budget_ms,
+    )
+    return [
+        route_distance if route_distance is not None
+        else estimate_road_distance_km(lat, lon, destination[0], destination[1])
+        for (lat, lon), route_distance in zip(origins, route_distances)
+    ]
+
+
+def calculate_distance_km(lat1, lon1, lat2, lon2, budget_ms=ROUTING_RACE_BUDGET_MS):
     """
     Calculate distance in kilometers.
-    Prefer driving route distance, then fallback to straight-line distance.
+    Prefer driving route distance if the provider answers within budget_ms
+    (None waits for the provider's own timeout), then fallback to
+    estimated road distance.
     """
-    route_distance = calculate_route_distance_km(lat1, lon1, lat2, lon2)
+    route_distance = calculate_route_distance_km(
+        lat1, lon1, lat2, lon2, budget_ms=budget_ms,
+    )
     if route_distance is not None:
         return route_distance
 
-    return _haversine_distance_km(lat1, lon1, lat2, lon2)
+    return estimate_road_distance_km(lat1, lon1, lat2, lon2)
+
+
+class DeliveryPricing:
+    """Delivery pricing values, read once from AppSettings and reused per quote."""
+
+    DEFAULT_BASE_FEE = 20.00
+    DEFAULT_PER_KM_FEE = 5.00
+    DEFAULT_ADDITIONAL_FEE_PER_RESTAURANT = 15.00
+    BASE_DISTANCE_KM = 2
+
+    def __init__(self, settings=None):
+        if not settings:
+            from .models import AppSettings
+            settings = AppSettings.get_settings()
+        self.settings = settings
+
+        def _optional_float(field_name):
+            value = getattr(settings, field_name, None) if settings else None
+            return float(value) if value is not None else None
+
+        base_fee = _optional_float('base_delivery_fee')
+        per_km_fee = _optional_float('per_km_fee')
+        self.base_fee = base_fee if base_fee is not None else self.DEFAULT_BASE_FEE
+        self.per_km_fee = per_km_fee if per_km_fee is not None else self.DEFAULT_PER_KM_FEE
+        self.max_delivery_distance = _optional_float('max_delivery_distance')
+        self.free_delivery_minimum = _optional_float('free_delivery_minimum')
+        # Zero/empty additional fee falls back to the default, as before.
+        self.additional_fee_per_restaurant = (
+            _optional_float('multi_restaurant_additional_fee')
+            or self.DEFAULT_ADDITIONAL_FEE_PER_RESTAURANT
+        )
+
+    def fee_for_distance(self, distance_km):
+        if distance_km <= self.BASE_DISTANCE_KM:
+            return self.base_fee
+        return self.base_fee + ((distance_km - self.BASE_DISTANCE_KM) * self.per_km_fee)
+
+    def is_within_range(self, distance_km):
+        return self.max_delivery_distance is None or distance_km <= self.max_delivery_distance
+
+    def is_free_delivery(self, order_subtotal):
+        return (
+            order_subtotal is not None
+            and self.free_delivery_minimum is not None
+            and self.free_delivery_minimum > 0
+            and order_subtotal >= self.free_delivery_minimum
+        )
+
+
+class DeliveryQuote:
+    """
+    Delivery quote for one restaurant and one drop-off point: distance, fee,
+    range check and free-delivery decision from a single distance lookup.
+    """
+
+    def __init__(self, distance_km, pricing, order_subtotal=None):
+        self.distance_km = distance_km
+        self.pricing = pricing
+        self.order_subtotal = order_subtotal
+        self.fee = pricing.fee_for_distance(distance_km)
+        self.within_delivery_range = pricing.is_within_range(distance_km)
+        self.is_free_delivery = pricing.is_free_delivery(order_subtotal)
+
+    @property
+    def final_fee(self):
+        """Fee the customer pays: 0 when out of range or free delivery applies."""
+        if not self.within_delivery_range or self.is_free_delivery:
+            return 0.0
+        return float(self.fee)
+
+    def as_dict(self):
+        max_distance = self.pricing.max_delivery_distance
+        free_minimum = self.pricing.free_delivery_minimum
+        return {
+            'delivery_fee': round(self.final_fee, 5),
+            'distance_km': round(self.distance_km, 2),
+            'max_delivery_distance_km': round(max_distance, 2) if max_distance is not None else None,
+            'free_delivery_minimum_amount': round(free_minimum, 2) if free_minimum is not None else None,
+            'order_subtotal': round(self.order_subtotal, 2) if self.order_subtotal is not None else None,
+            'is_free_delivery': self.is_free_delivery,
+            'within_delivery_range': self.within_delivery_range,
+        }
+
+
+def quote_delivery(
+    restaurant_lat, restaurant_lon,
+    delivery_lat, delivery_lon,
+    order_subtotal=None, pricing=None, budget_ms=ROUTING_RACE_BUDGET_MS
+):
+    """
+    Quote delivery from one restaurant with one distance lookup and one settings read.
+    Fees that are charged (orders) pass budget_ms=None so they are priced from
+    the routed distance whenever the provider answers at all.
+    """
+    pricing = pricing or DeliveryPricing()
+    distance_km = calculate_distance_km(
+        restaurant_lat, restaurant_lon,
+        delivery_lat, delivery_lon,
+        budget_ms=budget_ms,
+    )
+    return DeliveryQuote(distance_km, pricing, order_subtotal)
+
+
+def quote_deliveries(origins, destination, order_subtotals=None, pricing=None):
+    """
+    Quote delivery from many restaurants to one drop-off point.
+    origins is a list of (lat, lon); distances are resolved in one batch.
+    """
+    pricing = pricing or DeliveryPricing()
+    distances = calculate_distances_km(origins, destination)
+    order_subtotals = order_subtotals or [None] * len(origins)
+    return [
+        DeliveryQuote(distance_km, pricing, order_subtotal)
+        for distance_km, order_subtotal in zip(distances, order_subtotals)
+    ]
 
 
 def calculate_delivery_fee(distance_km, settings=None):
     """Calculate delivery fee based on distance and settings"""
-    if not settings:
-        from .models import AppSettings
-        settings = AppSettings.get_settings()
-    
-    if not settings:
-        # Fallback values if no settings found
-        base_fee = 20.00
-        per_km_fee = 5.00
-    else:
-        # Use settings values, fallback to defaults if None
-        base_fee = float(settings.base_delivery_fee) if settings.base_delivery_fee is not None else 20.00
-        per_km_fee = float(settings.per_km_fee) if settings.per_km_fee is not None else 5.00
-    
-    if distance_km <= 2:
-        return base_fee
-    else:
-        return base_fee + ((distance_km - 2) * per_km_fee)
+    return DeliveryPricing(settings).fee_for_distance(distance_km)
 
 
 def calculate_delivery_fee_by_distance(
@@ -12,13 +12,15 @@ from django.db import transaction
 from django.utils import timezone
 from django.core.cache import cache
 from django.conf import settings as django_settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
 from datetime import datetime, timedelta
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+import hashlib
 import logging
 import math
 import requests
-import threading
 import time
 
 from accounts.models import User
@@ -48,8 +50,24 @@ from .serializers import (
     CreateDineInOrderSerializer, UpdateDineInOrderStatusSerializer, DineInProductSerializer,
     CountrySerializer, CitySerializer,
     EntertainmentVenueSerializer, EntertainmentVenueListSerializer, VenueImageSerializer, VenueCategorySerializer,
-    VenueReviewSerializer
+    VenueReviewSerializer, RestaurantListSerializer, ProductListSerializer, OrderListSerializer
 )
+from .conditional import ConditionalGetMixin, catalog_versions
+from .fieldsets import only_rendered_columns, rendered_fields
+from .geo import (
+    NEARBY_DEFAULT_RADIUS_KM, NEARBY_MAX_RADIUS_KM, bounding_box,
+    rank_within_radius, restaurant_nearby_index,
+)
+from .outbound import SharedRateLimiter, nominatim_client, outbound_stats
+from .menu_snapshot import MENU_SHAPES, SCOPE_CATEGORY, SCOPE_RESTAURANT, get_menu_snapshot
+from .places import local_geocode_search, local_reverse_geocode
+from .route_cache import route_distance_cache
+from .search import catalog_version, decode_cursor, normalize_search_query, search_page
+from .search_log import record_search
+from .search_suggest import search_suggestions
+from .search_trending import trending_searches
+from .singleflight import SingleFlight
+from .translations import prefetch_translations, request_language
 
 # Logger instance
 logger = logging.getLogger(__name__)
@@ -64,6 +82,16 @@ def health_check(request):
     return Response({"status": "ok"})
 
 
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def provider_stats(request):
+    """Per-process counters for external providers and the route distance cache."""
+    return Response({
+        "providers": outbound_stats(),
+        "route_distance_cache": route_distance_cache.stats(),
+    })
+
+
 # -------------------- Offline Sync Status Endpoint --------------------
 @api_view(["GET"])
 @permission_classes([AllowAny])
@@ -107,18 +135,7 @@ def sync_status(request):
     })
 
 
-NOMINATIM_BASE_URL = getattr(
-    django_settings,
-    "NOMINATIM_BASE_URL",
-    "https://nominatim.openstreetmap.org",
-).rstrip("/")
-NOMINATIM_TIMEOUT_SECONDS = int(getattr(django_settings, "NOMINATIM_TIMEOUT_SECONDS", 8))
 NOMINATIM_CACHE_TTL_SECONDS = int(getattr(django_settings, "NOMINATIM_CACHE_TTL_SECONDS", 60 * 60 * 24))
-NOMINATIM_USER_AGENT = getattr(
-    django_settings,
-    "NOMINATIM_USER_AGENT",
-    "FoodDeliveryAseanMall/1.0 (local geocoding proxy)",
-)
 NOMINATIM_MIN_INTERVAL_SECONDS = float(getattr(django_settings, "NOMINATIM_MIN_INTERVAL_SECONDS", 1.1))
 NOMINATIM_RETRY_BACKOFF_SECONDS = float(getattr(django_settings, "NOMINATIM_RETRY_BACKOFF_SECONDS", 2.0))
 NOMINATIM_RETRY_ATTEMPTS = max(0, int(getattr(django_settings, "NOMINATIM_RETRY_ATTEMPTS", 1)))
@@ -129,25 +146,37 @@ NOMINATIM_REVERSE_CACHE_PRECISION = max(
 NOMINATIM_RATE_LIMIT_COOLDOWN_SECONDS = max(
     5, int(getattr(django_settings, "NOMINATIM_RATE_LIMIT_COOLDOWN_SECONDS", 30))
 )
+NOMINATIM_MAX_QUEUE_WAIT_SECONDS = max(
+    0.0, float(getattr(django_settings, "NOMINATIM_MAX_QUEUE_WAIT_SECONDS", 5.0))
+)
 NOMINATIM_RATE_LIMIT_CACHE_KEY = "nominatim:rate_limited_until"
+NOMINATIM_RETRY_AFTER_MAX_SECONDS = 60.0
+# Worst case of one _nominatim_fetch(): every attempt waits the longest
+# queue slot and times out, with the longest backoff between attempts.
+NOMINATIM_FETCH_MAX_SECONDS = (
+    (NOMINATIM_RETRY_ATTEMPTS + 1) * (NOMINATIM_MAX_QUEUE_WAIT_SECONDS + sum(nominatim_client.timeout))
+    + NOMINATIM_RETRY_ATTEMPTS * max(NOMINATIM_RETRY_AFTER_MAX_SECONDS, NOMINATIM_RETRY_BACKOFF_SECONDS)
+)
 
-_nominatim_lock = threading.Lock()
-_nominatim_last_request_at = 0.0
+nominatim_rate_limiter = SharedRateLimiter(
+    "nominatim",
+    interval_seconds=NOMINATIM_MIN_INTERVAL_SECONDS,
+    max_wait_seconds=NOMINATIM_MAX_QUEUE_WAIT_SECONDS,
+)
 
 
 def _nominatim_wait_for_rate_slot():
-    global _nominatim_last_request_at
-    if NOMINATIM_MIN_INTERVAL_SECONDS <= 0:
-        return
-
-    with _nominatim_lock:
-        now = time.monotonic()
-        elapsed = now - _nominatim_last_request_at
-        wait_seconds = NOMINATIM_MIN_INTERVAL_SECONDS - elapsed
-        if wait_seconds > 0:
-            time.sleep(wait_seconds)
-            now = time.monotonic()
-        _nominatim_last_request_at = now
+    """
+    Reserve a cluster-wide Nominatim slot and sleep until it starts.
+    Returns False without waiting when no slot is free within
+    NOMINATIM_MAX_QUEUE_WAIT_SECONDS.
+    """
+    wait_seconds = nominatim_rate_limiter.reserve()
+    if wait_seconds is None:
+        return False
+    if wait_seconds > 0:
+        time.sleep(wait_seconds)
+    return True
 
 
 def _parse_retry_after_seconds(value):
@@ -162,7 +191,10 @@ def _parse_retry_after_seconds(value):
     if parsed < 0:
         return None
 
-    return min(parsed, 60.0)
+    return min(parsed, NOMINATIM_RETRY_AFTER_MAX_SECONDS)
+
+
+nominatim_flight = SingleFlight("nominatim", lock_seconds=NOMINATIM_FETCH_MAX_SECONDS)
 
 
 def _nominatim_request(endpoint: str, params: dict, cache_key: str):
@@ -170,6 +202,24 @@ def _nominatim_request(endpoint: str, params: dict, cache_key: str):
     if cached is not None:
         return cached, None
 
+    # Concurrent misses on the same key share one upstream call.
+    data, error_response = nominatim_flight.do(
+        cache_key,
+        lambda: _nominatim_fetch(endpoint, params, cache_key),
+        lambda: _cached_nominatim_result(cache_key),
+    )
+    if error_response is not None:
+        # Followers get their own Response; DRF mutates it while rendering.
+        error_response = Response(error_response.data, status=error_response.status_code)
+    return data, error_response
+
+
+def _cached_nominatim_result(cache_key):
+    cached = cache.get(cache_key)
+    return None if cached is None else (cached, None)
+
+
+def _nominatim_fetch(endpoint: str, params: dict, cache_key: str):
     now_epoch = time.time()
     rate_limited_until = cache.get(NOMINATIM_RATE_LIMIT_CACHE_KEY)
     if isinstance(rate_limited_until, (int, float)) and rate_limited_until > now_epoch:
@@ -185,17 +235,16 @@ def _nominatim_request(endpoint: str, params: dict, cache_key: str):
     attempt = 0
     response = None
     while attempt <= NOMINATIM_RETRY_ATTEMPTS:
-        _nominatim_wait_for_rate_slot()
-        try:
-            response = requests.get(
-                f"{NOMINATIM_BASE_URL}/{endpoint}",
-                params=params,
-                headers={
-                    "User-Agent": NOMINATIM_USER_AGENT,
-                    "Accept": "application/json",
+        if not _nominatim_wait_for_rate_slot():
+            return None, Response(
+                {
+                    "detail": "Geocoding provider is busy. Please retry shortly.",
+                    "retry_after_seconds": max(1, int(math.ceil(NOMINATIM_MIN_INTERVAL_SECONDS))),
                 },
-                timeout=NOMINATIM_TIMEOUT_SECONDS,
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
             )
+        try:
+            response = nominatim_client.get(f"/{endpoint}", params=params)
         except requests.RequestException:
             return None, Response(
                 {"detail": "Failed to connect to geocoding provider."},
@@ -275,6 +324,11 @@ def reverse_geocode_proxy(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
+    # จุดที่อยู่ใกล้ร้าน/สถานที่ที่เรามีอยู่แล้ว ตอบจาก index ในเครื่องโดยไม่ต้องเรียก Nominatim
+    local_result = local_reverse_geocode(lat, lon)
+    if local_result is not None:
+        return Response(local_result)
+
     rounded_lat = f"{lat:.{NOMINATIM_REVERSE_CACHE_PRECISION}f}"
     rounded_lon = f"{lon:.{NOMINATIM_REVERSE_CACHE_PRECISION}f}"
     cache_key = f"nominatim:reverse:{rounded_lat}:{rounded_lon}"
@@ -324,6 +378,11 @@ def geocode_search_proxy(request):
         limit = 5
     limit = max(1, min(limit, 10))
 
+    # ชื่อร้าน/สถานที่/เมืองที่เรามีอยู่แล้วตอบจาก index ในเครื่องก่อน ถ้าครบ limit ไม่ต้องเรียก Nominatim
+    local_results = local_geocode_search(query, limit)
+    if len(local_results) >= limit:
+        return Response(local_results)
+
     normalized_query = " ".join(query.lower().split())
     cache_key = f"nominatim:search:{normalized_query}:{limit}"
     data, error_response = _nominatim_request(
@@ -340,13 +399,127 @@ def geocode_search_proxy(request):
     if error_response is not None:
         if error_response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
             logger.warning("Nominatim search rate-limited for query=%s", normalized_query)
-            return Response([], status=status.HTTP_200_OK)
+            return Response(local_results, status=status.HTTP_200_OK)
+        if local_results:
+            return Response(local_results)
         return error_response
 
-    return Response(data if isinstance(data, list) else [])
+    provider_results = data if isinstance(data, list) else []
+    return Response((local_results + provider_results)[:limit])
 
 
-class RestaurantViewSet(viewsets.ModelViewSet):
+def _parse_location_params(request):
+    """
+    Read latitude/longitude query params.
+    Returns (lat, lng, error_response).
+    """
+    latitude = request.query_params.get('latitude')
+    longitude = request.query_params.get('longitude')
+    if not latitude or not longitude:
+        return None, None, Response(
+            {'error': 'latitude and longitude are required'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        lat = float(latitude)
+        lng = float(longitude)
+    except ValueError:
+        return None, None, Response(
+            {'error': 'Invalid latitude or longitude'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
+        return None, None, Response(
+            {'error': 'latitude/longitude are out of valid range'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return lat, lng, None
+
+
+def _parse_nearby_params(request):
+    """
+    Read latitude/longitude/radius query params for nearby lookups.
+    Returns (lat, lng, radius_km, error_response).
+    """
+    lat, lng, error_response = _parse_location_params(request)
+    if error_response is not None:
+        return None, None, None, error_response
+
+    try:
+        radius = float(request.query_params.get('radius', NEARBY_DEFAULT_RADIUS_KM))
+    except ValueError:
+        return None, None, None, Response(
+            {'error': 'Invalid radius'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if not radius > 0:
+        return None, None, None, Response(
+            {'error': 'radius must be greater than 0'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    return lat, lng, min(radius, NEARBY_MAX_RADIUS_KM), None
+
+
+def _distance_ranked_response(viewset, ranked, queryset, extra_fields=None, rerank=None):
+    """
+    Paginate a nearest-first [(pk, distance_km)] list and serialize only the
+    rows on the requested page, adding distance_km to each of them.
+    extra_fields optionally maps pk -> dict of additional keys per row.
+    rerank optionally replaces the page's rows (e.g. with road distances)
+    before they are loaded; it may drop rows and fill extra_fields.
+    """
+    page = viewset.paginate_queryset(ranked)
+    rows = page if page is not None else ranked
+    if rerank is not None:
+        rows = rerank(rows)
+
+    objects = queryset.in_bulk([pk for pk, _ in rows])
+    ordered = [(objects[pk], distance) for pk, distance in rows if pk in objects]
+
+    serializer = viewset.get_serializer([obj for obj, _ in ordered], many=True)
+    data = serializer.data
+    for item, (obj, distance) in zip(data, ordered):
+        item['distance_km'] = round(distance, 2)
+        if extra_fields:
+            item.update(extra_fields.get(obj.pk, {}))
+
+    if page is not None:
+        return viewset.get_paginated_response(data)
+    return Response(data)
+
+
+def _menu_response(request, scope, pk):
+    """
+    เมนูจาก snapshot ที่ render ไว้แล้ว (ดู menu_snapshot) พร้อม ETag
+    ถ้า If-None-Match ตรงกับเวอร์ชันปัจจุบันจะตอบ 304 โดยไม่ส่ง body
+    ?group=category จะจัดกลุ่มสินค้าตามหมวดหมู่
+    """
+    shape = MENU_SHAPES.get(request.query_params.get('group', ''))
+    if shape is None:
+        return Response({'error': 'group must be "category"'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        scope_id = int(pk)
+    except (TypeError, ValueError):
+        raise Http404
+    snapshot = get_menu_snapshot(scope, scope_id, request_language(request))
+    if snapshot is None:
+        raise Http404
+
+    menu = snapshot[shape]
+    client_etags = [etag.removeprefix('W/') for etag in parse_etags(request.headers.get('If-None-Match', ''))]
+    if menu['etag'] in client_etags or '*' in client_etags:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(menu['content'], content_type='application/json')
+    response['ETag'] = menu['etag']
+    return response
+
+
+class RestaurantViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    conditional_resources = ('restaurants',)
     queryset = Restaurant.objects.select_related('country', 'city').all()
     serializer_class = RestaurantSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
@@ -356,18 +529,32 @@ class RestaurantViewSet(viewsets.ModelViewSet):
     filterset_fields = ['status', 'is_special', 'country', 'city']
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve', 'products', 'reviews', 'analytics', 'special', 'nearby']:
+        if self.action in ['list', 'retrieve', 'products', 'reviews', 'analytics', 'special', 'nearby', 'delivers_here']:
             permission_classes = [AllowAny]
         else:
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
+
+    def get_serializer_class(self):
+        # list ใช้ serializer แบบย่อ ขอฟิลด์เพิ่มได้ด้วย ?expand=
+        if self.action == 'list':
+            return RestaurantListSerializer
+        return RestaurantSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ['list', 'retrieve']:
+            return queryset
+
+        # โหลดเฉพาะคอลัมน์/จำนวนสินค้าที่ response ต้องใช้ (?fields= / ?omit=)
+        serializer_class = self.get_serializer_class()
+        if serializer_class is RestaurantListSerializer and 'products_count' in rendered_fields(serializer_class, self.request):
+            queryset = queryset.annotate(products_total=Count('products'))
+        return only_rendered_columns(queryset, serializer_class, self.request)
     
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
     def products(self, request, pk=None):
-        restaurant = self.get_object()
-        products = restaurant.products.filter(is_available=True)
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        return _menu_response(request, SCOPE_RESTAURANT, pk)
     
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
     def reviews(self, request, pk=None):
@@ -403,15 +590,102 @@ class RestaurantViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def nearby(self, request):
-        # This is a placeholder for location-based search
-        # In real implementation, you would use geographic queries
-        queryset = Restaurant.objects.filter(status='open')
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        """
+        Open restaurants near a location, nearest first.
+        Query params: latitude, longitude, radius (in km, default NEARBY_DEFAULT_RADIUS_KM)
+        Without coordinates every open restaurant is returned (legacy behaviour).
+        """
+        if not request.query_params.get('latitude') and not request.query_params.get('longitude'):
+            queryset = Restaurant.objects.filter(status='open')
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
+
+        lat, lng, radius, error_response = _parse_nearby_params(request)
+        if error_response is not None:
+            return error_response
+
+        ranked = restaurant_nearby_index.query(lat, lng, radius)
+        return _distance_ranked_response(
+            self, ranked, Restaurant.objects.select_related('country', 'city')
+        )
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def delivers_here(self, request):
+        """
+        Open restaurants that can deliver to a location, nearest first, each
+        with its delivery distance and quoted fee.
+        Query params: latitude, longitude, order_subtotal (optional)
+
+        Pages are cut from the restaurants within straight-line reach, nearest
+        first, and only the page is quoted; restaurants the road distance
+        puts out of range are left off their page, so pages can be short and
+        count is an upper bound.
+        """
+        lat, lng, error_response = _parse_location_params(request)
+        if error_response is not None:
+            return error_response
+
+        order_subtotal = None
+        order_subtotal_raw = request.query_params.get('order_subtotal')
+        if order_subtotal_raw not in (None, ''):
+            try:
+                order_subtotal = float(order_subtotal_raw)
+            except (TypeError, ValueError):
+                order_subtotal = -1
+            if not math.isfinite(order_subtotal) or order_subtotal < 0:
+                return Response(
+                    {'error': 'order_subtotal must be a number greater than or equal to 0'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        from .utils import DeliveryPricing, quote_deliveries
+
+        pricing = DeliveryPricing()
+        # ระยะทางถนนไม่สั้นกว่าระยะเส้นตรง จึงกรองด้วย grid index ก่อนแล้วค่อยขอระยะทางจริงทีเดียว
+        radius = pricing.max_delivery_distance
+        if radius is None:
+            radius = NEARBY_MAX_RADIUS_KM
+        extra_fields = {}
+
+        def quote_page(rows):
+            candidates = [pk for pk, _ in rows]
+            coordinates = {
+                pk: (latitude, longitude)
+                for pk, latitude, longitude in Restaurant.objects.filter(
+                    restaurant_id__in=candidates,
+                ).values_list('restaurant_id', 'latitude', 'longitude')
+            }
+            candidates = [pk for pk in candidates if pk in coordinates]
+            quotes = quote_deliveries(
+                [coordinates[pk] for pk in candidates],
+                (lat, lng),
+                order_subtotals=[order_subtotal] * len(candidates),
+                pricing=pricing,
+            )
+
+            ranked = []
+            for pk, quote in zip(candidates, quotes):
+                if not quote.within_delivery_range:
+                    continue
+                ranked.append((pk, quote.distance_km))
+                extra_fields[pk] = {
+                    'delivery_fee': round(quote.final_fee, 5),
+                    'is_free_delivery': quote.is_free_delivery,
+                }
+            ranked.sort(key=lambda item: (item[1], item[0]))
+            return ranked
+
+        return _distance_ranked_response(
+            self,
+            restaurant_nearby_index.query(lat, lng, radius),
+            Restaurant.objects.select_related('country', 'city'),
+            extra_fields=extra_fields,
+            rerank=quote_page,
+        )
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def upload_image(self, request, pk=None):
@@ -449,7 +723,8 @@ class RestaurantViewSet(viewsets.ModelViewSet):
         })
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    conditional_resources = ('categories',)
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -466,7 +741,10 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        queryset = Category.objects.prefetch_related('translations__language').order_by('sort_order', 'category_name')
+        queryset = prefetch_translations(
+            Category.objects.order_by('sort_order', 'category_name'),
+            self.request,
+        )
         
         # กรองหมวดหมู่ตามประเภทร้าน
         restaurant_type = self.request.query_params.get('restaurant_type')
@@ -503,13 +781,11 @@ class CategoryViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
     def products(self, request, pk=None):
-        category = self.get_object()
-        products = category.products.filter(is_available=True)
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        return _menu_response(request, SCOPE_CATEGORY, pk)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    conditional_resources = ('products',)
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -523,8 +799,22 @@ class ProductViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
     
+    def get_serializer_class(self):
+        # list ใช้ serializer แบบย่อ ขอฟิลด์เพิ่มได้ด้วย ?expand=
+        if self.action == 'list':
+            return ProductListSerializer
+        return ProductSerializer
+
     def get_queryset(self):
-        queryset = Product.objects.select_related('restaurant', 'category').prefetch_related('translations__language')
+        queryset = Product.objects.select_related('restaurant', 'category')
+        if self.action in ['list', 'retrieve']:
+            # ไม่ prefetch คำแปลถ้า response ไม่มี translations (?fields= / ?omit=)
+            serializer_class = self.get_serializer_class()
+            if 'translations' in rendered_fields(serializer_class, self.request):
+                queryset = prefetch_translations(queryset, self.request)
+            queryset = only_rendered_columns(queryset, serializer_class, self.request)
+        else:
+            queryset = prefetch_translations(queryset, self.request)
         
         # Filter by restaurant
         restaurant_id = self.request.query_params.get('restaurant_id')
@@ -626,21 +916,42 @@ class OrderViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.role == 'customer':
-            return Order.objects.filter(user=user)
+            queryset = Order.objects.filter(user=user)
         elif user.role in ['special_restaurant', 'general_restaurant']:
             try:
                 restaurant = user.restaurant
-                return Order.objects.filter(restaurant=restaurant)
+                queryset = Order.objects.filter(restaurant=restaurant)
             except Restaurant.DoesNotExist:
                 return Order.objects.none()
         else:  # admin
-            return Order.objects.all()
+            queryset = Order.objects.all()
+
+        if self.action in ['list', 'retrieve']:
+            queryset = self._with_rendered_relations(queryset)
+        return queryset
+
+    def _with_rendered_relations(self, queryset):
+        """join/prefetch เฉพาะข้อมูลที่ response ต้องใช้ (?fields= / ?omit= / ?expand=)"""
+        serializer_class = self.get_serializer_class()
+        fields = rendered_fields(serializer_class, self.request)
+        queryset = queryset.select_related('user', 'restaurant')
+        if 'payment' in fields:
+            queryset = queryset.select_related('payment')
+        if fields & {'order_details', 'order_details_by_restaurant'}:
+            queryset = queryset.prefetch_related('order_details__product__restaurant')
+        if fields & {'restaurant_count', 'is_multi_restaurant'}:
+            queryset = queryset.annotate(
+                restaurants_in_order=Count('order_details__product__restaurant', distinct=True),
+            )
+        return only_rendered_columns(queryset, serializer_class, self.request)
     
     def get_serializer_class(self):
         if self.action == 'create':
             return CreateOrderSerializer
         elif self.action == 'multi':
             return MultiRestaurantOrderSerializer
+        elif self.action == 'list':
+            return OrderListSerializer
         return OrderSerializer
     
     def create(self, request, *args, **kwargs):
@@ -1418,6 +1729,81 @@ class UserFavoriteViewSet(viewsets.ModelViewSet):
             return Response({'message': 'Product added to favorites', 'is_favorite': True})
 
 
+SEARCH_RESULTS_LIMIT = 10
+SEARCH_MAX_PAGE_SIZE = 50
+SEARCH_RESULT_CACHE_SECONDS = int(getattr(django_settings, 'SEARCH_RESULT_CACHE_SECONDS', 300))
+SEARCH_SUGGEST_DEFAULT_LIMIT = 8
+SEARCH_SUGGEST_MAX_LIMIT = 20
+
+# (entity type, result key, queryset factory, serializer) ค้นหาผ่าน search index เรียงตามคะแนน
+# (ชื่อ > คำอธิบาย > คำแปล แล้วปรับด้วยเรตติ้งและความนิยม)
+SEARCH_SECTIONS = [
+    ('restaurant', 'restaurants', lambda: Restaurant.objects.all(), RestaurantSerializer),
+    # สินค้าต้องพร้อมขายเท่านั้น
+    ('product', 'products', lambda: Product.objects.filter(is_available=True), ProductSerializer),
+    ('category', 'categories', lambda: Category.objects.all(), CategorySerializer),
+]
+SEARCH_TYPES = ('all', *(entity_type for entity_type, _, _, _ in SEARCH_SECTIONS))
+
+# catalog resources (conditional.CATALOG_DEPENDENCIES) the serialized sections depend on
+SEARCH_RESULT_RESOURCES = ('restaurants', 'products', 'categories')
+
+search_results_flight = SingleFlight('search_results')
+
+
+def _search_results(query, search_type, language, page_size, cursors):
+    results = {
+        'restaurants': [],
+        'products': [],
+        'categories': [],
+        'pagination': {},
+    }
+    for entity_type, key, queryset_factory, serializer_class in SEARCH_SECTIONS:
+        if search_type not in ['all', entity_type]:
+            continue
+        page = search_page(
+            entity_type, query, queryset_factory(), page_size,
+            cursor=cursors.get(entity_type),
+            language=language,
+        )
+        results[key] = list(serializer_class(page.objects, many=True).data)
+        results['pagination'][key] = {
+            'count': page.count,
+            'count_capped': page.count_capped,
+            'next_cursor': page.next_cursor,
+        }
+    return results
+
+
+def _cached_search_results(query, search_type, language, page_size, cursors):
+    """
+    Serialized search results, shared between workers until SEARCH_RESULT_CACHE_SECONDS
+    pass or a version they depend on moves: the search index version (see
+    catalog_version) for what matches, and the restaurants/products/categories
+    catalog versions (see conditional.catalog_versions) for what is serialized,
+    such as status and ratings.
+    """
+    if SEARCH_RESULT_CACHE_SECONDS <= 0:
+        return _search_results(query, search_type, language, page_size, cursors)
+
+    raw_key = "|".join([
+        normalize_search_query(query), search_type, language, str(page_size),
+        *(f"{entity_type}={cursor}" for entity_type, cursor in sorted(cursors.items())),
+    ])
+    versions = ":".join(map(str, [catalog_version(), *catalog_versions(SEARCH_RESULT_RESOURCES)]))
+    cache_key = f"search_results:{versions}:{hashlib.md5(raw_key.encode()).hexdigest()}"
+
+    def fetch():
+        results = _search_results(query, search_type, language, page_size, cursors)
+        cache.set(cache_key, results, SEARCH_RESULT_CACHE_SECONDS)
+        return results
+
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+    return search_results_flight.do(cache_key, fetch, lambda: cache.get(cache_key))
+
+
 class SearchViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
     
@@ -1425,83 +1811,71 @@ class SearchViewSet(viewsets.ViewSet):
     def search(self, request):
         query = request.query_params.get('q', '')
         search_type = request.query_params.get('type', 'all')
+        # จำกัดการค้นหาคำแปลเฉพาะภาษาที่ขอ (ชื่อหลักยังค้นหาเสมอ)
+        language = request.query_params.get('lang') or ''
         
         if not query:
             return Response({'results': []})
         
-        results = {
-            'restaurants': [],
-            'products': [],
-            'categories': []
-        }
-        
-        # Search restaurants
-        if search_type in ['all', 'restaurant']:
-            restaurants = Restaurant.objects.filter(
-                Q(restaurant_name__icontains=query) |
-                Q(description__icontains=query)
-            )[:10]
-            results['restaurants'] = RestaurantSerializer(restaurants, many=True).data
-        
-        # Search products
-        if search_type in ['all', 'product']:
-            # ค้นหาในชื่อสินค้าและคำอธิบายหลัก
-            products = Product.objects.filter(
-                Q(product_name__icontains=query) |
-                Q(description__icontains=query)
-            ).filter(is_available=True)
-            
-            # ค้นหาในข้อมูลการแปลภาษา
-            translated_products = Product.objects.filter(
-                Q(translations__translated_name__icontains=query) |
-                Q(translations__translated_description__icontains=query)
-            ).filter(is_available=True).distinct()
-            
-            # รวมผลลัพธ์และเรียงลำดับ
-            all_products = (products | translated_products).distinct()[:10]
-            results['products'] = ProductSerializer(all_products, many=True).data
-        
-        # Search categories
-        if search_type in ['all', 'category']:
-            # ค้นหาในชื่อหมวดหมู่หลัก
-            categories = Category.objects.filter(
-                category_name__icontains=query
-            )
-            
-            # ค้นหาในข้อมูลการแปลภาษา
-            translated_categories = Category.objects.filter(
-                translations__translated_name__icontains=query
-            ).distinct()
-            
-            # รวมผลลัพธ์
-            all_categories = (categories | translated_categories).distinct()[:10]
-            results['categories'] = CategorySerializer(all_categories, many=True).data
-        
-        # Save search history for authenticated users
-        if request.user.is_authenticated:
-            total_results = (len(results['restaurants']) + 
-                           len(results['products']) + 
-                           len(results['categories']))
-            
-            SearchHistory.objects.create(
-                user=request.user,
-                search_query=query,
-                search_type=search_type if search_type != 'all' else 'restaurant',
-                results_count=total_results
-            )
+        if search_type not in SEARCH_TYPES:
+            return Response({'error': f'type must be one of: {", ".join(SEARCH_TYPES)}'},
+                          status=status.HTTP_400_BAD_REQUEST)
         
-        # Update popular searches
-        popular_search, created = PopularSearch.objects.get_or_create(
-            search_query=query
+        try:
+            page_size = int(request.query_params.get('page_size', SEARCH_RESULTS_LIMIT))
+        except (TypeError, ValueError):
+            page_size = SEARCH_RESULTS_LIMIT
+        page_size = max(1, min(page_size, SEARCH_MAX_PAGE_SIZE))
+        
+        # แต่ละประเภทแบ่งหน้าด้วย cursor ของตัวเอง เช่น ?type=product&product_cursor=...
+        cursors = {}
+        for entity_type, _, _, _ in SEARCH_SECTIONS:
+            cursor = request.query_params.get(f'{entity_type}_cursor')
+            if not cursor:
+                continue
+            try:
+                decode_cursor(cursor)
+            except ValueError:
+                return Response({'error': f'Invalid {entity_type}_cursor'},
+                              status=status.HTTP_400_BAD_REQUEST)
+            cursors[entity_type] = cursor
+        
+        results = _cached_search_results(query, search_type, language, page_size, cursors)
+        
+        # บันทึกประวัติการค้นหาและสถิติคำค้นยอดนิยมแบบ write-behind (ไม่รอเขียนฐานข้อมูล)
+        # ทำทุกครั้งแม้ผลลัพธ์มาจาก cache
+        total_results = (len(results['restaurants']) + 
+                       len(results['products']) + 
+                       len(results['categories']))
+        record_search(
+            request.user,
+            query,
+            search_type if search_type != 'all' else 'restaurant',
+            total_results,
         )
-        if not created:
-            popular_search.search_count += 1
-            popular_search.save()
         
         return Response(results)
     
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """คำแนะนำระหว่างพิมพ์ (typeahead) จาก prefix index ไม่บันทึกประวัติการค้นหา"""
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', SEARCH_SUGGEST_DEFAULT_LIMIT))
+        except (TypeError, ValueError):
+            limit = SEARCH_SUGGEST_DEFAULT_LIMIT
+        limit = max(1, min(limit, SEARCH_SUGGEST_MAX_LIMIT))
+        
+        suggestions = search_suggestions(query, request.query_params.get('lang'), limit)
+        return Response({'query': query, 'suggestions': suggestions})
+    
     @action(detail=False, methods=['get'])
     def popular(self, request):
+        # อ่านจากรายการ trending ที่คำนวณไว้แล้ว (ค่อยๆ ลดน้ำหนักตามเวลา)
+        trending = trending_searches(10)
+        if trending:
+            return Response(trending)
+        # ยังไม่มีข้อมูลในช่วงเวลาล่าสุด ใช้ยอดรวมตลอดกาลแทน
         popular_searches = PopularSearch.objects.order_by('-search_count')[:10]
         serializer = PopularSearchSerializer(popular_searches, many=True)
         return Response(serializer.data)
@@ -1627,7 +2001,13 @@ class PopularSearchViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def trending(self, request):
-        """Get trending searches (most searched in last 24 hours)"""
+        """Get trending searches (time-decayed search counts, precomputed)"""
+        trending = trending_searches(10)
+        if trending:
+            return Response(trending)
+        
+        # Until hourly buckets have data, rank the terms searched in the last day
+        # by their lifetime counts
         yesterday = timezone.now() - timedelta(days=1)
         trending = PopularSearch.objects.filter(
             last_searched__gte=yesterday
@@ -2046,7 +2426,8 @@ class AppSettingsViewSet(viewsets.ModelViewSet):
             return Response({"detail": "An internal server error occurred."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class LanguageViewSet(viewsets.ModelViewSet):
+class LanguageViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    conditional_resources = ('languages',)
     queryset = Language.objects.all()
     serializer_class = LanguageSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -2386,12 +2767,14 @@ class GuestOrderViewSet(viewsets.ModelViewSet):
         )
 
 
-class AdvertisementViewSet(viewsets.ModelViewSet):
+class AdvertisementViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet สำหรับจัดการโฆษณา/แบนเนอร์ (เก็บแค่รูปภาพ)
     - Admin: สามารถจัดการได้ทั้งหมด (CRUD)
     - ผู้ใช้ทั่วไป: ดูได้เฉพาะโฆษณาที่เปิดใช้งาน
     """
+    conditional_resources = ('advertisements',)
+    conditional_per_role = True  # admins also see inactive rows
     queryset = Advertisement.objects.all()
     serializer_class = AdvertisementSerializer
     filter_backends = [filters.OrderingFilter, DjangoFilterBackend]
@@ -2425,6 +2808,9 @@ class AdvertisementViewSet(viewsets.ModelViewSet):
         """
         ดึงเฉพาะโฆษณาที่เปิดใช้งาน สำหรับแสดงบนหน้าเว็บ
         """
+        return self.conditional_response(request, self._active)
+
+    def _active(self, request):
         advertisements = Advertisement.objects.filter(
             is_active=True
         ).order_by('sort_order', '-created_at')
@@ -2433,6 +2819,13 @@ class AdvertisementViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+def _to_int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 # API endpoint สำหรับคำนวณค่าจัดส่งตามระยะทาง
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -2482,67 +2875,30 @@ def calculate_delivery_fee_api(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        from .utils import calculate_delivery_fee_by_distance
-        fee = calculate_delivery_fee_by_distance(
+        from .utils import quote_delivery
+        quote = quote_delivery(
             restaurant.latitude, restaurant.longitude,
-            delivery_lat, delivery_lon
+            delivery_lat, delivery_lon,
+            order_subtotal=order_subtotal,
         )
 
-        # คำนวณระยะทางด้วย
-        from .utils import calculate_distance_km
-        distance = calculate_distance_km(
-            restaurant.latitude, restaurant.longitude,
-            delivery_lat, delivery_lon
-        )
-
-        settings = AppSettings.get_settings()
-        max_delivery_distance = (
-            float(settings.max_delivery_distance)
-            if settings and settings.max_delivery_distance is not None
-            else None
-        )
-        free_delivery_minimum = (
-            float(settings.free_delivery_minimum)
-            if settings and settings.free_delivery_minimum is not None
-            else None
-        )
-        is_free_delivery = (
-            order_subtotal is not None
-            and free_delivery_minimum is not None
-            and free_delivery_minimum > 0
-            and order_subtotal >= free_delivery_minimum
-        )
-
-        if max_delivery_distance is not None and distance > max_delivery_distance:
+        if not quote.within_delivery_range:
+            max_delivery_distance = quote.pricing.max_delivery_distance
             return Response(
                 {
-                    'delivery_fee': 0.0,
+                    **quote.as_dict(),
                     'error': (
                         f'Delivery location is out of range. '
                         f'Maximum distance is {max_delivery_distance:.2f} km.'
                     ),
                     'error_code': 'out_of_delivery_range',
-                    'within_delivery_range': False,
-                    'distance_km': round(distance, 2),
-                    'max_delivery_distance_km': round(max_delivery_distance, 2),
-                    'free_delivery_minimum_amount': round(free_delivery_minimum, 2) if free_delivery_minimum is not None else None,
-                    'order_subtotal': round(order_subtotal, 2) if order_subtotal is not None else None,
                     'restaurant_id': restaurant.restaurant_id,
                     'restaurant_name': restaurant.restaurant_name,
                 },
                 status=status.HTTP_200_OK
             )
 
-        final_fee = 0.0 if is_free_delivery else float(fee)
-        return Response({
-            'delivery_fee': round(final_fee, 5),
-            'distance_km': round(distance, 2),
-            'max_delivery_distance_km': round(max_delivery_distance, 2) if max_delivery_distance is not None else None,
-            'free_delivery_minimum_amount': round(free_delivery_minimum, 2) if free_delivery_minimum is not None else None,
-            'order_subtotal': round(order_subtotal, 2) if order_subtotal is not None else None,
-            'is_free_delivery': is_free_delivery,
-            'within_delivery_range': True
-        })
+        return Response(quote.as_dict())
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -2593,50 +2949,44 @@ def calculate_multi_restaurant_delivery_fee_api(request):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        from .utils import calculate_delivery_fee_by_distance, calculate_distance_km
-        from .models import AppSettings
+        from .utils import DeliveryPricing, quote_deliveries
         
-        # ดึงการตั้งค่าค่าจัดส่งสำหรับ multi-restaurant
-        settings = AppSettings.get_settings()
+        # ดึงการตั้งค่าค่าจัดส่งสำหรับ multi-restaurant (อ่าน settings ครั้งเดียว)
+        pricing = DeliveryPricing()
         # ไม่ใช้ base_fee_override เพื่อป้องกันการ override ค่าจัดส่งจริง
-        # base_fee_override = float(settings.multi_restaurant_base_fee) if settings and settings.multi_restaurant_base_fee else None
-        additional_fee_per_restaurant = float(settings.multi_restaurant_additional_fee) if settings and settings.multi_restaurant_additional_fee else 15.00
-        max_delivery_distance = (
-            float(settings.max_delivery_distance)
-            if settings and settings.max_delivery_distance is not None
-            else None
-        )
-        free_delivery_minimum = (
-            float(settings.free_delivery_minimum)
-            if settings and settings.free_delivery_minimum is not None
-            else None
-        )
+        additional_fee_per_restaurant = pricing.additional_fee_per_restaurant
+        max_delivery_distance = pricing.max_delivery_distance
+        free_delivery_minimum = pricing.free_delivery_minimum
         
         max_fee = 0.0
         max_distance = 0.0
         base_restaurant_id = None
         restaurant_details = []
         out_of_range_restaurants = []
-        
-        # หาร้านที่ไกลที่สุด (จะเป็นร้านหลัก)
+
+        # โหลดร้านทั้งหมดในครั้งเดียว แล้วขอระยะทางทุกร้านด้วย request เดียว
+        restaurants_by_id = Restaurant.objects.in_bulk(
+            [rid for rid in (_to_int_or_none(value) for value in restaurant_ids) if rid is not None]
+        )
+        restaurants = []
         for restaurant_id in restaurant_ids:
-            try:
-                restaurant = Restaurant.objects.get(restaurant_id=restaurant_id)
-            except Restaurant.DoesNotExist:
+            restaurant = restaurants_by_id.get(_to_int_or_none(restaurant_id))
+            if restaurant is None:
                 continue
-            
             if not restaurant.latitude or not restaurant.longitude:
                 continue
-            
-            distance = calculate_distance_km(
-                restaurant.latitude, restaurant.longitude,
-                delivery_lat, delivery_lon
-            )
-            
-            fee = calculate_delivery_fee_by_distance(
-                restaurant.latitude, restaurant.longitude,
-                delivery_lat, delivery_lon
-            )
+            restaurants.append(restaurant)
+
+        quotes = quote_deliveries(
+            [(restaurant.latitude, restaurant.longitude) for restaurant in restaurants],
+            (delivery_lat, delivery_lon),
+            pricing=pricing,
+        )
+        
+        # หาร้านที่ไกลที่สุด (จะเป็นร้านหลัก)
+        for restaurant, quote in zip(restaurants, quotes):
+            distance = quote.distance_km
+            fee = quote.fee
             
             restaurant_details.append({
                 'restaurant_id': restaurant.restaurant_id,
@@ -2645,7 +2995,7 @@ def calculate_multi_restaurant_delivery_fee_api(request):
                 'individual_delivery_fee': round(float(fee), 2)
             })
 
-            if max_delivery_distance is not None and distance > max_delivery_distance:
+            if not quote.within_delivery_range:
                 out_of_range_restaurants.append({
                     'restaurant_id': restaurant.restaurant_id,
                     'restaurant_name': restaurant.restaurant_name,
@@ -2693,12 +3043,7 @@ def calculate_multi_restaurant_delivery_fee_api(request):
         additional_fee = additional_restaurants_count * additional_fee_per_restaurant
         total_delivery_fee = base_fee + additional_fee
         original_total_delivery_fee = float(total_delivery_fee)
-        is_free_delivery = (
-            order_subtotal is not None
-            and free_delivery_minimum is not None
-            and free_delivery_minimum > 0
-            and order_subtotal >= free_delivery_minimum
-        )
+        is_free_delivery = pricing.is_free_delivery(order_subtotal)
         if is_free_delivery:
             total_delivery_fee = 0.0
         
@@ -2763,6 +3108,112 @@ def calculate_multi_restaurant_delivery_fee_api(request):
         )
 
 
+BULK_DELIVERY_QUOTE_MAX_ITEMS = 100
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def calculate_bulk_delivery_fee_api(request):
+    """
+    คำนวณค่าจัดส่งหลายร้านพร้อมกันไปยังจุดส่งเดียว (แต่ละรายการคิดแยกกัน ไม่ใช่ multi-restaurant order)
+    รับ items: [{restaurant_id, order_subtotal}] และ delivery coordinates
+    """
+    items = request.data.get('items')
+    delivery_lat = request.data.get('delivery_latitude')
+    delivery_lon = request.data.get('delivery_longitude')
+
+    if not items or delivery_lat in (None, '') or delivery_lon in (None, ''):
+        return Response(
+            {'error': 'Missing required fields: items (array), delivery_latitude, delivery_longitude'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return Response(
+            {'error': 'items must be an array of {restaurant_id, order_subtotal} objects'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if len(items) > BULK_DELIVERY_QUOTE_MAX_ITEMS:
+        return Response(
+            {'error': f'At most {BULK_DELIVERY_QUOTE_MAX_ITEMS} items can be quoted per request'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        delivery_lat = float(delivery_lat)
+        delivery_lon = float(delivery_lon)
+    except (TypeError, ValueError):
+        return Response(
+            {'error': 'delivery_latitude/delivery_longitude must be valid numbers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if (not math.isfinite(delivery_lat) or not math.isfinite(delivery_lon)
+            or not (-90 <= delivery_lat <= 90) or not (-180 <= delivery_lon <= 180)):
+        return Response(
+            {'error': 'delivery_latitude/delivery_longitude are out of valid range'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    from .utils import DeliveryPricing, quote_deliveries
+
+    # อ่าน settings ครั้งเดียว, โหลดร้านด้วย in_bulk ครั้งเดียว, ขอระยะทางแบบ batch
+    pricing = DeliveryPricing()
+    restaurants_by_id = Restaurant.objects.in_bulk(
+        {rid for rid in (_to_int_or_none(item.get('restaurant_id')) for item in items) if rid is not None}
+    )
+
+    results = [None] * len(items)
+    quotable = []
+    for position, item in enumerate(items):
+        restaurant_id = _to_int_or_none(item.get('restaurant_id'))
+        result = {'restaurant_id': restaurant_id if restaurant_id is not None else item.get('restaurant_id')}
+        results[position] = result
+
+        order_subtotal = None
+        order_subtotal_raw = item.get('order_subtotal')
+        if order_subtotal_raw not in (None, ''):
+            try:
+                order_subtotal = float(order_subtotal_raw)
+            except (TypeError, ValueError):
+                order_subtotal = -1
+            if not math.isfinite(order_subtotal) or order_subtotal < 0:
+                result.update({
+                    'error': 'order_subtotal must be a number greater than or equal to 0',
+                    'error_code': 'invalid_order_subtotal',
+                })
+                continue
+
+        restaurant = restaurants_by_id.get(restaurant_id)
+        if restaurant is None:
+            result.update({'error': 'Restaurant not found', 'error_code': 'restaurant_not_found'})
+            continue
+        result['restaurant_name'] = restaurant.restaurant_name
+        if not restaurant.latitude or not restaurant.longitude:
+            result.update({'error': 'Restaurant location not set', 'error_code': 'restaurant_location_missing'})
+            continue
+        quotable.append((position, restaurant, order_subtotal))
+
+    quotes = quote_deliveries(
+        [(restaurant.latitude, restaurant.longitude) for _, restaurant, _ in quotable],
+        (delivery_lat, delivery_lon),
+        order_subtotals=[order_subtotal for _, _, order_subtotal in quotable],
+        pricing=pricing,
+    )
+    for (position, _, _), quote in zip(quotable, quotes):
+        results[position].update(quote.as_dict())
+        if not quote.within_delivery_range:
+            results[position]['error_code'] = 'out_of_delivery_range'
+
+    max_distance = pricing.max_delivery_distance
+    free_minimum = pricing.free_delivery_minimum
+    return Response({
+        'max_delivery_distance_km': round(max_distance, 2) if max_distance is not None else None,
+        'free_delivery_minimum_amount': round(free_minimum, 2) if free_minimum is not None else None,
+        'quotes': results,
+    })
+
+
 # ===== Dine-In QR Code System Views =====
 
 class DineInProductViewSet(viewsets.ModelViewSet):
@@ -2781,21 +3232,24 @@ class DineInProductViewSet(viewsets.ModelViewSet):
     ordering = ['sort_order', 'product_name']
     
     def get_queryset(self):
+        return prefetch_translations(self._base_queryset(), self.request)
+    
+    def _base_queryset(self):
         """ร้านอาหารเห็นเฉพาะสินค้าของตัวเอง"""
         user = self.request.user
         
         # ถ้าเป็น public request (AllowAny) ให้ดูได้ทั้งหมดที่ available
         if not user.is_authenticated:
-            return DineInProduct.objects.filter(is_available=True).prefetch_related('translations__language')
+            return DineInProduct.objects.filter(is_available=True)
         
         if user.role == 'admin':
-            return DineInProduct.objects.all().prefetch_related('translations__language')
+            return DineInProduct.objects.all()
         elif user.role in ['special_restaurant', 'general_restaurant']:
             if hasattr(user, 'restaurant'):
-                return DineInProduct.objects.filter(restaurant=user.restaurant).prefetch_related('translations__language')
+                return DineInProduct.objects.filter(restaurant=user.restaurant)
         
         # สำหรับลูกค้า - ดูเฉพาะที่ available
-        return DineInProduct.objects.filter(is_available=True).prefetch_related('translations__language')
+        return DineInProduct.objects.filter(is_available=True)
     
     def perform_create(self, serializer):
         """สร้างสินค้า - ต้องเป็นของร้านตัวเอง"""
@@ -3939,10 +4393,11 @@ class DineInOrderDetailViewSet(viewsets.ModelViewSet):
 
 # ===== Entertainment Venues ViewSets =====
 
-class VenueCategoryViewSet(viewsets.ModelViewSet):
+class VenueCategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing venue categories
     """
+    conditional_resources = ('venue_categories',)
     queryset = VenueCategory.objects.all()
     serializer_class = VenueCategorySerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
@@ -3977,8 +4432,10 @@ class VenueCategoryViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class CountryViewSet(viewsets.ModelViewSet):
+class CountryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ตารางอ้างอิงประเทศ — แก้ไขได้เฉพาะแอดมิน"""
+    conditional_resources = ('countries',)
+    conditional_per_role = True  # admins also see inactive rows
     queryset = Country.objects.all().order_by('sort_order', 'name')
     serializer_class = CountrySerializer
     pagination_class = None
@@ -4048,8 +4505,10 @@ class CountryViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class CityViewSet(viewsets.ModelViewSet):
+class CityViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ตารางอ้างอิงเมือง — แก้ไขได้เฉพาะแอดมิน"""
+    conditional_resources = ('cities',)
+    conditional_per_role = True  # admins also see cities of inactive countries
     queryset = City.objects.select_related('country').all().order_by('country', 'name')
     serializer_class = CitySerializer
     pagination_class = None
@@ -4112,6 +4571,9 @@ class EntertainmentVenueViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
     
+    def get_queryset(self):
+        return prefetch_translations(super().get_queryset(), self.request)
+    
     def get_serializer_class(self):
         """Use lightweight serializer for list view"""
         if self.action == 'list':
@@ -4147,45 +4609,26 @@ class EntertainmentVenueViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def nearby(self, request):
         """
-        Get venues near a location
+        Get open venues within radius of a location, nearest first
         Query params: latitude, longitude, radius (in km, default 10)
         """
-        latitude = request.query_params.get('latitude')
-        longitude = request.query_params.get('longitude')
-        radius = float(request.query_params.get('radius', 10))  # Default 10km
-        
-        if not latitude or not longitude:
-            return Response({'error': 'latitude and longitude are required'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        try:
-            lat = float(latitude)
-            lng = float(longitude)
-        except ValueError:
-            return Response({'error': 'Invalid latitude or longitude'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Simple distance calculation (Haversine formula would be better for production)
-        # For now, just return all open venues
-        queryset = EntertainmentVenue.objects.filter(status='open')
-        
-        # TODO: Implement proper distance calculation using geopy or PostGIS
-        # For now, filter by approximate bounding box
-        # Rough approximation: 1 degree ≈ 111 km
-        lat_range = radius / 111.0
-        lng_range = radius / (111.0 * abs(math.cos(math.radians(lat))))
-        
-        queryset = queryset.filter(
-            latitude__gte=lat - lat_range,
-            latitude__lte=lat + lat_range,
-            longitude__gte=lng - lng_range,
-            longitude__lte=lng + lng_range
-        )
-        
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        lat, lng, radius, error_response = _parse_nearby_params(request)
+        if error_response is not None:
+            return error_response
+
+        # Bounding-box prefilter runs on the (latitude, longitude) index,
+        # then an exact haversine pass trims the corners and orders by distance.
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius)
+        candidates = EntertainmentVenue.objects.filter(
+            status='open',
+            latitude__gte=min_lat,
+            latitude__lte=max_lat,
+            longitude__gte=min_lng,
+            longitude__lte=max_lng,
+        ).values_list('venue_id', 'latitude', 'longitude')
+
+        ranked = rank_within_radius(lat, lng, candidates, radius)
+        return _distance_ranked_response(self, ranked, self.get_queryset())
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def upload_image(self, request, pk=None):
@@ -18,6 +18,10 @@ pip install -r requirements.txt
 echo "🗄️ Running database migrations..."
 python manage.py migrate
 
+# 3.1 เติม search index (migration สร้างแค่ตาราง ถ้าไม่ rebuild /api/search/ จะไม่เจออะไรเลย)
+echo "🔎 Rebuilding search index..."
+python manage.py rebuild_search_index
+
 # 4. Collect static files
 echo "📁 Collecting static files..."
 python manage.py collectstatic --noinput
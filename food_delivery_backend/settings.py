@@ -145,6 +145,22 @@ else:
         },
     }
 
+# Cache (per-process memory for development, Redis shared by all workers in production)
+if DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_CACHE_URL', 'redis://127.0.0.1:6379/1'),
+            'KEY_PREFIX': 'food_delivery',
+        },
+    }
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -273,8 +289,26 @@ BASE_URL = os.environ.get('BASE_URL')
 # Routing distance provider (used for real road distance delivery fee calculation)
 ROUTING_OSRM_BASE_URL = os.environ.get('ROUTING_OSRM_BASE_URL', 'https://router.project-osrm.org')
 ROUTING_OSRM_TIMEOUT_SECONDS = int(os.environ.get('ROUTING_OSRM_TIMEOUT_SECONDS', 8))
-ROUTING_DISTANCE_CACHE_TTL_SECONDS = int(os.environ.get('ROUTING_DISTANCE_CACHE_TTL_SECONDS', 1800))
 ROUTING_COORD_PRECISION = int(os.environ.get('ROUTING_COORD_PRECISION', 5))
+ROUTING_OSRM_TABLE_MAX_SOURCES = int(os.environ.get('ROUTING_OSRM_TABLE_MAX_SOURCES', 99))
+# Route distances are cached in-process (LRU), in the shared cache and in the
+# route_distances table. Coordinates are snapped to ROUTING_COORD_PRECISION.
+ROUTING_DISTANCE_CACHE_TTL_SECONDS = int(os.environ.get('ROUTING_DISTANCE_CACHE_TTL_SECONDS', 604800))
+ROUTING_DISTANCE_LRU_SIZE = int(os.environ.get('ROUTING_DISTANCE_LRU_SIZE', 10000))
+ROUTING_DISTANCE_DB_TTL_DAYS = int(os.environ.get('ROUTING_DISTANCE_DB_TTL_DAYS', 180))
+# Displayed fee quotes wait at most this long for the routing provider before
+# using the offline estimate (haversine x detour factor learned from cached
+# routes); 0 waits for the full provider timeout. Fees stored on orders
+# always wait for the provider.
+ROUTING_RACE_BUDGET_MS = int(os.environ.get('ROUTING_RACE_BUDGET_MS', 500))
+ROUTING_RACE_MAX_WORKERS = int(os.environ.get('ROUTING_RACE_MAX_WORKERS', 8))
+# Raced provider requests allowed to wait for a worker; beyond that the
+# estimate is used without asking the provider.
+ROUTING_RACE_MAX_QUEUED = int(os.environ.get('ROUTING_RACE_MAX_QUEUED', 8))
+ROUTING_ESTIMATE_CELL_DEGREES = float(os.environ.get('ROUTING_ESTIMATE_CELL_DEGREES', 0.1))
+ROUTING_ESTIMATE_MIN_SAMPLES = int(os.environ.get('ROUTING_ESTIMATE_MIN_SAMPLES', 5))
+ROUTING_ESTIMATE_MAX_AGE_SECONDS = int(os.environ.get('ROUTING_ESTIMATE_MAX_AGE_SECONDS', 3600))
+ROUTING_DEFAULT_DETOUR_FACTOR = float(os.environ.get('ROUTING_DEFAULT_DETOUR_FACTOR', 1.3))
 
 # Nominatim geocoding proxy tuning
 NOMINATIM_BASE_URL = os.environ.get('NOMINATIM_BASE_URL', 'https://nominatim.openstreetmap.org')
@@ -285,11 +319,63 @@ NOMINATIM_USER_AGENT = os.environ.get(
     'FoodDeliveryAseanMall/1.0 (local geocoding proxy)'
 )
 NOMINATIM_MIN_INTERVAL_SECONDS = float(os.environ.get('NOMINATIM_MIN_INTERVAL_SECONDS', 1.1))
+# Longest a request may queue for a cluster-wide Nominatim slot before it is
+# answered as rate limited.
+NOMINATIM_MAX_QUEUE_WAIT_SECONDS = float(os.environ.get('NOMINATIM_MAX_QUEUE_WAIT_SECONDS', 5.0))
 NOMINATIM_RETRY_BACKOFF_SECONDS = float(os.environ.get('NOMINATIM_RETRY_BACKOFF_SECONDS', 2.0))
 NOMINATIM_RETRY_ATTEMPTS = int(os.environ.get('NOMINATIM_RETRY_ATTEMPTS', 1))
 NOMINATIM_REVERSE_CACHE_PRECISION = int(os.environ.get('NOMINATIM_REVERSE_CACHE_PRECISION', 4))
 NOMINATIM_RATE_LIMIT_COOLDOWN_SECONDS = int(os.environ.get('NOMINATIM_RATE_LIMIT_COOLDOWN_SECONDS', 30))
 
+# Local geocoding: reverse lookups within this distance of a stored restaurant
+# or venue, and name-prefix search over stored places, skip Nominatim
+LOCAL_GEOCODE_ENABLED = os.environ.get('LOCAL_GEOCODE_ENABLED', 'True').lower() == 'true'
+LOCAL_GEOCODE_SNAP_RADIUS_METERS = float(os.environ.get('LOCAL_GEOCODE_SNAP_RADIUS_METERS', 50))
+LOCAL_GEOCODE_INDEX_MAX_AGE_SECONDS = int(os.environ.get('LOCAL_GEOCODE_INDEX_MAX_AGE_SECONDS', 600))
+# Shortest geocode search query matched against local place names
+LOCAL_GEOCODE_SEARCH_MIN_CHARS = int(os.environ.get('LOCAL_GEOCODE_SEARCH_MIN_CHARS', 2))
+
+# Outbound HTTP to routing/geocoding providers (pooled connections + circuit breaker)
+OUTBOUND_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('OUTBOUND_CONNECT_TIMEOUT_SECONDS', 3))
+OUTBOUND_POOL_MAXSIZE = int(os.environ.get('OUTBOUND_POOL_MAXSIZE', 10))
+OUTBOUND_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('OUTBOUND_BREAKER_FAILURE_THRESHOLD', 5))
+OUTBOUND_BREAKER_RESET_SECONDS = float(os.environ.get('OUTBOUND_BREAKER_RESET_SECONDS', 30))
+
+# Concurrent cache misses on one geocode/route key share a single upstream
+# call; followers in other processes wait at most this long before fetching
+# themselves.
+SINGLEFLIGHT_WAIT_SECONDS = float(os.environ.get('SINGLEFLIGHT_WAIT_SECONDS', 15))
+
+# Nearby listings (in-memory grid index over restaurant coordinates)
+NEARBY_GRID_CELL_DEGREES = float(os.environ.get('NEARBY_GRID_CELL_DEGREES', 0.05))
+NEARBY_DEFAULT_RADIUS_KM = float(os.environ.get('NEARBY_DEFAULT_RADIUS_KM', 10))
+NEARBY_MAX_RADIUS_KM = float(os.environ.get('NEARBY_MAX_RADIUS_KM', 50))
+NEARBY_INDEX_MAX_AGE_SECONDS = int(os.environ.get('NEARBY_INDEX_MAX_AGE_SECONDS', 300))
+
+# Catalog search backend: 'database' (search_index_entries table) or 'memory'
+# (per-worker copy of the index, kept in sync through the shared cache)
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'database')
+SEARCH_MEMORY_INDEX_MAX_AGE_SECONDS = int(os.environ.get('SEARCH_MEMORY_INDEX_MAX_AGE_SECONDS', 3600))
+# Search history / popular search counters are buffered per worker and written
+# in batches every SEARCH_LOG_FLUSH_SECONDS or once SEARCH_LOG_FLUSH_SIZE
+# searches are waiting
+SEARCH_LOG_WRITE_BEHIND = os.environ.get('SEARCH_LOG_WRITE_BEHIND', 'True').lower() == 'true'
+SEARCH_LOG_FLUSH_SECONDS = float(os.environ.get('SEARCH_LOG_FLUSH_SECONDS', 5))
+SEARCH_LOG_FLUSH_SIZE = int(os.environ.get('SEARCH_LOG_FLUSH_SIZE', 500))
+# Serialized search/ responses are cached per query until the catalog changes
+SEARCH_RESULT_CACHE_SECONDS = int(os.environ.get('SEARCH_RESULT_CACHE_SECONDS', 300))
+# Trending searches: hourly buckets, exponential decay, precomputed top list
+SEARCH_TRENDING_HALF_LIFE_HOURS = float(os.environ.get('SEARCH_TRENDING_HALF_LIFE_HOURS', 24))
+SEARCH_TRENDING_WINDOW_HOURS = int(os.environ.get('SEARCH_TRENDING_WINDOW_HOURS', 72))
+SEARCH_TRENDING_REFRESH_SECONDS = int(os.environ.get('SEARCH_TRENDING_REFRESH_SECONDS', 300))
+# Typeahead (search/suggest/): per-worker prefix index plus shared response cache
+SEARCH_SUGGEST_INDEX_MAX_AGE_SECONDS = int(os.environ.get('SEARCH_SUGGEST_INDEX_MAX_AGE_SECONDS', 300))
+SEARCH_SUGGEST_CACHE_SECONDS = int(os.environ.get('SEARCH_SUGGEST_CACHE_SECONDS', 60))
+# Menu snapshots (restaurants/<id>/products/, categories/<id>/products/): pre-rendered
+# per language in the shared cache, rebuilt in the background on catalog edits
+MENU_SNAPSHOT_CACHE_SECONDS = int(os.environ.get('MENU_SNAPSHOT_CACHE_SECONDS', 86400))
+MENU_SNAPSHOT_WORKERS = int(os.environ.get('MENU_SNAPSHOT_WORKERS', 2))
+
 # Google OAuth configuration
 GOOGLE_OAUTH2_CLIENT_ID = os.environ.get('GOOGLE_OAUTH2_CLIENT_ID')
 GOOGLE_OAUTH2_CLIENT_SECRET = os.environ.get('GOOGLE_OAUTH2_CLIENT_SECRET')